@@ -4,11 +4,14 @@ import time
 import traceback
 from functools import wraps
 
+from asgiref.sync import iscoroutinefunction
 from django.http import HttpRequest, JsonResponse
 from django.http.response import HttpResponseRedirectBase, HttpResponse
 from django.template.response import TemplateResponse, SimpleTemplateResponse
 
-from apps.db.service import TokenService, PeerInfoService, LoginClientService
+from apps.db.service import TokenService, LoginClientService
+from common.env import TokenConfig
+from common.rate_limit import login_ip_bucket, login_user_bucket
 from common.utils import get_randem_md5
 
 logger = logging.getLogger('request_debug_log')
@@ -29,20 +32,22 @@ def check_login(func):
             return JsonResponse({'error': 'Invalid token'}, status=401)
         token_service = TokenService(request=request)
         token = token_service.authorization
-        user_info = token_service.user_info
-        body = token_service.request_body
-        uuid = token_service.get_cur_uuid_by_token(token)
-
-        system_info = PeerInfoService()
-        client_info = system_info.get_peer_info_by_uuid(uuid)
-        if not client_info:
-            logger.warning('check_login: no client_info for uuid=%s', uuid)
-        peer_id = client_info.peer_id if client_info else (body.get('id') if isinstance(body, dict) else None)
-        username = user_info.username if hasattr(user_info, 'username') else (user_info or '')
-        if not token_service.check_token(token, timeout=3600):
+        if not token_service.check_token(token, timeout=TokenConfig.IDLE_TIMEOUT):
+            # Chỉ khi token không hợp lệ mới cần tra thiết bị/người dùng để ghi đăng xuất
+            context = token_service.context
+            client_info = context.peer
+            if not client_info:
+                logger.warning('check_login: no client_info for uuid=%s', context.uuid)
+            try:
+                body = context.body
+            except Exception:
+                body = {}
+            peer_id = client_info.peer_id if client_info else (body.get('id') if isinstance(body, dict) else None)
+            user_info = context.user
+            username = user_info.username if hasattr(user_info, 'username') else (context.username or '')
             # Ghi thông tin đăng nhập ở server
             LoginClientService().update_logout_status(
-                uuid=uuid,
+                uuid=context.uuid,
                 username=username,
                 peer_id=peer_id,
             )
@@ -53,194 +58,251 @@ def check_login(func):
     return wrapper
 
 
-def request_debug_log(func):
+def login_allowed(request: HttpRequest, username) -> bool:
     """
-    Decorator ghi log request
+    Giới hạn tần suất đăng nhập: kiểm tra token bucket theo IP trước, sau đó theo tên người dùng
+    (dùng chung giữa các worker qua ``SharedStore``)
 
-    :param func: Hàm được decorator
-    :return: Hàm sau khi bọc
+    :param request: Đối tượng HTTP request
+    :param username: Tên đăng nhập
+    :return: ``False`` nếu vượt giới hạn
     """
+    client_ip = getattr(request, 'client_ip', None) or request.META.get('REMOTE_ADDR')
+    return login_ip_bucket.allow(client_ip) and login_user_bucket.allow(str(username or '').lower())
 
-    @wraps(func)
-    def wrapper(request: HttpRequest, *args, **kwargs):
-        __uuid = get_randem_md5()
-        request_log = {
-            'method': request.method,
-            'path': request.path,
-            'headers': dict(request.headers),
-            'client_ip': getattr(request, 'client_ip', request.META.get('CLIENT_IP') or request.META.get('REMOTE_ADDR'))
-        }
-        token_service = TokenService(request=request)
-        # Ghi tham số query
+
+def _log_request(request: HttpRequest, log_id: str):
+    """
+    Ghi log request (method, path, header, query, body theo Content-Type)
+
+    :param request: Đối tượng HTTP request
+    :param log_id: Mã ghép cặp log request/response
+    """
+    request_log = {
+        'method': request.method,
+        'path': request.path,
+        'headers': dict(request.headers),
+        'client_ip': getattr(request, 'client_ip', request.META.get('CLIENT_IP') or request.META.get('REMOTE_ADDR'))
+    }
+    token_service = TokenService(request=request)
+    # Ghi tham số query
+    try:
+        if token_service.request_query:
+            request_log['request_query'] = token_service.request_query
+    except Exception:
+        pass
+
+    # Ghi request body theo Content-Type
+    try:
+        content_type = getattr(request, 'content_type', None) or request.headers.get('Content-Type')
+    except Exception:
+        content_type = None
+    if content_type:
+        request_log['content_type'] = content_type
+
+    # multipart/form-data: form và file
+    if content_type and 'multipart/form-data' in content_type:
         try:
-            if token_service.request_query:
-                request_log['request_query'] = token_service.request_query
+            # Trường form (có thể nhiều giá trị)
+            form_data = {}
+            for key, values in request.POST.lists():
+                form_data[key] = values if len(values) > 1 else (values[0] if values else None)
+            if form_data:
+                request_log['form'] = form_data
+        except Exception:
+            pass
+        try:
+            # Metadata file, chỉ ghi thông tin cần thiết
+            if request.FILES:
+                files_info = {}
+                for key, files in request.FILES.lists():
+                    meta_list = []
+                    for f in files:
+                        meta_list.append({
+                            'filename': getattr(f, 'name', None),
+                            'size': getattr(f, 'size', None),
+                            'content_type': getattr(f, 'content_type', None),
+                        })
+                    files_info[key] = meta_list
+                request_log['files'] = files_info
+        except Exception:
+            pass
+        # Hạn chế đọc request.body, chỉ ghi độ dài
+        try:
+            content_length = request.META.get('CONTENT_LENGTH')
+            if content_length:
+                request_log['content_length'] = int(content_length)
         except Exception:
             pass
 
-        # Ghi request body theo Content-Type
+    # application/x-www-form-urlencoded: form thường
+    elif content_type and 'application/x-www-form-urlencoded' in content_type:
         try:
-            content_type = getattr(request, 'content_type', None) or request.headers.get('Content-Type')
+            form_data = {}
+            for key, values in request.POST.lists():
+                form_data[key] = values if len(values) > 1 else (values[0] if values else None)
+            if form_data:
+                request_log['form'] = form_data
         except Exception:
-            content_type = None
-        if content_type:
-            request_log['content_type'] = content_type
+            pass
 
-        # multipart/form-data: form và file
-        if content_type and 'multipart/form-data' in content_type:
-            try:
-                # Trường form (có thể nhiều giá trị)
-                form_data = {}
-                for key, values in request.POST.lists():
-                    form_data[key] = values if len(values) > 1 else (values[0] if values else None)
-                if form_data:
-                    request_log['form'] = form_data
-            except Exception:
-                pass
-            try:
-                # Metadata file, chỉ ghi thông tin cần thiết
-                if request.FILES:
-                    files_info = {}
-                    for key, files in request.FILES.lists():
-                        meta_list = []
-                        for f in files:
-                            meta_list.append({
-                                'filename': getattr(f, 'name', None),
-                                'size': getattr(f, 'size', None),
-                                'content_type': getattr(f, 'content_type', None),
-                            })
-                        files_info[key] = meta_list
-                    request_log['files'] = files_info
-            except Exception:
-                pass
-            # Hạn chế đọc request.body, chỉ ghi độ dài
+    # application/json: body JSON
+    elif content_type and 'application/json' in content_type:
+        try:
+            if request.body:
+                encoding = getattr(request, 'encoding', None) or 'utf-8'
+                request_log['request_body'] = json.loads(request.body.decode(encoding))
+                request_log['content_length'] = len(request.body)
+        except Exception:
+            # Fallback sang đoạn text
             try:
-                content_length = request.META.get('CONTENT_LENGTH')
-                if content_length:
-                    request_log['content_length'] = int(content_length)
+                encoding = getattr(request, 'encoding', None) or 'utf-8'
+                request_log['request_text'] = request.body.decode(encoding, errors='ignore')[:2048]
+                request_log['content_length'] = len(request.body)
             except Exception:
                 pass
 
-        # application/x-www-form-urlencoded: form thường
-        elif content_type and 'application/x-www-form-urlencoded' in content_type:
+    # Loại khác hoặc không có Content-Type: ghi đoạn text/độ dài
+    else:
+        try:
+            if request.body:
+                encoding = getattr(request, 'encoding', None) or 'utf-8'
+                snippet = request.body.decode(encoding, errors='ignore')
+                request_log['request_text_snippet'] = snippet[:1024]
+                request_log['content_length'] = len(request.body)
+        except Exception:
+            pass
+
+    logger.debug(f'[{log_id}]request: {json.dumps(request_log, ensure_ascii=False, default=str)}')
+
+
+def _log_response(response, log_id: str, start: float):
+    """
+    Ghi log response (mã trạng thái, Content-Type, nội dung theo loại response)
+
+    :param response: Đối tượng HTTP response (None được coi là 200)
+    :param log_id: Mã ghép cặp log request/response
+    :param start: Thời điểm bắt đầu xử lý (time.time())
+    :return: Response đã chuẩn hóa
+    """
+    if response is None:
+        response = HttpResponse(status=200)
+    response_data = {
+        'status_code': response.status_code,
+    }
+    # Thông tin Content-Type
+    try:
+        content_type = response.headers.get('Content-Type') if hasattr(response, 'headers') else response.get(
+            'Content-Type')
+    except Exception:
+        content_type = None
+    if content_type:
+        response_data['content_type'] = content_type
+
+    # Response template: ghi tên template và context
+    if isinstance(response, (TemplateResponse, SimpleTemplateResponse)):
+        template_name = getattr(response, 'template_name', None)
+        response_data['template'] = template_name if isinstance(template_name, (str, list, tuple)) else str(
+            template_name)
+        response_data['template_context'] = getattr(response, 'context_data', None)
+
+    # Response redirect: ghi URL
+    elif isinstance(response, HttpResponseRedirectBase):
+        redirect_url = None
+        if hasattr(response, 'headers'):
+            redirect_url = response.headers.get('Location')
+        if not redirect_url:
+            redirect_url = getattr(response, 'url', None)
+        response_data['redirect_url'] = redirect_url
+
+    # Response streaming (kể cả file): không đọc nội dung, tránh tiêu hao iterator
+    elif getattr(response, 'streaming', False):
+        response_data['streaming'] = True
+        if hasattr(response, 'headers'):
+            # Response streaming dạng sinh dần (vd. /api/ab/peers) không có Content-Length
+            content_length = response.headers.get('Content-Length')
+            if content_length:
+                response_data['content_length'] = int(content_length)
+            disposition = response.headers.get('Content-Disposition')
+            if disposition:
+                response_data['content_disposition'] = disposition
+
+    # Response đã nén (snapshot gzip): không giải mã nội dung
+    elif response.has_header('Content-Encoding'):
+        response_data['content_encoding'] = response['Content-Encoding']
+        response_data['content_length'] = len(response.content)
+
+    # Response JSON
+    elif (content_type and 'application/json' in content_type) or isinstance(response, JsonResponse):
+        try:
+            if response.content:
+                charset = getattr(response, 'charset', 'utf-8') or 'utf-8'
+                response_data['response_body'] = json.loads(response.content.decode(charset))
+        except Exception:
+            # Fallback ghi đoạn text, tránh lỗi log
             try:
-                form_data = {}
-                for key, values in request.POST.lists():
-                    form_data[key] = values if len(values) > 1 else (values[0] if values else None)
-                if form_data:
-                    request_log['form'] = form_data
+                charset = getattr(response, 'charset', 'utf-8') or 'utf-8'
+                response_data['response_text'] = response.content.decode(charset, errors='ignore')[:2048]
             except Exception:
                 pass
 
-        # application/json: body JSON
-        elif content_type and 'application/json' in content_type:
-            try:
-                if request.body:
-                    encoding = getattr(request, 'encoding', None) or 'utf-8'
-                    request_log['request_body'] = json.loads(request.body.decode(encoding))
-                    request_log['content_length'] = len(request.body)
-            except Exception:
-                # Fallback sang đoạn text
-                try:
-                    encoding = getattr(request, 'encoding', None) or 'utf-8'
-                    request_log['request_text'] = request.body.decode(encoding, errors='ignore')[:2048]
-                    request_log['content_length'] = len(request.body)
-                except Exception:
-                    pass
-
-        # Loại khác hoặc không có Content-Type: ghi đoạn text/độ dài
-        else:
+    # Loại khác: template HTML hoặc đoạn text (giới hạn độ dài)
+    else:
+        try:
+            # Với response HTML template, chỉ ghi tên template và context
+            if content_type and 'text/html' in content_type:
+                template_name = getattr(response, 'template_name', None)
+                context_data = getattr(response, 'context_data', None)
+                response_data['template'] = template_name if isinstance(template_name, (str, list, tuple)) else (
+                    str(template_name) if template_name is not None else None)
+                response_data['template_context'] = context_data
+            # Loại khác, ghi đoạn text
+            elif response.content:
+                charset = getattr(response, 'charset', 'utf-8') or 'utf-8'
+                snippet = response.content.decode(charset, errors='ignore')
+                response_data['response_text_snippet'] = snippet[:1024]
+        except Exception:
+            pass
+
+    response_log = json.dumps(response_data, ensure_ascii=False, default=str)
+    logger.debug(f'[{log_id}]response: {response_log}, use_time: {round(time.time() - start, 4)} s')
+    return response
+
+
+def request_debug_log(func):
+    """
+    Decorator ghi log request, hỗ trợ cả view đồng bộ và view async
+
+    :param func: Hàm được decorator
+    :return: Hàm sau khi bọc
+    """
+
+    if iscoroutinefunction(func):
+        @wraps(func)
+        async def async_wrapper(request: HttpRequest, *args, **kwargs):
+            __uuid = get_randem_md5()
+            _log_request(request, __uuid)
+            start = time.time()
             try:
-                if request.body:
-                    encoding = getattr(request, 'encoding', None) or 'utf-8'
-                    snippet = request.body.decode(encoding, errors='ignore')
-                    request_log['request_text_snippet'] = snippet[:1024]
-                    request_log['content_length'] = len(request.body)
+                response = await func(request, *args, **kwargs)
             except Exception:
-                pass
+                logger.error(f'[{__uuid}]error: {traceback.format_exc()}')
+                raise
+            return _log_response(response, __uuid, start)
 
-        logger.debug(f'[{__uuid}]request: {json.dumps(request_log, ensure_ascii=False, default=str)}')
+        return async_wrapper
 
+    @wraps(func)
+    def wrapper(request: HttpRequest, *args, **kwargs):
+        __uuid = get_randem_md5()
+        _log_request(request, __uuid)
         start = time.time()
         try:
             response = func(request, *args, **kwargs)
         except Exception:
             logger.error(f'[{__uuid}]error: {traceback.format_exc()}')
             raise
-        if response is None:
-            response = HttpResponse(status=200)
-        response_data = {
-            'status_code': response.status_code,
-        }
-        # Thông tin Content-Type
-        try:
-            content_type = response.headers.get('Content-Type') if hasattr(response, 'headers') else response.get(
-                'Content-Type')
-        except Exception:
-            content_type = None
-        if content_type:
-            response_data['content_type'] = content_type
-
-        # Response template: ghi tên template và context
-        if isinstance(response, (TemplateResponse, SimpleTemplateResponse)):
-            template_name = getattr(response, 'template_name', None)
-            response_data['template'] = template_name if isinstance(template_name, (str, list, tuple)) else str(
-                template_name)
-            response_data['template_context'] = getattr(response, 'context_data', None)
-
-        # Response redirect: ghi URL
-        elif isinstance(response, HttpResponseRedirectBase):
-            redirect_url = None
-            if hasattr(response, 'headers'):
-                redirect_url = response.headers.get('Location')
-            if not redirect_url:
-                redirect_url = getattr(response, 'url', None)
-            response_data['redirect_url'] = redirect_url
-
-        # Response streaming (kể cả file): không đọc nội dung, tránh tiêu hao iterator
-        elif getattr(response, 'streaming', False):
-            response_data['streaming'] = True
-            if hasattr(response, 'headers'):
-                response_data['content_length'] = int(response.headers.get('Content-Length'))
-                disposition = response.headers.get('Content-Disposition')
-                if disposition:
-                    response_data['content_disposition'] = disposition
-
-        # Response JSON
-        elif (content_type and 'application/json' in content_type) or isinstance(response, JsonResponse):
-            try:
-                if response.content:
-                    charset = getattr(response, 'charset', 'utf-8') or 'utf-8'
-                    response_data['response_body'] = json.loads(response.content.decode(charset))
-            except Exception:
-                # Fallback ghi đoạn text, tránh lỗi log
-                try:
-                    charset = getattr(response, 'charset', 'utf-8') or 'utf-8'
-                    response_data['response_text'] = response.content.decode(charset, errors='ignore')[:2048]
-                except Exception:
-                    pass
-
-        # Loại khác: template HTML hoặc đoạn text (giới hạn độ dài)
-        else:
-            try:
-                # Với response HTML template, chỉ ghi tên template và context
-                if content_type and 'text/html' in content_type:
-                    template_name = getattr(response, 'template_name', None)
-                    context_data = getattr(response, 'context_data', None)
-                    response_data['template'] = template_name if isinstance(template_name, (str, list, tuple)) else (
-                        str(template_name) if template_name is not None else None)
-                    response_data['template_context'] = context_data
-                # Loại khác, ghi đoạn text
-                elif response.content:
-                    charset = getattr(response, 'charset', 'utf-8') or 'utf-8'
-                    snippet = response.content.decode(charset, errors='ignore')
-                    response_data['response_text_snippet'] = snippet[:1024]
-            except Exception:
-                pass
-
-        response_log = json.dumps(response_data, ensure_ascii=False, default=str)
-        logger.debug(f'[{__uuid}]response: {response_log}, use_time: {round(time.time() - start, 4)} s')
-        return response
+        return _log_response(response, __uuid, start)
 
     return wrapper
 
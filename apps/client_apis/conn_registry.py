@@ -0,0 +1,125 @@
+import logging
+import sqlite3
+import time
+
+from common.shared_store import SharedStore, shared_store
+
+logger = logging.getLogger(__name__)
+
+
+class ConnectionRegistry:
+    """
+    Bảng kết nối đang hoạt động của thiết bị, dùng chung giữa các worker qua ``SharedStore``.
+
+    - ``conns:<uuid>``: danh sách conn_id thiết bị đang phục vụ, cập nhật từ ``conns``
+      trong heartbeat (nguồn chính xác) và sự kiện ``audit/conn`` (new/close);
+    - ``disconnect:<uuid>``: lệnh ngắt kết nối do web phát ra, chờ heartbeat kế tiếp lấy đi.
+
+    Mỗi heartbeat chỉ cần một câu SELECT theo khóa chính; chỉ ghi khi danh sách kết nối
+    thay đổi, khi sắp hết hạn, hoặc khi có lệnh ngắt cần lấy ra.
+
+    :param store: Kho dùng chung
+    :param ttl: Thời gian sống của danh sách kết nối (giây) khi thiết bị ngừng heartbeat
+    :param order_ttl: Thời gian giữ lệnh ngắt chưa được gửi (giây)
+    """
+
+    def __init__(self, store: SharedStore, ttl=300, order_ttl=300):
+        self.store = store
+        self.ttl = ttl
+        self.order_ttl = order_ttl
+
+    @staticmethod
+    def _normalize(conn_ids) -> list[int]:
+        normalized = set()
+        for conn_id in conn_ids or []:
+            try:
+                normalized.add(int(conn_id))
+            except (TypeError, ValueError):
+                continue
+        return sorted(normalized)
+
+    def sync(self, uuid, conns=None, now=None) -> list[int]:
+        """
+        Đồng bộ danh sách kết nối từ heartbeat và lấy các lệnh ngắt đang chờ.
+
+        :param uuid: UUID thiết bị
+        :param conns: ``conns`` trong heartbeat (client bỏ khóa này khi không có phiên nào: truyền ``[]``);
+            ``None`` là không rõ, giữ nguyên danh sách hiện có
+        :param now: Thời điểm hiện tại (timestamp), dùng để làm mới trước khi hết hạn
+        :returns: Danh sách conn_id client cần ngắt
+        """
+        now = now or time.time()
+        conns_key, order_key = f'conns:{uuid}', f'disconnect:{uuid}'
+        try:
+            state = self.store.get_many(conns_key, order_key)
+            if conns is not None:
+                conns = self._normalize(conns)
+                current = state.get(conns_key)
+                if not current or current['ids'] != conns or now - current['at'] > self.ttl / 2:
+                    self.store.set(conns_key, {'ids': conns, 'at': now}, ttl=self.ttl)
+            if order_key not in state:
+                return []
+            orders = self.store.pop(order_key) or []
+        except sqlite3.Error:
+            # Kho dùng chung lỗi không được làm hỏng heartbeat
+            logger.exception(f'Đồng bộ bảng kết nối thất bại: uuid={uuid}')
+            return []
+
+        if conns is not None:
+            # Kết nối đã đóng thì không cần gửi lệnh ngắt nữa
+            orders = [conn_id for conn_id in orders if conn_id in conns]
+        if orders:
+            logger.info(f'Gửi lệnh ngắt kết nối: uuid={uuid} conns={orders}')
+        return orders
+
+    def open(self, uuid, conn_id):
+        """
+        Thêm kết nối (sự kiện ``audit/conn`` action=new).
+        """
+        self._update_conns(uuid, lambda ids: ids | set(self._normalize([conn_id])))
+
+    def close(self, uuid, conn_id):
+        """
+        Bỏ kết nối (sự kiện ``audit/conn`` action=close).
+        """
+        self._update_conns(uuid, lambda ids: ids - set(self._normalize([conn_id])))
+
+    def get(self, uuid) -> list[int]:
+        """
+        Danh sách conn_id đang hoạt động của thiết bị.
+        """
+        state = self.store.get(f'conns:{uuid}')
+        return state['ids'] if state else []
+
+    def request_disconnect(self, uuid, conn_ids=None) -> list[int]:
+        """
+        Phát lệnh ngắt kết nối, gửi cho thiết bị ở heartbeat kế tiếp.
+
+        :param uuid: UUID thiết bị
+        :param conn_ids: Các conn_id cần ngắt; ``None`` là ngắt mọi kết nối đang hoạt động
+        :returns: Danh sách conn_id đang chờ ngắt
+        """
+        conn_ids = self.get(uuid) if conn_ids is None else self._normalize(conn_ids)
+        if not conn_ids:
+            return []
+        _, orders = self.store.update(
+            f'disconnect:{uuid}',
+            lambda pending: sorted(set(pending) | set(conn_ids)),
+            ttl=self.order_ttl,
+            default=[],
+        )
+        logger.info(f'Phát lệnh ngắt kết nối: uuid={uuid} conns={orders}')
+        return orders
+
+    def _update_conns(self, uuid, func):
+        def apply(state):
+            ids = func(set(state['ids']) if state else set())
+            return {'ids': sorted(ids), 'at': state['at'] if state else time.time()}
+
+        try:
+            self.store.update(f'conns:{uuid}', apply, ttl=self.ttl)
+        except sqlite3.Error:
+            logger.exception(f'Cập nhật bảng kết nối thất bại: uuid={uuid}')
+
+
+conn_registry = ConnectionRegistry(shared_store)
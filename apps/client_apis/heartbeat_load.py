@@ -0,0 +1,95 @@
+import threading
+import time
+import zlib
+from collections import deque
+
+from apps.db.buffer import heartbeat_buffer
+from common.env import HeartBeatConfig
+
+
+class HeartBeatLoadMonitor:
+    """
+    Theo dõi tải nhận heartbeat của worker và tính chu kỳ heartbeat đề xuất.
+
+    - Độ trễ xử lý heartbeat được làm mượt bằng EWMA;
+    - Độ sâu hàng đợi lấy từ bộ đệm heartbeat (khi bật ``HEARTBEAT_BUFFER``);
+    - Tốc độ heartbeat thực tế tính theo cửa sổ trượt ``window`` giây.
+
+    Hệ số tải = max(độ trễ / mục tiêu, tỉ lệ lấp đầy hàng đợi * 2), chu kỳ đề xuất
+    = ``BASE_INTERVAL`` * hệ số tải (giới hạn bởi ``MAX_INTERVAL``), sau đó được
+    lệch đều theo hash của peer_id để các client không đồng loạt gửi lại.
+
+    :param window: Cửa sổ tính tốc độ heartbeat (giây)
+    :param alpha: Hệ số làm mượt EWMA
+    """
+
+    def __init__(self, window=60, alpha=0.2):
+        self.window = window
+        self.alpha = alpha
+        self._latency = 0.0
+        self._buckets: deque[list] = deque()
+        self._lock = threading.Lock()
+
+    def observe(self, latency: float):
+        """
+        Ghi nhận một heartbeat đã xử lý.
+
+        :param latency: Thời gian xử lý (giây)
+        """
+        now = int(time.monotonic())
+        with self._lock:
+            self._latency += self.alpha * (latency - self._latency)
+            if self._buckets and self._buckets[-1][0] == now:
+                self._buckets[-1][1] += 1
+            else:
+                self._buckets.append([now, 1])
+            self._expire(now)
+
+    def beat_rate(self) -> float:
+        """
+        Tốc độ heartbeat worker nhận được (lần/giây) trong cửa sổ trượt.
+        """
+        with self._lock:
+            self._expire(int(time.monotonic()))
+            return sum(count for _, count in self._buckets) / self.window
+
+    def load_factor(self) -> float:
+        latency_ratio = self._latency * 1000 / max(HeartBeatConfig.TARGET_LATENCY_MS, 1)
+        queue_ratio = heartbeat_buffer.stats()['pending'] / heartbeat_buffer.max_size * 2
+        return max(1.0, latency_ratio, queue_ratio)
+
+    def suggested_interval(self, peer_id) -> int:
+        """
+        Chu kỳ heartbeat đề xuất cho một client.
+
+        :param peer_id: ID thiết bị, dùng làm hạt giống lệch chu kỳ ổn định
+        :returns: Số giây
+        """
+        interval = min(HeartBeatConfig.BASE_INTERVAL * self.load_factor(), HeartBeatConfig.MAX_INTERVAL)
+        # crc32 ổn định giữa các worker/tiến trình (khác với hash() có salt)
+        spread = zlib.crc32(str(peer_id or '').encode('utf-8')) / 0xFFFFFFFF * 2 - 1
+        interval *= 1 + HeartBeatConfig.INTERVAL_JITTER * spread
+        return max(int(round(interval)), 1)
+
+    def stats(self) -> dict:
+        """
+        Số liệu tải của worker (độ trễ, hệ số tải, chu kỳ đề xuất, tốc độ heartbeat).
+        """
+        factor = self.load_factor()
+        interval = min(HeartBeatConfig.BASE_INTERVAL * factor, HeartBeatConfig.MAX_INTERVAL)
+        rate = self.beat_rate()
+        return {
+            'adaptive': HeartBeatConfig.ADAPTIVE_INTERVAL,
+            'latency_ms': round(self._latency * 1000, 3),
+            'load_factor': round(factor, 3),
+            'suggested_interval': round(interval, 1),
+            'beat_rate': round(rate, 3),
+            'window': self.window,
+        }
+
+    def _expire(self, now: int):
+        while self._buckets and self._buckets[0][0] <= now - self.window:
+            self._buckets.popleft()
+
+
+heartbeat_load = HeartBeatLoadMonitor()
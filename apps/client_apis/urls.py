@@ -1,10 +1,15 @@
 from django.urls import path
 
-from apps.client_apis import views, view_ab, view_audit
+from apps.client_apis import views, view_ab, view_audit, view_async
+from common.env import PublicConfig
+
+# ASGI 模式下，高频上报接口使用异步视图，每个请求只占用一个协程而非一个线程
+ingest = view_async if PublicConfig.ASYNC_INGEST else views
+audit = view_async if PublicConfig.ASYNC_INGEST else view_audit
 
 urlpatterns = [
-    path('heartbeat', views.heartbeat),
-    path('sysinfo', views.sysinfo),
+    path('heartbeat', ingest.heartbeat),
+    path('sysinfo', ingest.sysinfo),
     path('record', views.record),
     path('login-options', views.login_options),
     path('login', views.login),
@@ -13,7 +18,7 @@ urlpatterns = [
     path('users', views.users),
     path('peers', views.peers),
     path('oidc/auth', views.oidc_auth),
-    path('oidc/auth-query', views.oidc_auth_query),
+    path('oidc/auth-query', ingest.oidc_auth_query),
     path('oidc/authorize', views.oidc_authorize),
     path('ab', view_ab.ab),
     path('ab/personal', view_ab.ab_personal),
@@ -29,7 +34,7 @@ urlpatterns = [
     path('ab/shared/profiles', view_ab.ab_shared_profiles),
     path('ab/peers', view_ab.ab_peers),
     path('device-group/accessible', views.device_group_accessible),
-    path('audit/conn', view_audit.audit_conn),
-    path('audit/file', view_audit.audit_file),
+    path('audit/conn', audit.audit_conn),
+    path('audit/file', audit.audit_file),
     path('time', views.time_test),
 ]
@@ -1,13 +1,59 @@
 import logging
-
-from django.http import HttpRequest, JsonResponse, HttpResponse
+import re
+from collections.abc import Iterator
+from itertools import islice
+
+from django.core.serializers.json import DjangoJSONEncoder
+from django.http import HttpRequest, JsonResponse, HttpResponse, HttpResponseNotModified, StreamingHttpResponse
+from django.utils.cache import patch_vary_headers
+from django.utils.http import parse_etags
+from django.utils.text import compress_string
 from django.views.decorators.http import require_http_methods
 
 from apps.client_apis.common import request_debug_log, debug_response_None, check_login
 from apps.db.models import Personal
-from apps.db.service import TokenService, AliasService, TagService, PersonalService, SharePersonalService
+from apps.db.service import (
+    TokenService,
+    AliasService,
+    TagService,
+    PersonalService,
+    SharePersonalService,
+    ab_snapshot_cache,
+)
+from common.env import AddressBookConfig
 
 logger = logging.getLogger(__name__)
+_accepts_gzip = re.compile(r'\bgzip\b')
+# /api/ab/peers 每块读取的设备数，不超过 TagService.get_tags_map 的 IN 条件上限
+_PEERS_CHUNK_SIZE = 500
+_os_map = {
+    'windows': 'Windows',
+    'linux': 'Linux',
+    'macos': 'Mac OS',
+    'android': 'Android',
+}
+
+
+def _not_modified(request: HttpRequest, guid, revision, variant: str = '') -> tuple[str, HttpResponse | None]:
+    """
+    根据地址簿版本号生成弱 ETag，并处理 If-None-Match（弱比较）
+
+    同一版本的 gzip 与未压缩响应内容相同而字节不同，因此使用弱 ETag；分页等不同内容通过 variant 区分。
+
+    :param request: 请求对象
+    :param guid: 地址簿 guid
+    :param revision: 地址簿版本号（Personal.revision）
+    :param variant: 附加到 ETag 的响应变体（如分页参数）
+    :return: (ETag, 命中时的 304 响应，否则为 None)
+    """
+    opaque = f'"{guid}-{revision}{variant}"'
+    etag = f'W/{opaque}'
+    if_none_match = {tag.removeprefix('W/') for tag in parse_etags(request.headers.get('If-None-Match') or '')}
+    if opaque in if_none_match or '*' in if_none_match:
+        response = HttpResponseNotModified()
+        response['ETag'] = etag
+        return etag, response
+    return etag, None
 
 
 @request_debug_log
@@ -54,6 +100,12 @@ def ab_personal(request: HttpRequest):
 @check_login
 def ab_tags(request, guid):
     token_service = TokenService(request=request)
+    revision = Personal.objects.filter(guid=guid).values_list('revision', flat=True).first()
+    etag = None
+    if revision is not None:
+        etag, not_modified = _not_modified(request, guid, revision)
+        if not_modified:
+            return not_modified
     user_info = token_service.user_info
     tag_service = TagService(guid=guid, user=user_info)
     tags = tag_service.get_all_tags()
@@ -63,7 +115,10 @@ def ab_tags(request, guid):
             'color': int(tag.color),
         } for tag in tags
     ]
-    return JsonResponse(data, safe=False, status=200)
+    response = JsonResponse(data, safe=False, status=200)
+    if etag:
+        response['ETag'] = etag
+    return response
 
 
 @request_debug_log
@@ -164,6 +219,8 @@ def ab_shared_profiles(request):
 def ab_peers(request):
     """
     返回用户添加到地址簿的设备列表
+
+    传 current/pageSize 时分页返回；响应体逐块流式输出，不在内存中构建完整列表。
     :param request:
     :return:
     """
@@ -172,11 +229,8 @@ def ab_peers(request):
     request_query = token_service.request_query
     guid = request_query.get('ab')
 
-    personal_service = PersonalService()
-    try:
-        # 结合 select_related 一次性拉取 `peer`，避免 N+1
-        peers_qs = personal_service.get_personal(guid).personal_peer.select_related('peer').all()
-    except Exception:
+    personal = PersonalService().get_personal(guid)
+    if personal is None:
         logger.error(f'[ab_peers] get personal error: {guid}')
         return JsonResponse(
             {
@@ -184,34 +238,128 @@ def ab_peers(request):
                 "data": []
             }
         )
+    # 地址簿未变化时直接返回 304，不读取设备数据；分页响应的 ETag 带上页码与每页条数
+    page = _page_args(request_query)
+    variant = f'-{page[0]}-{page[1]}' if page is not None else ''
+    etag, not_modified = _not_modified(request, guid, personal.revision, variant)
+    if not_modified:
+        return not_modified
+    # 按 created_at 排序时以 id 兜底，保证分页结果稳定；只取输出需要的列，不实例化模型
+    rows = personal.personal_peer.order_by('-created_at', '-id').values_list(
+        'peer__peer_id', 'peer__username', 'peer__device_name', 'peer__os')
+    if page is not None:
+        current, page_size = page
+        offset = (current - 1) * page_size
+        response = StreamingHttpResponse(
+            _stream_peers(_iter_peers(personal, user_info, rows[offset:offset + page_size]), total=rows.count()),
+            content_type='application/json',
+        )
+    elif not AddressBookConfig.SNAPSHOT_CACHE_MB:
+        response = StreamingHttpResponse(_stream_peers(_iter_peers(personal, user_info, rows)),
+                                         content_type='application/json')
+    else:
+        # 不分页时使用快照：与地址簿版本号一致则直接返回已序列化（及压缩）的字节
+        snapshot = ab_snapshot_cache.get(guid)
+        if snapshot is None or snapshot['revision'] != personal.revision:
+            body = b''.join(_stream_peers(_iter_peers(personal, user_info, rows)))
+            compressed = compress_string(body)
+            snapshot = {
+                'revision': personal.revision,
+                'json': body,
+                'gzip': compressed if len(compressed) < len(body) else None,
+            }
+            # 并发请求可能读到较旧的版本号：只用更新的快照替换缓存，避免新旧快照来回覆盖
+            cached = ab_snapshot_cache.get(guid)
+            if cached is None or cached['revision'] < snapshot['revision']:
+                ab_snapshot_cache.set(guid, snapshot)
+        if snapshot['gzip'] is not None and _accepts_gzip.search(request.headers.get('Accept-Encoding') or ''):
+            response = HttpResponse(snapshot['gzip'], content_type='application/json')
+            response['Content-Encoding'] = 'gzip'
+        else:
+            response = HttpResponse(snapshot['json'], content_type='application/json')
+        patch_vary_headers(response, ('Accept-Encoding',))
+    response['ETag'] = etag
+    return response
+
+
+def _page_args(query: dict) -> tuple[int, int] | None:
+    """
+    解析客户端分页参数 current（从 1 开始）与 pageSize
 
-    # 预取 alias 和 tags，使用批量映射减少查询
-    peer_ids = [p.peer.peer_id for p in peers_qs]
-    alias_map = AliasService().get_alias_map(guid=guid, peer_ids=peer_ids)
-    tags_map = TagService(guid=guid, user=user_info).get_tags_map(peer_ids)
+    :param query: 请求查询参数
+    :return: (current, pageSize)；未传或非法的 pageSize 返回 None，表示不分页
+    """
+    try:
+        page_size = int(query.get('pageSize') or 0)
+        current = int(query.get('current') or 1)
+    except ValueError:
+        return None
+    if page_size <= 0:
+        return None
+    return max(current, 1), page_size
 
-    os_map = {
-        'windows': 'Windows',
-        'linux': 'Linux',
-        'macos': 'Mac OS',
-        'android': 'Android',
-    }
 
-    result = {
-        "total": peers_qs.count(),
-        "data": [
-            {
-                "id": p.peer.peer_id,
-                "username": p.peer.username,
-                "hostname": p.peer.device_name,
-                "alias": alias_map.get(p.peer.peer_id, ""),
-                "platform": os_map[p.peer.os.split(' / ')[0]],
-                "tags": tags_map.get(p.peer.peer_id, []),
-            } for p in peers_qs
-        ]
-    }
+def _platform(os) -> str:
+    """
+    将 sysinfo 中的 os（如 "windows / Windows 10"）转换为客户端显示的平台名
+
+    未知或为空的 os 原样返回（None 返回空字符串），避免流式响应中途出错。
+    """
+    key = (os or '').split(' / ')[0]
+    return _os_map.get(key, key)
+
+
+def _iter_peers(personal: Personal, user_info, rows) -> Iterator[dict]:
+    """
+    按块读取地址簿设备，生成 /api/ab/peers 的数据项
+
+    每块只查询本块设备的别名与标签，内存占用不随地址簿大小增长。
+
+    :param personal: 地址簿
+    :param user_info: 当前用户
+    :param rows: (peer_id, username, hostname, os) 的 values_list 查询集（可为切片）
+    :return: 设备数据项迭代器
+    """
+    guid = personal.guid
+    alias_service = AliasService()
+    tag_service = TagService(guid=guid, user=user_info)
+    rows = rows.iterator(chunk_size=_PEERS_CHUNK_SIZE)
+    while chunk := list(islice(rows, _PEERS_CHUNK_SIZE)):
+        peer_ids = [row[0] for row in chunk]
+        alias_map = alias_service.get_alias_map(guid=guid, peer_ids=peer_ids)
+        tags_map = tag_service.get_tags_map(peer_ids)
+        for peer_id, username, hostname, os in chunk:
+            yield {
+                "id": peer_id,
+                "username": username,
+                "hostname": hostname,
+                "alias": alias_map.get(peer_id, ""),
+                "platform": _platform(os),
+                "tags": tags_map.get(peer_id, []),
+            }
 
-    return JsonResponse(result)
+
+def _stream_peers(items: Iterator[dict], total: int | None = None) -> Iterator[bytes]:
+    """
+    将设备数据项逐块序列化为 {"data": [...], "total": ...}
+
+    :param items: 设备数据项迭代器
+    :param total: 设备总数；为 None 时在输出完数据后按实际条数填写，无需额外的 COUNT 查询
+    :return: JSON 字节块迭代器
+    """
+    encoder = DjangoJSONEncoder()
+    count = 0
+    buffer = ['{"data": [']
+    for item in items:
+        if count:
+            buffer.append(', ')
+        buffer.append(encoder.encode(item))
+        count += 1
+        if count % _PEERS_CHUNK_SIZE == 0:
+            yield ''.join(buffer).encode()
+            buffer = []
+    buffer.append(f'], "total": {count if total is None else total}}}')
+    yield ''.join(buffer).encode()
 
 
 @request_debug_log
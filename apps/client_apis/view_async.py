@@ -0,0 +1,143 @@
+import logging
+import time
+import traceback
+
+from asgiref.sync import sync_to_async
+from django.http import HttpRequest, JsonResponse, HttpResponse
+from django.utils import timezone
+from django.views.decorators.http import require_http_methods
+
+from apps.client_apis.common import request_debug_log
+from apps.client_apis.conn_registry import conn_registry
+from apps.client_apis.view_audit import audit_conn_fields, audit_file_fields, track_connection
+from apps.client_apis.views import (
+    heartbeat_response,
+    identity_is_stale,
+    parse_heartbeat,
+    parse_json_body,
+    strategy_applied,
+    sysinfo_fields,
+)
+from apps.db.models import OidcAuth
+from apps.db.service import (
+    AuditConnService,
+    AuditFileLogService,
+    HeartBeatService,
+    PeerInfoService,
+    StrategyService,
+    TokenService,
+    UserService,
+)
+
+logger = logging.getLogger(__name__)
+
+
+@request_debug_log
+@require_http_methods(["POST"])
+async def heartbeat(request: HttpRequest):
+    started = time.perf_counter()
+    beat = parse_heartbeat(request)
+    if beat is None:
+        return JsonResponse({'error': 'Invalid request body'}, status=400)
+    uuid = beat['uuid']
+
+    await HeartBeatService().arecord(uuid=uuid, peer_id=beat['peer_id'], ver=beat['ver'])
+
+    peer_service = PeerInfoService()
+    identity = await peer_service.aget_identity(uuid=uuid, peer_id=beat['peer_id'])
+    if identity_is_stale(identity):
+        identity = await peer_service.aget_identity(uuid=uuid, peer_id=beat['peer_id'], refresh=True)
+
+    disconnect, effective = [], None
+    if uuid:
+        disconnect = await sync_to_async(conn_registry.sync, thread_sensitive=False)(uuid, beat['conns'])
+        strategy_service = StrategyService()
+        effective = await strategy_service.aget_effective(uuid)
+        if strategy_applied(beat, effective):
+            await strategy_service.amark_applied(uuid, effective, beat['modified_at'])
+
+    return heartbeat_response(beat, identity, disconnect, effective, started)
+
+
+@request_debug_log
+@require_http_methods(["POST"])
+async def sysinfo(request: HttpRequest):
+    body = parse_json_body(request)
+    if body is None:
+        return JsonResponse({'error': 'Invalid request body'}, status=400)
+    fields = sysinfo_fields(body)
+
+    await PeerInfoService().aupdate(**fields)
+    await TokenService(request=request).aupdate_token_by_uuid(fields['uuid'])
+
+    return HttpResponse("SYSINFO_UPDATED", status=200)
+
+
+@request_debug_log
+@require_http_methods(["POST"])
+async def audit_conn(request: HttpRequest):
+    """
+    Log kết nối (async)
+    :param request:
+    :return:
+    """
+    body = TokenService(request=request).request_body
+
+    await sync_to_async(track_connection, thread_sensitive=False)(body)
+    await AuditConnService().alog(**audit_conn_fields(body))
+
+    return HttpResponse(status=200)
+
+
+@request_debug_log
+@require_http_methods(["POST"])
+async def audit_file(request: HttpRequest):
+    """
+    Log file (async)
+    :param request:
+    :return:
+    """
+    body = TokenService(request=request).request_body
+    username, fields = audit_file_fields(body)
+
+    try:
+        user_id = (await UserService().aget_user_by_name(username.lower())).id
+    except Exception:
+        logger.error(traceback.format_exc())
+        user_id = ''
+
+    await AuditFileLogService().alog(user_id=user_id, **fields)
+
+    return HttpResponse(status=200)
+
+
+@request_debug_log
+@require_http_methods(["GET"])
+async def oidc_auth_query(request: HttpRequest):
+    code = request.GET.get('code') or ''
+    peer_id = request.GET.get('id') or ''
+    uuid = request.GET.get('uuid') or ''
+
+    if not code:
+        return JsonResponse({'error': 'Missing code'}, status=400)
+
+    auth = await OidcAuth.objects.select_related('user_id').filter(code=code).afirst()
+    if not auth or (peer_id and auth.peer_id != peer_id) or (uuid and auth.uuid != uuid):
+        return JsonResponse({'error': 'No authed oidc is found'})
+
+    if auth.expires_at < timezone.now():
+        if auth.status != 'expired':
+            auth.status = 'expired'
+            await auth.asave(update_fields=['status'])
+        return JsonResponse({'error': 'OIDC code expired'}, status=400)
+
+    if auth.status != 'approved' or not auth.access_token:
+        return JsonResponse({'error': 'No authed oidc is found'})
+
+    return JsonResponse({
+        'access_token': auth.access_token,
+        'type': 'access_token',
+        'user': {
+            'name': auth.user_id.username if auth.user_id else '',
+        }
+    })
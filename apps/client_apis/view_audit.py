@@ -6,44 +6,85 @@ from django.http import HttpRequest, HttpResponse
 from django.views.decorators.http import require_http_methods
 
 from apps.client_apis.common import request_debug_log
+from apps.client_apis.conn_registry import conn_registry
 from apps.db.service import AuditConnService, TokenService, AuditFileLogService, UserService
 
 logger = logging.getLogger(__name__)
 
 
-@request_debug_log
-@require_http_methods(["POST"])
-def audit_conn(request: HttpRequest):
+def track_connection(body: dict):
     """
-    连接日志
-    :param request:
-    :return:
+    Cập nhật bảng kết nối dùng chung từ sự kiện audit/conn (new/close)
+
+    :param body: Nội dung request audit/conn
     """
-    token_service = TokenService(request=request)
-    body = token_service.request_body
     action = body.get('action')
-    conn_id = body.get('conn_id')
-    ip = body.get('ip', '')
     controlled_uuid = body.get('uuid')
-    session_id = body.get('session_id')
-    type_ = body.get('type', 0)
+    conn_id = body.get('conn_id')
+    if not controlled_uuid or conn_id is None:
+        return
+    if action == 'new':
+        conn_registry.open(controlled_uuid, conn_id)
+    elif action == 'close':
+        conn_registry.close(controlled_uuid, conn_id)
+
+
+def audit_conn_fields(body: dict) -> dict:
+    """
+    Tham số ``AuditConnService.log`` lấy từ body audit/conn (dùng chung cho bản sync và async)
+
+    :param body: Nội dung request audit/conn
+    """
     username = ''  # 发起者
     peer_id = ''  # 发起者peer id
     if peer := body.get('peer'):
         username = str(peer[-1]).lower()
         peer_id = peer[0]
+    return {
+        'conn_id': body.get('conn_id'),
+        'action': body.get('action'),
+        'controlled_uuid': body.get('uuid'),
+        'source_ip': body.get('ip', ''),
+        'session_id': body.get('session_id'),
+        'controller_peer_id': peer_id,
+        'type_': body.get('type', 0),
+        'username': username,
+    }
 
-    audit_service = AuditConnService()
-    audit_service.log(
-        conn_id=conn_id,
-        action=action,
-        controlled_uuid=controlled_uuid,
-        source_ip=ip,
-        session_id=session_id,
-        controller_peer_id=peer_id,
-        type_=type_,
-        username=username
-    )
+
+def audit_file_fields(body: dict) -> tuple[str | None, dict]:
+    """
+    Tham số ``AuditFileLogService.log`` lấy từ body audit/file (dùng chung cho bản sync và async)
+
+    :param body: Nội dung request audit/file
+    :return: (tên người dùng thao tác file, các tham số trừ ``user_id``)
+    """
+    file_info = json.loads(body.get('info'))
+    return file_info.get('name'), {
+        'source_id': body.get('peer_id'),
+        'target_id': body.get('id'),
+        'target_uuid': body.get('uuid'),
+        'target_ip': file_info.get('ip'),
+        'operation_type': body.get('type'),  # 0:下载 1:上传
+        'is_file': body.get('is_file'),
+        'remote_path': body.get('path'),
+        'file_info': str(file_info.get('files')),
+        'file_num': file_info.get('num'),
+    }
+
+
+@request_debug_log
+@require_http_methods(["POST"])
+def audit_conn(request: HttpRequest):
+    """
+    连接日志
+    :param request:
+    :return:
+    """
+    body = TokenService(request=request).request_body
+
+    track_connection(body)
+    AuditConnService().log(**audit_conn_fields(body))
 
     return HttpResponse(status=200)
 
@@ -56,34 +97,15 @@ def audit_file(request):
     :param request:
     :return:
     """
-    token_service = TokenService(request=request)
-    body = token_service.request_body
-    target_peer_id = body.get('id')
-    file_info = json.loads(body.get('info'))
-    is_file = body.get('is_file')
-    file_path = body.get('path')
-    source_peer_id = body.get('peer_id')
-    type_ = body.get('type')  # 0:下载 1:上传
-    uuid = body.get('uuid')
+    body = TokenService(request=request).request_body
+    username, fields = audit_file_fields(body)
 
     try:
-        user_id = UserService().get_user_by_name(file_info.get('name').lower()).id
+        user_id = UserService().get_user_by_name(username.lower()).id
     except Exception:
         logger.error(traceback.format_exc())
         user_id = ''
 
-    file_service = AuditFileLogService()
-    file_service.log(
-        source_id=source_peer_id,
-        target_id=target_peer_id,
-        target_uuid=uuid,
-        target_ip=file_info.get('ip'),
-        operation_type=type_,
-        is_file=is_file,
-        remote_path=file_path,
-        file_info=str(file_info.get('files')),
-        user_id=user_id,
-        file_num=file_info.get('num'),
-    )
+    AuditFileLogService().log(user_id=user_id, **fields)
 
     return HttpResponse(status=200)
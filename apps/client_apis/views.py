@@ -1,6 +1,7 @@
 import json
 import logging
 import os
+import time
 import traceback
 from datetime import timedelta
 
@@ -9,15 +10,20 @@ from django.http import HttpRequest, JsonResponse, HttpResponse
 from django.utils import timezone
 from django.views.decorators.http import require_http_methods
 
-from apps.client_apis.common import check_login, request_debug_log, debug_response_None
+from apps.client_apis.common import check_login, request_debug_log, debug_response_None, login_allowed
+from apps.client_apis.conn_registry import conn_registry
+from apps.client_apis.heartbeat_load import heartbeat_load
 from apps.db.models import PeerInfo, OidcAuth
 from apps.db.service import (
     HeartBeatService,
     PeerInfoService,
+    StrategyService,
     TokenService,
     UserService,
     LoginClientService,
 )
+from common.env import HeartBeatConfig
+from common.error import LoginThrottledError
 from common.utils import get_local_time, str2bool, get_randem_md5
 
 logger = logging.getLogger(__name__)
@@ -44,75 +50,153 @@ def time_test(request: HttpRequest):
     })
 
 
-@request_debug_log
-@require_http_methods(["POST"])
-def heartbeat(request: HttpRequest):
+def parse_json_body(request: HttpRequest) -> dict | None:
+    """
+    Đọc body JSON của request client
+
+    :return: Nội dung đã parse; None nếu body không hợp lệ
+    """
     try:
-        request_data = json.loads(request.body.decode('utf-8'))
+        body = json.loads(request.body.decode('utf-8'))
     except Exception:
-        return JsonResponse({'error': 'Invalid request body'}, status=400)
-    uuid = request_data.get('uuid')
-    peer_id = request_data.get('id')
-    modified_at = request_data.get('modified_at', get_local_time())
-    ver = request_data.get('ver')
-    conns = request_data.get('conns') or []
+        return None
+    return body if isinstance(body, dict) else None
 
-    HeartBeatService().update(
-        uuid=uuid,
-        peer_id=peer_id,
-        modified_at=modified_at,
-        ver=ver,
-    )
 
-    peer_info = None
-    if uuid:
-        peer_info = PeerInfoService().get_peer_info_by_uuid(uuid)
-    if not peer_info and peer_id:
-        peer_info = PeerInfoService().get_peer_info_by_peer_id(peer_id)
+def parse_heartbeat(request: HttpRequest) -> dict | None:
+    """
+    Chuẩn hóa nội dung heartbeat (dùng chung cho bản sync và async)
 
-    need_sysinfo = False
-    if not peer_info:
-        need_sysinfo = True
-    elif ver and str(peer_info.version) != str(ver):
-        need_sysinfo = True
+    - ``conns``: client bỏ khóa này khi không có phiên nào, coi như danh sách rỗng;
+    - ``modified_at``: phiên bản chiến lược client đang áp dụng, không hợp lệ thì là 0.
 
+    :return: Dict {uuid, peer_id, ver, conns, modified_at}; None nếu body không hợp lệ
+    """
+    request_data = parse_json_body(request)
+    if request_data is None:
+        return None
+    try:
+        client_version = int(request_data.get('modified_at') or 0)
+    except (TypeError, ValueError):
+        client_version = 0
+    return {
+        'uuid': request_data.get('uuid'),
+        'peer_id': request_data.get('id'),
+        'ver': request_data.get('ver'),
+        'conns': request_data.get('conns') or [],
+        'modified_at': client_version,
+    }
+
+
+def identity_is_stale(identity: dict | None) -> bool:
+    """
+    Định danh trong cache chưa có mã băm sysinfo: có thể sysinfo đã được cập nhật ở worker khác,
+    cần đọc lại từ DB trước khi yêu cầu client gửi sysinfo
+    """
+    return bool(identity) and not identity['sysinfo_hash']
+
+
+def strategy_applied(beat: dict, effective: dict | None) -> bool:
+    """
+    Client đã áp dụng đúng phiên bản chiến lược hiệu lực (cần ghi nhận ``applied_version``)
+    """
+    return effective is not None and effective['version'] == beat['modified_at']
+
+
+def heartbeat_response(beat: dict, identity: dict | None, disconnect: list, effective: dict | None,
+                       started: float) -> JsonResponse:
+    """
+    Tạo response heartbeat từ kết quả các bước I/O
+
+    :param beat: Kết quả ``parse_heartbeat``
+    :param identity: Định danh thiết bị (``PeerInfoService.get_identity``)
+    :param disconnect: Lệnh ngắt kết nối (``conn_registry.sync``)
+    :param effective: Chiến lược hiệu lực (``StrategyService.get_effective``); None nếu không có uuid
+    :param started: Thời điểm bắt đầu xử lý (``time.perf_counter``), dùng tính tải heartbeat
+    """
     response_data = {
         'modified_at': int(get_local_time().timestamp()),
-        'disconnect': [],
+        'disconnect': disconnect,
         'strategy': {},
     }
-    if conns is not None:
-        response_data['disconnect'] = []
-    if need_sysinfo:
+    # Chỉ yêu cầu sysinfo khi server chưa có mã băm sysinfo hiện hành của thiết bị
+    # (``ver`` là phiên bản giao thức dạng số, không so sánh được với ``version`` trong sysinfo)
+    if not identity or not identity['sysinfo_hash']:
         response_data['sysinfo'] = True
 
+    if effective is not None:
+        # Chiến lược: chỉ gửi nội dung khi phiên bản hiệu lực khác phiên bản client đang áp dụng (modified_at)
+        response_data['modified_at'] = effective['version']
+        if not strategy_applied(beat, effective):
+            response_data['strategy'] = {'config_options': effective['config_options'], 'extra': {}}
+
+    heartbeat_load.observe(time.perf_counter() - started)
+    if HeartBeatConfig.ADAPTIVE_INTERVAL:
+        # Chu kỳ heartbeat đề xuất theo tải server, lệch theo peer_id để tránh dồn cục
+        response_data['strategy']['heartbeat_interval'] = heartbeat_load.suggested_interval(beat['peer_id'])
+
     return JsonResponse(response_data)
 
 
+def sysinfo_fields(body: dict) -> dict:
+    """
+    Các trường thông tin thiết bị lấy từ body sysinfo (tham số của ``PeerInfoService.update``)
+    """
+    return {
+        'uuid': body.get('uuid'),
+        'peer_id': body.get('id'),
+        'cpu': body.get('cpu'),
+        'device_name': body.get('hostname'),
+        'memory': body.get('memory'),
+        'os': body.get('os'),
+        'username': body.get('username') or body.get('hostname'),
+        'version': body.get('version'),
+    }
+
+
+@request_debug_log
+@require_http_methods(["POST"])
+def heartbeat(request: HttpRequest):
+    started = time.perf_counter()
+    beat = parse_heartbeat(request)
+    if beat is None:
+        return JsonResponse({'error': 'Invalid request body'}, status=400)
+    uuid = beat['uuid']
+
+    HeartBeatService().record(uuid=uuid, peer_id=beat['peer_id'], ver=beat['ver'])
+
+    # Thiết bị đã biết: lấy từ cache định danh, không truy vấn DB
+    peer_service = PeerInfoService()
+    identity = peer_service.get_identity(uuid=uuid, peer_id=beat['peer_id'])
+    if identity_is_stale(identity):
+        identity = peer_service.get_identity(uuid=uuid, peer_id=beat['peer_id'], refresh=True)
+
+    disconnect, effective = [], None
+    if uuid:
+        # Đồng bộ bảng kết nối dùng chung và lấy lệnh ngắt do web phát ra
+        disconnect = conn_registry.sync(uuid, beat['conns'])
+        strategy_service = StrategyService()
+        effective = strategy_service.get_effective(uuid)
+        if strategy_applied(beat, effective):
+            strategy_service.mark_applied(uuid, effective, beat['modified_at'])
+
+    return heartbeat_response(beat, identity, disconnect, effective, started)
+
+
 @request_debug_log
 @require_http_methods(["POST"])
 def sysinfo(request: HttpRequest):
-    try:
-        body = json.loads(request.body.decode('utf-8'))
-    except Exception:
+    body = parse_json_body(request)
+    if body is None:
         return JsonResponse({'error': 'Invalid request body'}, status=400)
-    uuid = body.get('uuid')
+    fields = sysinfo_fields(body)
 
-    # Cập nhật thông tin thiết bị trước
-    PeerInfoService().update(
-        uuid=uuid,
-        peer_id=body.get('id'),
-        cpu=body.get('cpu'),
-        device_name=body.get('hostname'),
-        memory=body.get('memory'),
-        os=body.get('os'),
-        username=body.get('username') or body.get('hostname'),
-        version=body.get('version'),
-    )
+    # Cập nhật thông tin thiết bị trước (nội dung không đổi thì bỏ qua, không ghi DB)
+    PeerInfoService().update(**fields)
 
     # Nếu thiết bị đã từng đăng nhập thì cập nhật token
     # Vấn đề: chưa kiểm tra hạn token; server dừng vài giờ rồi chạy lại vẫn refresh token, tạm thời giữ vậy
-    TokenService(request=request).update_token_by_uuid(uuid)
+    TokenService(request=request).update_token_by_uuid(fields['uuid'])
 
     return HttpResponse("SYSINFO_UPDATED", status=200)
 
@@ -147,8 +231,18 @@ def login(request: HttpRequest):
         safe_body,
     )
 
-    user = UserService().get_user_by_name(username=username)
-    if not user or not user.check_password(password):
+    if not login_allowed(request, username):
+        logger.warning('login throttled: username="%s"', username)
+        return JsonResponse({'error': 'Đăng nhập quá nhiều lần, vui lòng thử lại sau'}, status=429)
+
+    user_service = UserService()
+    user = user_service.get_user_by_name(username=username)
+    try:
+        verified = user_service.verify_password(user, password)
+    except LoginThrottledError:
+        logger.warning('login rejected, password queue full: username="%s"', username)
+        return JsonResponse({'error': 'Máy chủ đang bận, vui lòng thử lại sau'}, status=503)
+    if not verified:
         logger.warning('login failed: username="%s"', username)
         return JsonResponse({'error': 'Tên đăng nhập hoặc mật khẩu không đúng'})
 
@@ -163,6 +257,9 @@ def login(request: HttpRequest):
         platform=platform,
         client_type=client_type,
     )
+    # Người dùng của thiết bị thay đổi: tính lại chiến lược hiệu lực (chiến lược theo người dùng/nhóm)
+    if uuid and body.get('id'):
+        StrategyService().refresh({uuid: body.get('id')})
     #
     # LogService().create_log(
     #     username=username,
@@ -215,6 +312,8 @@ def logout(request: HttpRequest):
     uuid = body.get('uuid')
 
     token_service.delete_token(token)
+    if uuid and body.get('id'):
+        StrategyService().refresh({uuid: body.get('id')})
 
     # Cập nhật trạng thái đăng xuất
     LoginClientService().update_logout_status(
@@ -448,9 +547,15 @@ def oidc_authorize(request: HttpRequest):
     if not username or not password:
         return HttpResponse("Thiếu tên đăng nhập hoặc mật khẩu", status=400)
 
+    if not login_allowed(request, username):
+        return HttpResponse("Đăng nhập quá nhiều lần, vui lòng thử lại sau", status=429)
+
     try:
-        user = UserService().get_user_by_name(username=username)
-        assert user and user.check_password(password)
+        user_service = UserService()
+        user = user_service.get_user_by_name(username=username)
+        assert user_service.verify_password(user, password)
+    except LoginThrottledError:
+        return HttpResponse("Máy chủ đang bận, vui lòng thử lại sau", status=503)
     except AssertionError:
         logger.error(traceback.format_exc())
         return HttpResponse("Tên đăng nhập hoặc mật khẩu không đúng", status=401)
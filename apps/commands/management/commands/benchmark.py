@@ -0,0 +1,452 @@
+import gzip
+import json
+import math
+import re
+import time
+import tracemalloc
+import uuid
+
+from django.core import signals
+from django.core.handlers.wsgi import WSGIHandler
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.db import close_old_connections, connection, transaction
+from django.conf import settings
+from django.test import Client, RequestFactory, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+
+from apps.client_apis import view_ab
+from apps.common.middleware import OptOutSessionMiddleware
+from apps.common.wsgi import FastPathWSGIHandler, fast_path_routes
+from apps.db.models import LoginClient, PeerInfo, PeerPersonal, Personal, Tag, TagAssignment, Token
+from apps.db.service import PeerInfoService, TagService, TokenService, UserService, ab_snapshot_cache, token_cache
+from common.env import AddressBookConfig, TokenConfig
+
+
+class _Rollback(Exception):
+    pass
+
+
+class Command(BaseCommand):
+    help = 'Đo hiệu năng các đường xử lý nóng (chạy trong transaction và rollback, không để lại dữ liệu)'
+
+    scenarios = ('dispatch', 'auth', 'token_lookup', 'revoke', 'session', 'tags')
+
+    def add_arguments(self, parser):
+        """添加命令行参数。
+
+        :param parser: 参数解析器对象
+        """
+        parser.add_argument(
+            'scenario',
+            choices=self.scenarios,
+            help='Kịch bản đo',
+        )
+        parser.add_argument(
+            '--requests',
+            type=int,
+            default=2000,
+            help='Số request mỗi lượt đo',
+        )
+        parser.add_argument(
+            '--rows',
+            type=int,
+            default=100000,
+            help='Số bản ghi dữ liệu giả lập (token_lookup)',
+        )
+        parser.add_argument(
+            '--devices',
+            type=int,
+            default=10000,
+            help='Số thiết bị đăng nhập giả lập (revoke)',
+        )
+        parser.add_argument(
+            '--peers',
+            type=int,
+            default=5000,
+            help='Số thiết bị trong danh bạ giả lập (tags)',
+        )
+
+    def handle(self, *args, **options):
+        """处理命令逻辑。
+
+        :param options: 命令行选项字典
+        """
+        handler = getattr(self, f"bench_{options['scenario']}")
+        # close_old_connections sẽ đóng kết nối đang nằm trong transaction đo
+        signals.request_started.disconnect(close_old_connections)
+        signals.request_finished.disconnect(close_old_connections)
+        try:
+            with transaction.atomic():
+                handler(**options)
+                raise _Rollback
+        except _Rollback:
+            pass
+        finally:
+            signals.request_started.connect(close_old_connections)
+            signals.request_finished.connect(close_old_connections)
+
+    def timeit(self, func, n: int) -> float:
+        """
+        Chạy ``func(i)`` ``n`` lần, trả về thời gian trung bình mỗi lần (µs).
+        """
+        start = time.perf_counter()
+        for i in range(n):
+            func(i)
+        return (time.perf_counter() - start) / n * 1e6
+
+    def report(self, title: str, results: dict):
+        self.stdout.write(title)
+        baseline = next(iter(results.values()))
+        for name, value in results.items():
+            delta = (value - baseline) / baseline * 100 if baseline else 0
+            self.stdout.write(f'  {name:<24} {value:>10.1f} µs/req  {delta:+.1f}%')
+
+    def bench_dispatch(self, requests: int, **options):
+        """
+        So sánh chi phí xử lý ``/api/heartbeat`` qua ``WSGIHandler`` đầy đủ
+        và qua ``FastPathWSGIHandler``.
+        """
+        factory = RequestFactory()
+        peers = [(uuid.uuid4().hex, f'bench{i:06d}') for i in range(min(requests, 500))]
+        bodies = [
+            json.dumps({'id': peer_id, 'uuid': device_uuid, 'ver': 1, 'conns': []})
+            for device_uuid, peer_id in peers
+        ]
+
+        def environ(i):
+            request = factory.post(
+                '/api/heartbeat',
+                data=bodies[i % len(bodies)],
+                content_type='application/json',
+                REMOTE_ADDR='127.0.0.1',
+            )
+            return request.environ
+
+        def call(app):
+            def run(i):
+                response = app(environ(i), lambda status, headers: None)
+                if response.status_code != 200:
+                    raise CommandError(f'/api/heartbeat -> {response.status_code}')
+                response.close()
+
+            return run
+
+        full = WSGIHandler()
+        fast = FastPathWSGIHandler(fast_path_routes())
+        # Lượt làm nóng: tạo bản ghi thiết bị, nạp cache định danh
+        for i in range(len(bodies)):
+            call(full)(i)
+
+        self.report(f'dispatch /api/heartbeat x{requests}', {
+            'WSGIHandler': self.timeit(call(full), requests),
+            'FastPathWSGIHandler': self.timeit(call(fast), requests),
+        })
+
+    def bench_auth(self, requests: int, **options):
+        """
+        Gọi ``/api/ab/peers`` với token thường và token ký số (cache nguội/nóng): kiểm tra số lần
+        đọc bảng ``token`` mỗi request (1 khi cache nguội, 0 khi cache nóng) rồi đo thời gian.
+        """
+        factory = RequestFactory()
+        user = UserService().create_user(f'bench_{uuid.uuid4().hex[:8]}', uuid.uuid4().hex)
+        guid = Personal.objects.filter(create_user_id=user, personal_type='private').first().guid
+        signed, secret = TokenConfig.SIGNED, TokenConfig.SECRET
+        # Khóa ký giữ nguyên trong suốt scenario để token ký số kiểm tra được
+        TokenConfig.SECRET = secret or uuid.uuid4().hex
+        try:
+            TokenConfig.SIGNED = False
+            plain_token = TokenService().create_token(user, uuid.uuid4().hex, client_type=2)
+            TokenConfig.SIGNED = True
+            signed_token = TokenService().create_token(user, uuid.uuid4().hex, client_type=3)
+        finally:
+            TokenConfig.SIGNED = signed
+        token_read = re.compile(r'^SELECT .* FROM [`"]?token[`"]?\b')
+
+        def call(token):
+            def run(i):
+                request = factory.post(
+                    f'/api/ab/peers?ab={guid}',
+                    HTTP_AUTHORIZATION=f'Bearer {token}',
+                )
+                response = view_ab.ab_peers(request)
+                if response.status_code != 200:
+                    raise CommandError(f'/api/ab/peers -> {response.status_code}')
+
+            return run
+
+        cases = (
+            ('token thường (cache nguội)', plain_token, 1),
+            ('token thường (cache nóng)', plain_token, 0),
+            ('token ký số (cache nguội)', signed_token, 1),
+            ('token ký số (cache nóng)', signed_token, 0),
+        )
+        token_cache.clear()
+        for name, token, expected in cases:
+            with CaptureQueriesContext(connection) as queries:
+                call(token)(0)
+            reads = sum(1 for query in queries.captured_queries if token_read.match(query['sql']))
+            if reads != expected:
+                raise CommandError(f'{name}: {reads} lần đọc bảng token mỗi request, kỳ vọng {expected}')
+            self.stdout.write(f'  {name}: {len(queries)} truy vấn/request, {reads} lần đọc bảng token')
+
+        def cold(i):
+            token_cache.clear()
+            call(plain_token)(i)
+
+        self.report(f'auth /api/ab/peers x{requests}', {
+            'token thường': self.timeit(cold, requests),
+            'token thường + cache': self.timeit(call(plain_token), requests),
+            'token ký số': self.timeit(call(signed_token), requests),
+        })
+        TokenConfig.SECRET = secret
+
+    def bench_token_lookup(self, requests: int, rows: int, **options):
+        """
+        Độ trễ tra bảng ``token`` với ``rows`` bản ghi: theo ``token_hash`` (chỉ mục duy nhất),
+        theo ``uuid`` (chỉ mục) và theo khóa tự nhiên, so với quét toàn bảng (tương đương cột
+        ``token`` cũ không có chỉ mục).
+        """
+        user = User.objects.create_user(f'bench_{uuid.uuid4().hex[:8]}')
+        now = timezone.now()
+        hashes = [TokenService.hash_token(f'{uuid.uuid4().hex}_{user.username}') for _ in range(rows)]
+        Token.objects.bulk_create(
+            [
+                Token(user_id=user, uuid=f'bench-{i}', token_hash=token_hash, client_type=2, last_used_at=now)
+                for i, token_hash in enumerate(hashes)
+            ],
+            batch_size=2000,
+        )
+
+        def lookup(**filters):
+            def run(i):
+                key = i * 7919 % rows
+                values = {name: value(key) for name, value in filters.items()}
+                if Token.objects.filter(**values).first() is None:
+                    raise CommandError(f'Không tìm thấy token: {values}')
+
+            return run
+
+        scan_requests = min(requests, 50)
+        self.report(f'token lookup @ {rows} bản ghi', {
+            f'quét toàn bảng x{scan_requests}': self.timeit(
+                lookup(token_hash__iexact=lambda key: hashes[key]), scan_requests),
+            f'token_hash x{requests}': self.timeit(lookup(token_hash=lambda key: hashes[key]), requests),
+            f'uuid x{requests}': self.timeit(lookup(uuid=lambda key: f'bench-{key}'), requests),
+            f'(user, uuid, type) x{requests}': self.timeit(lookup(
+                user_id=lambda key: user.id, uuid=lambda key: f'bench-{key}', client_type=lambda key: 2,
+            ), requests),
+        })
+
+    def bench_revoke(self, devices: int, **options):
+        """
+        Thu hồi phiên của ``devices`` thiết bị (mỗi thiết bị một token và một ``LoginClient``) bằng
+        một lần gọi ``revoke_sessions``: kiểm tra số câu lệnh chỉ tăng theo số lô rồi đo thời gian.
+        """
+        batch_size = 900
+        users = [User.objects.create_user(f'bench_{uuid.uuid4().hex[:8]}') for _ in range(10)]
+        now = timezone.now()
+        uuids = [f'bench-{uuid.uuid4().hex}' for _ in range(devices)]
+        Token.objects.bulk_create(
+            [
+                Token(user_id=users[i % len(users)], uuid=device, client_type=2, last_used_at=now,
+                      token_hash=TokenService.hash_token(f'{uuid.uuid4().hex}_{users[i % len(users)].username}'))
+                for i, device in enumerate(uuids)
+            ],
+            batch_size=2000,
+        )
+        LoginClient.objects.bulk_create(
+            [
+                LoginClient(user_id=users[i % len(users)], uuid=device, peer_id=str(i), login_status=True)
+                for i, device in enumerate(uuids)
+            ],
+            batch_size=2000,
+        )
+
+        start = time.perf_counter()
+        with CaptureQueriesContext(connection) as queries:
+            result = TokenService().revoke_sessions(uuids=uuids, batch_size=batch_size)
+        elapsed = (time.perf_counter() - start) * 1000
+        if result['tokens'] != devices or result['logouts'] != devices:
+            raise CommandError(f'Thu hồi không đủ: {result}, kỳ vọng {devices} token và {devices} máy khách')
+        # Mỗi lô: đọc token, xóa token, cập nhật LoginClient (+ transaction)
+        limit = math.ceil(devices / batch_size) * 3 + 2
+        if len(queries) > limit:
+            raise CommandError(f'{len(queries)} câu lệnh cho {devices} thiết bị, tối đa {limit}')
+        self.stdout.write(f'revoke {devices} thiết bị')
+        self.stdout.write(f'  {len(queries)} câu lệnh, {elapsed:.1f} ms')
+
+    def bench_session(self, **options):
+        """
+        Đếm số lần ghi session trên 100 request dashboard (``/device/statuses`` không kèm
+        ``X-Session-No-Renew``) với từng backend: lưu mỗi request (cũ), gia hạn theo tỷ lệ
+        (session mới và session đã quá ngưỡng gia hạn).
+        """
+        user = User.objects.create_user(f'bench_{uuid.uuid4().hex[:8]}')
+        engines = ('db', 'cached_db', 'file', 'signed_cookies')
+        session_write = re.compile(r'^(INSERT INTO|UPDATE) [`"]?django_session[`"]?')
+        cookie = settings.SESSION_COOKIE_NAME
+
+        def run(engine, save_every_request, aged=False):
+            with override_settings(
+                SESSION_ENGINE=f'django.contrib.sessions.backends.{engine}',
+                SESSION_SAVE_EVERY_REQUEST=save_every_request,
+            ):
+                client = Client()
+                client.force_login(user)
+                # force_login không đi qua middleware: ghi thời điểm gia hạn như khi đăng nhập thật
+                session = client.session
+                session[OptOutSessionMiddleware.renewed_key] = int(time.time()) - (
+                    settings.SESSION_COOKIE_AGE if aged else 0)
+                session.save()
+                client.cookies[cookie] = session.session_key
+                saves = 0
+                with CaptureQueriesContext(connection) as queries:
+                    for i in range(100):
+                        response = client.get('/device/statuses', {'ids': f'bench{i}'})
+                        if response.status_code != 200:
+                            raise CommandError(f'/device/statuses -> {response.status_code}')
+                        saves += cookie in response.cookies
+                writes = sum(1 for query in queries.captured_queries if session_write.match(query['sql']))
+                client.logout()
+            return saves, writes
+
+        self.stdout.write('session / 100 request dashboard (lưu session, ghi bảng django_session)')
+        for engine in engines:
+            for name, save_every_request, aged, limit in (
+                ('mỗi request', True, False, None),
+                ('gia hạn theo tỷ lệ', False, False, 0),
+                ('gia hạn (quá ngưỡng)', False, True, 1),
+            ):
+                saves, writes = run(engine, save_every_request, aged)
+                if limit is not None and saves > limit:
+                    raise CommandError(f'{engine} / {name}: {saves} lần lưu session, tối đa {limit}')
+                self.stdout.write(f'  {engine:<16} {name:<22} {saves:>4} lần lưu  {writes:>4} lần ghi DB')
+
+    def bench_tags(self, requests: int, peers: int, **options):
+        """
+        Danh bạ ``peers`` thiết bị, mỗi thiết bị hai nhãn: kiểm tra ``TagService.get_tags_map`` và
+        ``/api/ab/peers`` (dựng lại, snapshot gzip, phân trang, stream, trả 304 theo ETag) có số truy vấn không phụ thuộc
+        số thiết bị (ngoài một cặp truy vấn alias/nhãn cho mỗi khối thiết bị) rồi đo thời gian và bộ nhớ đỉnh.
+        """
+        factory = RequestFactory()
+        user = UserService().create_user(f'bench_{uuid.uuid4().hex[:8]}', uuid.uuid4().hex)
+        personal = Personal.objects.filter(create_user_id=user, personal_type='private').first()
+        prefix = uuid.uuid4().hex[:8]
+        PeerInfo.objects.bulk_create(
+            [
+                PeerInfo(peer_id=f'{prefix}{i:06d}', uuid=f'{prefix}-{i}', cpu='', device_name=f'host{i}',
+                         memory='', os='linux', version='1')
+                for i in range(peers)
+            ],
+            batch_size=2000,
+        )
+        peer_rows = list(PeerInfo.objects.filter(peer_id__startswith=prefix).values_list('id', 'peer_id'))
+        PeerPersonal.objects.bulk_create(
+            [PeerPersonal(peer_id=pk, personal=personal) for pk, _ in peer_rows], batch_size=2000)
+        Tag.objects.bulk_create(
+            [Tag(tag=f'tag{i}', color='4288585374', guid=personal.guid) for i in range(20)])
+        tag_ids = list(Tag.objects.filter(guid=personal.guid).values_list('id', flat=True))
+        TagAssignment.objects.bulk_create(
+            [
+                TagAssignment(guid=personal.guid, peer_id=peer_id, tag_id=tag_ids[(i + k) % len(tag_ids)])
+                for i, (_, peer_id) in enumerate(peer_rows) for k in (0, 7)
+            ],
+            batch_size=2000,
+        )
+        peer_ids = [peer_id for _, peer_id in peer_rows]
+        token = TokenService().create_token(user, uuid.uuid4().hex, client_type=2)
+        service = TagService(guid=personal.guid, user=user)
+
+        def tags_map(i):
+            if len(service.get_tags_map(peer_ids)) != peers:
+                raise CommandError('get_tags_map thiếu thiết bị')
+
+        def ab_peers(i, etag=None, expected=200, rebuild=True, query=''):
+            if rebuild:
+                ab_snapshot_cache.clear()
+            headers = {'HTTP_ACCEPT_ENCODING': 'gzip'}
+            if etag:
+                headers['HTTP_IF_NONE_MATCH'] = etag
+            request = factory.post(f'/api/ab/peers?ab={personal.guid}{query}', HTTP_AUTHORIZATION=f'Bearer {token}',
+                                   **headers)
+            response = view_ab.ab_peers(request)
+            if response.status_code != expected:
+                raise CommandError(f'/api/ab/peers -> {response.status_code}, kỳ vọng {expected}')
+            if response.streaming:
+                # Đọc hết nội dung để truy vấn và tuần tự hóa được tính vào lần gọi
+                response.body = b''.join(response.streaming_content)
+            else:
+                response.body = response.content
+            return response
+
+        etag = ab_peers(0)['ETag']
+
+        def ab_peers_cached(i):
+            ab_peers(i, etag=etag, expected=304, rebuild=False)
+
+        def ab_peers_snapshot(i):
+            response = ab_peers(i, rebuild=False)
+            if response.get('Content-Encoding') != 'gzip':
+                raise CommandError('/api/ab/peers: snapshot không trả về gzip')
+
+        def ab_peers_page(i):
+            data = json.loads(ab_peers(i, rebuild=False, query='&current=2&pageSize=100').body)
+            if data['total'] != peers or len(data['data']) != min(100, max(peers - 100, 0)):
+                raise CommandError('/api/ab/peers: trang 2 sai total hoặc số thiết bị')
+
+        def ab_peers_stream(i):
+            snapshot_mb, AddressBookConfig.SNAPSHOT_CACHE_MB = AddressBookConfig.SNAPSHOT_CACHE_MB, 0
+            try:
+                data = json.loads(ab_peers(i, rebuild=False).body)
+            finally:
+                AddressBookConfig.SNAPSHOT_CACHE_MB = snapshot_mb
+            if data['total'] != peers or len(data['data']) != peers:
+                raise CommandError('/api/ab/peers: stream thiếu thiết bị')
+
+        chunks = math.ceil(peers / view_ab._PEERS_CHUNK_SIZE)
+        for name, func, limit in (
+            ('get_tags_map', tags_map, 2),
+            ('/api/ab/peers', ab_peers, 3 + 2 * chunks),
+            ('/api/ab/peers (snapshot)', ab_peers_snapshot, 3),
+            ('/api/ab/peers (trang)', ab_peers_page, 6),
+            ('/api/ab/peers (stream)', ab_peers_stream, 3 + 2 * chunks),
+            ('/api/ab/peers (304)', ab_peers_cached, 3),
+        ):
+            with CaptureQueriesContext(connection) as queries:
+                func(0)
+            if len(queries) > limit:
+                raise CommandError(f'{name}: {len(queries)} truy vấn với {peers} thiết bị, tối đa {limit}')
+            self.stdout.write(f'  {name}: {len(queries)} truy vấn @ {peers} thiết bị')
+
+        n = max(1, min(requests, 20))
+        self.report(f'tags @ {peers} thiết bị x{n}', {
+            'get_tags_map': self.timeit(tags_map, n),
+            '/api/ab/peers': self.timeit(ab_peers, n),
+            '/api/ab/peers (snapshot)': self.timeit(ab_peers_snapshot, n),
+            '/api/ab/peers (trang)': self.timeit(ab_peers_page, n),
+            '/api/ab/peers (stream)': self.timeit(ab_peers_stream, n),
+            '/api/ab/peers (304)': self.timeit(ab_peers_cached, n),
+        })
+        # Bộ nhớ đỉnh khi sinh nội dung stream, không tính bản sao nội dung response do benchmark gom lại
+        for name, query in (('trang', '&current=2&pageSize=100'), ('stream', '')):
+            snapshot_mb, AddressBookConfig.SNAPSHOT_CACHE_MB = AddressBookConfig.SNAPSHOT_CACHE_MB, 0
+            try:
+                request = factory.post(f'/api/ab/peers?ab={personal.guid}{query}',
+                                       HTTP_AUTHORIZATION=f'Bearer {token}')
+                tracemalloc.start()
+                size = sum(len(chunk) for chunk in view_ab.ab_peers(request).streaming_content)
+                peak = tracemalloc.get_traced_memory()[1]
+                tracemalloc.stop()
+            finally:
+                AddressBookConfig.SNAPSHOT_CACHE_MB = snapshot_mb
+            self.stdout.write(f'  {name}: {size} B nội dung, bộ nhớ đỉnh {peak / 1024:.0f} KiB')
+
+        # Thiết bị đổi tên máy qua sysinfo: ETag cũ và snapshot không được dùng lại
+        PeerInfoService().update(uuid=f'{prefix}-0', peer_id=f'{prefix}000000', cpu='', device_name='renamed',
+                                 memory='', os='linux', username='', version='1')
+        if b'"hostname": "renamed"' not in gzip.decompress(ab_peers(0, etag=etag, rebuild=False).body):
+            raise CommandError('/api/ab/peers: sysinfo đổi tên máy nhưng danh bạ vẫn trả dữ liệu cũ')
+        snapshot = ab_snapshot_cache.get(personal.guid)
+        self.stdout.write(f'  snapshot: json {len(snapshot["json"])} B, gzip {len(snapshot["gzip"])} B')
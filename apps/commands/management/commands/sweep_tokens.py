@@ -0,0 +1,47 @@
+from django.core.management.base import BaseCommand
+
+from apps.db.service import TokenService
+from common.env import TokenConfig
+
+
+class Command(BaseCommand):
+    help = 'Dọn token hết hạn và cập nhật trạng thái đăng xuất của máy khách'
+
+    def add_arguments(self, parser):
+        """添加命令行参数。
+
+        :param parser: 参数解析器对象
+        """
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=TokenConfig.SWEEP_BATCH_SIZE,
+            help='Số token xóa mỗi lô',
+        )
+        parser.add_argument(
+            '--pause-ms',
+            type=int,
+            default=TokenConfig.SWEEP_PAUSE_MS,
+            help='Thời gian nghỉ giữa các lô (ms)',
+        )
+        parser.add_argument(
+            '--timeout',
+            type=int,
+            default=TokenConfig.IDLE_TIMEOUT,
+            help='Thời gian rảnh tối đa của token thường (giây)',
+        )
+
+    def handle(self, *args, **options):
+        """处理命令逻辑。
+
+        :param options: 命令行选项字典
+        """
+        result = TokenService().sweep_expired(
+            batch_size=max(options['batch_size'], 1),
+            pause=max(options['pause_ms'], 0) / 1000,
+            timeout=options['timeout'],
+        )
+        self.stdout.write(
+            f"Đã xóa {result['tokens']} token hết hạn, {result['logouts']} máy khách chuyển sang đăng xuất, "
+            f"{result['revoked']} bản ghi thu hồi hết hạn"
+        )
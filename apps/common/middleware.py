@@ -1,5 +1,7 @@
+import time
 from typing import Optional
 
+from django.conf import settings
 from django.contrib.sessions.middleware import SessionMiddleware
 from django.utils.cache import patch_vary_headers
 
@@ -77,9 +79,34 @@ class OptOutSessionMiddleware(SessionMiddleware):
     :rtype: callable
     :notes:
         - 仅用于“只读/无副作用”的接口（如前端轮询），不要在会修改会话状态的请求上使用该头
-        - 未携带该请求头时，行为与 Django 原生 SessionMiddleware 完全一致
+        - 未携带该请求头时按剩余有效期续期：会话中记录上次续期时间，剩余有效期低于
+          ``SESSION_COOKIE_AGE * SESSION_RENEW_RATIO`` 时才标记修改并保存，其余请求不写会话
     """
 
+    renewed_key = '_renewed_at'
+
+    def renew(self, request):
+        """
+        按需续期会话：会话本身已被修改（如登录）时顺带记录续期时间；
+        否则仅当剩余有效期不足时写入续期时间，由父类保存会话并下发新 Cookie。
+
+        :param request: Django 请求对象
+        """
+        session = request.session
+        if not session.accessed or session.is_empty():
+            return
+        now = int(time.time())
+        if session.modified:
+            session[self.renewed_key] = now
+            return
+        ratio = getattr(settings, 'SESSION_RENEW_RATIO', 0)
+        if ratio <= 0:
+            return
+        age = settings.SESSION_COOKIE_AGE
+        remaining = session.get(self.renewed_key, 0) + age - now
+        if remaining < age * ratio:
+            session[self.renewed_key] = now
+
     def process_response(self, request, response):
         # 未创建/未访问 session：交给父类处理（或直接返回）
         if not hasattr(request, 'session'):
@@ -94,12 +121,13 @@ class OptOutSessionMiddleware(SessionMiddleware):
             no_renew = (request.META.get('HTTP_X_SESSION_NO_RENEW') == '1')
 
         if not no_renew:
-            # 正常请求：沿用原生行为
+            # 正常请求：按剩余有效期决定是否续期，保存与 Cookie 交给父类
+            self.renew(request)
             return super().process_response(request, response)
 
         # 禁续命请求：
         # 仅维护 Vary: Cookie（若访问过 session），但不触发保存与设置新 Cookie，
-        # 从而避免在 SAVE_EVERY_REQUEST=True 情况下“续命”。
+        # 即便开启了 SESSION_SAVE_EVERY_REQUEST 也不会“续命”。
         try:
             if getattr(request.session, 'accessed', False):
                 patch_vary_headers(response, ('Cookie',))
@@ -0,0 +1,87 @@
+import logging
+
+import django
+from django.core import signals
+from django.core.handlers.exception import response_for_exception
+from django.core.handlers.wsgi import WSGIHandler, get_script_name
+from django.urls import set_script_prefix
+
+from apps.common.middleware import RealIPMiddleware
+
+logger = logging.getLogger(__name__)
+
+
+def fast_path_routes() -> dict:
+    """
+    高频客户端接口的精简分发路由表。
+
+    视图取 ``__wrapped__``，即跳过 ``request_debug_log`` 装饰器，
+    仍保留 ``require_http_methods`` 的方法校验。
+
+    :return: ``{PATH_INFO: 视图函数}``
+    :rtype: dict
+    """
+    from apps.client_apis import views, view_audit
+
+    return {
+        '/api/heartbeat': views.heartbeat.__wrapped__,
+        '/api/sysinfo': views.sysinfo.__wrapped__,
+        '/api/audit/conn': view_audit.audit_conn.__wrapped__,
+    }
+
+
+class FastPathWSGIHandler(WSGIHandler):
+    """
+    带精简分发路径的 WSGI 处理器。
+
+    命中 ``routes`` 的请求不经过 URL 解析与中间件链（DebugToolbar、WhiteNoise、
+    Session、Auth、Messages、XFrameOptions 等），只做真实 IP 提取后直接调用视图；
+    其余请求仍走 Django 完整处理流程。``request_started``/``request_finished``
+    信号照常发送，数据库连接的回收行为与完整流程一致。
+
+    :param dict routes: ``{PATH_INFO: 视图函数}``
+    """
+
+    def __init__(self, routes: dict, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.fast_routes = routes
+
+    def __call__(self, environ, start_response):
+        view = self.fast_routes.get(environ.get('PATH_INFO'))
+        if view is None:
+            return super().__call__(environ, start_response)
+
+        set_script_prefix(get_script_name(environ))
+        signals.request_started.send(sender=self.__class__, environ=environ)
+        request = self.request_class(environ)
+        client_ip = RealIPMiddleware._extract_client_ip(request)
+        if client_ip:
+            request.META['CLIENT_IP'] = client_ip
+            setattr(request, 'client_ip', client_ip)
+        try:
+            response = view(request)
+        except Exception as exc:
+            response = response_for_exception(request, exc)
+        response._resource_closers.append(request.close)
+        response._handler_class = self.__class__
+
+        status = "%d %s" % (response.status_code, response.reason_phrase)
+        response_headers = [
+            *response.items(),
+            *(("Set-Cookie", c.output(header="")) for c in response.cookies.values()),
+        ]
+        start_response(status, response_headers)
+        return response
+
+
+def get_fast_path_wsgi_application() -> FastPathWSGIHandler:
+    """
+    与 ``django.core.wsgi.get_wsgi_application`` 相同，但返回带精简分发路径的处理器。
+
+    :return: WSGI 可调用对象
+    :rtype: FastPathWSGIHandler
+    """
+    django.setup(set_prefix=False)
+    routes = fast_path_routes()
+    logger.debug(f'[wsgi] fast path enabled: {list(routes)}')
+    return FastPathWSGIHandler(routes)
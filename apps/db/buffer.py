@@ -0,0 +1,333 @@
+import logging
+import os
+import threading
+
+from django.db import close_old_connections, transaction
+from django.db.models import Q
+from django.utils import timezone
+
+from apps.db.models import HeartBeat, PeerInfo, PeerUptime, Token
+from common.env import HeartBeatConfig, TokenConfig
+
+logger = logging.getLogger(__name__)
+
+# Danh sách bộ đệm đã khởi tạo trong tiến trình, dùng khi flush lúc tắt worker
+_buffers: list['WriteBehindBuffer'] = []
+
+
+class WriteBehindBuffer:
+    """
+    Bộ đệm ghi trễ (write-behind) trong tiến trình.
+
+    Các bản ghi được gom theo khóa (ghi sau đè ghi trước, có thể đổi qua ``merge``),
+    một luồng nền sẽ gọi ``write`` cho toàn bộ tập đã gộp trong một transaction
+    mỗi ``flush_interval_ms`` mili giây hoặc khi số khóa đạt ``flush_max_entries``.
+
+    :param flush_interval_ms: Chu kỳ flush (mili giây)
+    :param flush_max_entries: Số khóa chờ tối đa trước khi flush ngay
+    :param max_size: Số khóa tối đa trong bộ đệm; vượt quá thì bỏ bản ghi của khóa mới
+    """
+
+    name = 'buffer'
+
+    def __init__(self, flush_interval_ms=1000, flush_max_entries=500, max_size=20000):
+        self.flush_interval = max(flush_interval_ms, 10) / 1000
+        self.flush_max_entries = max(flush_max_entries, 1)
+        self.max_size = max(max_size, 1)
+        self._items = {}
+        self._lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._stopped = threading.Event()
+        self._thread: threading.Thread | None = None
+        self._pid = None
+        self._counters = {
+            'received': 0,
+            'coalesced': 0,
+            'dropped': 0,
+            'flushed': 0,
+            'flush_errors': 0,
+        }
+        _buffers.append(self)
+
+    def put(self, key, value) -> bool:
+        """
+        Đưa một bản ghi vào bộ đệm.
+
+        :param key: Khóa gộp bản ghi
+        :param value: Giá trị cần ghi
+        :returns: ``False`` nếu bộ đệm đầy và bản ghi bị bỏ
+        """
+        self._ensure_started()
+        with self._lock:
+            self._counters['received'] += 1
+            if key in self._items:
+                self._items[key] = self.merge(self._items[key], value)
+                self._counters['coalesced'] += 1
+            elif len(self._items) >= self.max_size:
+                self._counters['dropped'] += 1
+                self._wakeup.set()
+                return False
+            else:
+                self._items[key] = value
+            size = len(self._items)
+        if size >= self.flush_max_entries:
+            self._wakeup.set()
+        return True
+
+    def merge(self, old, new):
+        """
+        Gộp hai bản ghi cùng khóa, mặc định giữ bản mới nhất.
+        """
+        return new
+
+    def write(self, items: dict):
+        """
+        Ghi tập bản ghi đã gộp xuống DB, được gọi bên trong transaction.
+
+        :param items: Map {khóa: giá trị}
+        """
+        raise NotImplementedError
+
+    def flush(self) -> int:
+        """
+        Ghi toàn bộ bản ghi đang chờ xuống DB.
+
+        Nếu ghi lỗi, các bản ghi được trả lại bộ đệm để lần flush sau thử lại; khóa đã có bản mới hơn
+        được gộp qua ``merge`` (bản cũ trước, bản mới sau).
+
+        :returns: Số khóa đã ghi
+        """
+        with self._lock:
+            if not self._items:
+                return 0
+            items, self._items = self._items, {}
+        try:
+            with transaction.atomic():
+                self.write(items)
+        except Exception:
+            logger.exception(f'[{self.name}] flush thất bại, {len(items)} bản ghi được giữ lại')
+            with self._lock:
+                self._counters['flush_errors'] += 1
+                for key, value in items.items():
+                    if key in self._items:
+                        self._items[key] = self.merge(value, self._items[key])
+                    elif len(self._items) < self.max_size:
+                        self._items[key] = value
+            return 0
+        with self._lock:
+            self._counters['flushed'] += len(items)
+        logger.debug(f'[{self.name}] flush {len(items)} bản ghi')
+        return len(items)
+
+    def stats(self) -> dict:
+        """
+        Bộ đếm của bộ đệm (theo worker).
+
+        :returns: Dict gồm received/coalesced/dropped/flushed/flush_errors/pending
+        """
+        with self._lock:
+            return {**self._counters, 'pending': len(self._items)}
+
+    def stop(self, timeout=5):
+        """
+        Dừng luồng nền và flush phần còn lại.
+        """
+        self._stopped.set()
+        self._wakeup.set()
+        if self._thread and self._thread.is_alive() and self._thread is not threading.current_thread():
+            self._thread.join(timeout)
+        self.flush()
+
+    def _ensure_started(self):
+        # preload_app=True: luồng tạo ở master không tồn tại sau fork, nên khởi động lười theo pid
+        if self._pid == os.getpid():
+            return
+        with self._lock:
+            if self._pid == os.getpid():
+                return
+            self._stopped.clear()
+            self._thread = threading.Thread(target=self._run, name=f'{self.name}-flusher', daemon=True)
+            self._thread.start()
+            self._pid = os.getpid()
+
+    def _run(self):
+        while not self._stopped.is_set():
+            self._wakeup.wait(self.flush_interval)
+            self._wakeup.clear()
+            close_old_connections()
+            self.flush()
+
+
+class HeartBeatBuffer(WriteBehindBuffer):
+    """
+    Bộ đệm heartbeat: gộp theo uuid, ghi sau đè ghi trước.
+    """
+
+    name = 'heartbeat'
+    fields = ['peer_id', 'uuid', 'ver', 'modified_at', 'timestamp']
+
+    def write(self, items: dict):
+        peer_ids = [beat['peer_id'] for beat in items.values() if beat.get('peer_id')]
+        existing = list(HeartBeat.objects.filter(Q(uuid__in=list(items)) | Q(peer_id__in=peer_ids)))
+        by_uuid = {hb.uuid: hb for hb in existing}
+        by_peer_id = {hb.peer_id: hb for hb in existing}
+
+        to_update: dict[int, HeartBeat] = {}
+        to_create: dict[str, HeartBeat] = {}
+        created_by_peer_id: dict[str, str] = {}
+        for uuid, beat in items.items():
+            peer_id = beat.get('peer_id')
+            hb = by_uuid.get(uuid) or (by_peer_id.get(peer_id) if peer_id else None)
+            if hb is None:
+                if not peer_id:
+                    # peer_id bắt buộc và duy nhất: thiết bị mới chưa có peer_id chỉ ghi trạng thái trực tuyến
+                    continue
+                # Bản ghi mới theo uuid; cùng peer_id khác uuid trong một lô: giữ bản sau, tránh trùng khóa duy nhất
+                to_create.pop(created_by_peer_id.get(peer_id), None)
+                created_by_peer_id[peer_id] = uuid
+                hb = to_create[uuid] = HeartBeat()
+            else:
+                to_update[hb.pk] = hb
+            hb.uuid = uuid
+            hb.peer_id = peer_id
+            hb.ver = beat.get('ver')
+            hb.modified_at = beat['modified_at']
+            hb.timestamp = beat['modified_at']
+
+        if to_update:
+            HeartBeat.objects.bulk_update(list(to_update.values()), self.fields, batch_size=500)
+        if to_create:
+            HeartBeat.objects.bulk_create(list(to_create.values()), batch_size=500)
+        self._write_presence(items, peer_ids)
+
+    @staticmethod
+    def _write_presence(items: dict, peer_ids: list[str]):
+        # Cập nhật cột trạng thái trực tuyến của PeerInfo trong cùng transaction
+        peers = list(PeerInfo.objects.filter(Q(uuid__in=list(items)) | Q(peer_id__in=peer_ids)))
+        if not peers:
+            return
+        beat_by_peer_id = {beat.get('peer_id'): beat for beat in items.values() if beat.get('peer_id')}
+        changed = []
+        for peer in peers:
+            beat = items.get(peer.uuid) or beat_by_peer_id.get(peer.peer_id)
+            if beat is None:
+                continue
+            peer.last_seen_at = beat['modified_at']
+            peer.last_version = beat.get('ver')
+            changed.append(peer)
+        PeerInfo.objects.bulk_update(changed, ['last_seen_at', 'last_version'], batch_size=500)
+
+
+class UptimeBuffer(WriteBehindBuffer):
+    """
+    Bộ đệm bitmap trực tuyến: gộp theo (peer_id, ngày), các bit phút được OR với nhau.
+
+    Giá trị trong bộ đệm là số nguyên 1440 bit (bit cao nhất là phút 00:00), khi ghi
+    được OR với bitmap đã có trong DB rồi lưu lại dạng 180 byte.
+    """
+
+    name = 'uptime'
+    size = PeerUptime.SLOTS // 8
+
+    def mark(self, peer_id, seen_at) -> bool:
+        """
+        Đánh dấu thiết bị trực tuyến tại phút chứa ``seen_at`` (theo giờ địa phương).
+
+        :param peer_id: ID thiết bị
+        :param seen_at: Thời điểm heartbeat
+        :returns: ``False`` nếu không ghi nhận (thiếu peer_id hoặc bộ đệm đầy)
+        """
+        if not peer_id:
+            return False
+        local = timezone.localtime(seen_at)
+        slot = local.hour * 60 + local.minute
+        return self.put((peer_id, local.date()), 1 << (PeerUptime.SLOTS - 1 - slot))
+
+    def merge(self, old, new):
+        return old | new
+
+    def write(self, items: dict):
+        peer_ids = {peer_id for peer_id, _ in items}
+        days = {day for _, day in items}
+        existing = {
+            (row.peer_id, row.day): row
+            for row in PeerUptime.objects.select_for_update().filter(peer_id__in=peer_ids, day__in=days)
+        }
+        now = timezone.now()
+        to_update, to_create = [], []
+        for (peer_id, day), bits in items.items():
+            row = existing.get((peer_id, day))
+            if row is None:
+                to_create.append(PeerUptime(peer_id=peer_id, day=day, bitmap=bits.to_bytes(self.size, 'big'),
+                                            updated_at=now))
+                continue
+            row.bitmap = (int.from_bytes(row.bitmap, 'big') | bits).to_bytes(self.size, 'big')
+            row.updated_at = now
+            to_update.append(row)
+
+        if to_update:
+            PeerUptime.objects.bulk_update(to_update, ['bitmap', 'updated_at'], batch_size=500)
+        if to_create:
+            # Worker khác tạo cùng (peer_id, ngày) sẽ gây lỗi khóa duy nhất: lô được giữ lại và OR ở lần flush sau
+            PeerUptime.objects.bulk_create(to_create, batch_size=500)
+
+
+class TokenTouchBuffer(WriteBehindBuffer):
+    """
+    Bộ đệm ghi ``last_used_at`` của token: gộp theo id bản ghi (token thường) hoặc mã băm token
+    (token ký số, không đọc bảng), cả lô được ghi bằng một câu ``UPDATE ... WHERE id IN (...)``.
+
+    Thời điểm ghi là lần dùng muộn nhất trong lô; độ lệch tối đa bằng chu kỳ flush,
+    không đáng kể so với thời gian hết hạn token.
+    """
+
+    name = 'token-touch'
+
+    def touch(self, key: int | str, used_at) -> bool:
+        """
+        Ghi nhận token vừa được dùng.
+
+        :param key: id bản ghi token, hoặc mã băm token với token ký số
+        :param used_at: Thời điểm sử dụng
+        :returns: ``False`` nếu bộ đệm đầy
+        """
+        return self.put(key, used_at)
+
+    def merge(self, old, new):
+        return max(old, new)
+
+    def write(self, items: dict):
+        ids = [key for key in items if isinstance(key, int)]
+        token_hashes = [key for key in items if isinstance(key, str)]
+        Token.objects.filter(Q(id__in=ids) | Q(token_hash__in=token_hashes)).update(last_used_at=max(items.values()))
+
+
+def flush_all():
+    """
+    Dừng và flush mọi bộ đệm của tiến trình hiện tại (dùng khi worker thoát).
+    """
+    for buffer in _buffers:
+        try:
+            buffer.stop()
+            logger.info(f'[{buffer.name}] flush khi thoát: {buffer.stats()}')
+        except Exception:
+            logger.exception(f'[{buffer.name}] flush khi thoát thất bại')
+
+
+heartbeat_buffer = HeartBeatBuffer(
+    flush_interval_ms=HeartBeatConfig.FLUSH_INTERVAL_MS,
+    flush_max_entries=HeartBeatConfig.FLUSH_MAX_ENTRIES,
+    max_size=HeartBeatConfig.BUFFER_MAX_SIZE,
+)
+
+uptime_buffer = UptimeBuffer(
+    flush_interval_ms=HeartBeatConfig.UPTIME_FLUSH_INTERVAL_MS,
+    flush_max_entries=HeartBeatConfig.BUFFER_MAX_SIZE,
+    max_size=HeartBeatConfig.BUFFER_MAX_SIZE,
+)
+
+token_touch_buffer = TokenTouchBuffer(
+    flush_interval_ms=TokenConfig.TOUCH_FLUSH_INTERVAL_MS,
+    flush_max_entries=HeartBeatConfig.FLUSH_MAX_ENTRIES,
+    max_size=HeartBeatConfig.BUFFER_MAX_SIZE,
+)
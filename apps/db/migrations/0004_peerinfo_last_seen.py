@@ -0,0 +1,38 @@
+from django.db import migrations, models
+from django.db.models import OuterRef, Subquery
+
+
+def backfill_last_seen(apps, schema_editor):
+    """
+    Điền last_seen_at/last_version từ bảng heartbeat hiện có (khớp theo uuid, sau đó theo peer_id).
+    """
+    HeartBeat = apps.get_model('db', 'HeartBeat')
+    PeerInfo = apps.get_model('db', 'PeerInfo')
+
+    for field in ('uuid', 'peer_id'):
+        hb = HeartBeat.objects.filter(**{field: OuterRef(field)}).order_by('-modified_at')
+        PeerInfo.objects.filter(last_seen_at__isnull=True).update(
+            last_seen_at=Subquery(hb.values('modified_at')[:1]),
+            last_version=Subquery(hb.values('ver')[:1]),
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('db', '0003_merge_20260129_0001'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='peerinfo',
+            name='last_seen_at',
+            field=models.DateTimeField(blank=True, db_index=True, null=True, verbose_name='Lần cuối trực tuyến'),
+        ),
+        migrations.AddField(
+            model_name='peerinfo',
+            name='last_version',
+            field=models.CharField(blank=True, max_length=50, null=True, verbose_name='Phiên bản heartbeat cuối'),
+        ),
+        migrations.RunPython(backfill_last_seen, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,16 @@
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('db', '0004_peerinfo_last_seen'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='peerinfo',
+            name='sysinfo_hash',
+            field=models.CharField(blank=True, max_length=64, null=True, verbose_name='Mã băm sysinfo'),
+        ),
+    ]
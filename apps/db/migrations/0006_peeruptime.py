@@ -0,0 +1,28 @@
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('db', '0005_peerinfo_sysinfo_hash'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PeerUptime',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('peer_id', models.CharField(max_length=255, verbose_name='ID máy khách')),
+                ('day', models.DateField(db_index=True, verbose_name='Ngày')),
+                ('bitmap', models.BinaryField(max_length=180, verbose_name='Bitmap trực tuyến theo phút')),
+                ('updated_at', models.DateTimeField(auto_now=True, verbose_name='Thời gian cập nhật')),
+            ],
+            options={
+                'verbose_name': 'Lịch sử trực tuyến',
+                'verbose_name_plural': 'Lịch sử trực tuyến',
+                'db_table': 'peer_uptime',
+                'ordering': ['-day'],
+                'unique_together': {('peer_id', 'day')},
+            },
+        ),
+    ]
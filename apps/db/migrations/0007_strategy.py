@@ -0,0 +1,63 @@
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('db', '0006_peeruptime'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Strategy',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=50, unique=True, verbose_name='Tên chiến lược')),
+                ('config_options', models.JSONField(default=dict, verbose_name='Tùy chọn cấu hình')),
+                ('version', models.BigIntegerField(default=0, verbose_name='Phiên bản')),
+                ('created_at', models.DateTimeField(auto_now_add=True, verbose_name='Thời gian tạo')),
+                ('updated_at', models.DateTimeField(auto_now=True, verbose_name='Thời gian cập nhật')),
+            ],
+            options={
+                'verbose_name': 'Chiến lược',
+                'verbose_name_plural': 'Chiến lược',
+                'db_table': 'strategy',
+                'ordering': ['name'],
+            },
+        ),
+        migrations.CreateModel(
+            name='StrategyAssignment',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('target_type', models.CharField(choices=[('device', 'Thiết bị'), ('user', 'Người dùng'), ('group', 'Nhóm')], max_length=10, verbose_name='Loại đối tượng')),
+                ('target', models.CharField(max_length=255, verbose_name='Đối tượng')),
+                ('created_at', models.DateTimeField(auto_now_add=True, verbose_name='Thời gian tạo')),
+                ('strategy', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='assignments', to='db.strategy', verbose_name='Chiến lược')),
+            ],
+            options={
+                'verbose_name': 'Phân bổ chiến lược',
+                'verbose_name_plural': 'Phân bổ chiến lược',
+                'db_table': 'strategy_assignment',
+                'unique_together': {('target_type', 'target')},
+            },
+        ),
+        migrations.CreateModel(
+            name='PeerStrategy',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('uuid', models.CharField(max_length=255, unique=True, verbose_name='UUID thiết bị')),
+                ('peer_id', models.CharField(max_length=255, verbose_name='ID máy khách')),
+                ('config_options', models.JSONField(default=dict, verbose_name='Tùy chọn cấu hình hiệu lực')),
+                ('config_hash', models.CharField(max_length=64, verbose_name='Mã băm cấu hình')),
+                ('version', models.BigIntegerField(default=0, verbose_name='Phiên bản hiệu lực')),
+                ('applied_version', models.BigIntegerField(default=0, verbose_name='Phiên bản máy khách đã áp dụng')),
+                ('updated_at', models.DateTimeField(auto_now=True, verbose_name='Thời gian cập nhật')),
+            ],
+            options={
+                'verbose_name': 'Chiến lược hiệu lực của thiết bị',
+                'verbose_name_plural': 'Chiến lược hiệu lực của thiết bị',
+                'db_table': 'peer_strategy',
+            },
+        ),
+    ]
@@ -0,0 +1,25 @@
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('db', '0007_strategy'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RevokedToken',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('signature', models.CharField(max_length=64, unique=True, verbose_name='Chữ ký token')),
+                ('expires_at', models.DateTimeField(db_index=True, verbose_name='Thời gian hết hạn')),
+                ('created_at', models.DateTimeField(auto_now_add=True, verbose_name='Thời gian tạo')),
+            ],
+            options={
+                'verbose_name': 'Token đã thu hồi',
+                'verbose_name_plural': 'Token đã thu hồi',
+                'db_table': 'revoked_token',
+            },
+        ),
+    ]
@@ -0,0 +1,17 @@
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('db', '0008_revokedtoken'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='token',
+            name='last_used_at',
+            field=models.DateTimeField(default=django.utils.timezone.now, verbose_name='Thời gian sử dụng cuối'),
+        ),
+    ]
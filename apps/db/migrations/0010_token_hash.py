@@ -0,0 +1,86 @@
+import base64
+import hashlib
+from datetime import datetime, timezone
+
+from django.db import migrations, models
+
+
+def _signed_expires_at(token):
+    # 签名令牌 s1.<base32 payload>.<签名>_<用户名>，payload 第 4 段为过期时间戳
+    if not token.startswith('s1.'):
+        return None
+    try:
+        payload = token.split('_', 1)[0].split('.')[1]
+        raw = base64.b32decode(payload + '=' * (-len(payload) % 8)).decode()
+        return datetime.fromtimestamp(int(raw.split('|', 4)[3]), tz=timezone.utc)
+    except (IndexError, ValueError):
+        return None
+
+
+def hash_tokens(apps, schema_editor):
+    Token = apps.get_model('db', 'Token')
+    rows = list(Token.objects.only('id', 'token'))
+    for row in rows:
+        row.token_hash = hashlib.sha256(row.token.encode()).hexdigest()
+        row.expires_at = _signed_expires_at(row.token)
+    Token.objects.bulk_update(rows, ['token_hash', 'expires_at'], batch_size=500)
+
+
+def drop_duplicate_tokens(apps, schema_editor):
+    # 重复令牌无法区分归属，只保留最新一条
+    Token = apps.get_model('db', 'Token')
+    seen = set()
+    for row in Token.objects.order_by('-created_at', '-id').only('id', 'token'):
+        if row.token in seen:
+            row.delete()
+        seen.add(row.token)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('db', '0009_token_last_used_at'),
+    ]
+
+    operations = [
+        migrations.RunPython(drop_duplicate_tokens, migrations.RunPython.noop),
+        migrations.AddField(
+            model_name='token',
+            name='token_hash',
+            field=models.CharField(max_length=64, null=True, verbose_name='Mã băm token'),
+        ),
+        migrations.AddField(
+            model_name='token',
+            name='expires_at',
+            field=models.DateTimeField(blank=True, null=True, verbose_name='Thời gian hết hạn'),
+        ),
+        migrations.RunPython(hash_tokens, migrations.RunPython.noop),
+        migrations.RemoveField(
+            model_name='token',
+            name='token',
+        ),
+        migrations.AlterField(
+            model_name='token',
+            name='token_hash',
+            field=models.CharField(max_length=64, unique=True, verbose_name='Mã băm token'),
+        ),
+        migrations.AlterField(
+            model_name='token',
+            name='uuid',
+            field=models.CharField(db_index=True, max_length=255, verbose_name='UUID thiết bị'),
+        ),
+        migrations.AlterUniqueTogether(
+            name='token',
+            unique_together={('user_id', 'uuid', 'client_type')},
+        ),
+        migrations.RenameField(
+            model_name='revokedtoken',
+            old_name='signature',
+            new_name='token_hash',
+        ),
+        migrations.AlterField(
+            model_name='revokedtoken',
+            name='token_hash',
+            field=models.CharField(max_length=64, unique=True, verbose_name='Mã băm token'),
+        ),
+    ]
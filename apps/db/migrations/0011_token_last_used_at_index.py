@@ -0,0 +1,18 @@
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('db', '0010_token_hash'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='token',
+            name='last_used_at',
+            field=models.DateTimeField(db_index=True, default=django.utils.timezone.now,
+                                       verbose_name='Thời gian sử dụng cuối'),
+        ),
+    ]
@@ -0,0 +1,29 @@
+from django.db import migrations
+
+
+def drop_duplicate_clients(apps, schema_editor):
+    # 同一用户同一设备只保留最新一条登录记录
+    LoginClient = apps.get_model('db', 'LoginClient')
+    seen = set()
+    duplicates = []
+    for row_id, user_id, uuid in LoginClient.objects.order_by('-id').values_list('id', 'user_id', 'uuid'):
+        if (user_id, uuid) in seen:
+            duplicates.append(row_id)
+        seen.add((user_id, uuid))
+    for i in range(0, len(duplicates), 500):
+        LoginClient.objects.filter(id__in=duplicates[i:i + 500]).delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('db', '0011_token_last_used_at_index'),
+    ]
+
+    operations = [
+        migrations.RunPython(drop_duplicate_clients, migrations.RunPython.noop),
+        migrations.AlterUniqueTogether(
+            name='loginclient',
+            unique_together={('user_id', 'uuid')},
+        ),
+    ]
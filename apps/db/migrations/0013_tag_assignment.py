@@ -0,0 +1,85 @@
+import ast
+import json
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+# 网页端按名称新建的标签使用的默认颜色（0xFF9E9E9E，RustDesk 客户端颜色为 ARGB 整数）
+DEFAULT_TAG_COLOR = '4288585374'
+
+
+def _parse(raw):
+    """
+    解析 client_tags.tags 的三种历史格式
+
+    :returns: (是否为标签 ID, 值列表)：客户端写入的 ``str([1, 2])`` 与 JSON 列表为标签 ID，
+        网页端写入的逗号分隔文本为标签名称
+    """
+    text = str(raw or '').strip()
+    if not text:
+        return False, []
+    for loads in (json.loads, ast.literal_eval):
+        try:
+            value = loads(text)
+        except (ValueError, SyntaxError):
+            continue
+        if isinstance(value, list):
+            return True, [str(item).strip() for item in value if str(item).strip()]
+    return False, [part.strip() for part in text.split(',') if part.strip()]
+
+
+def convert_client_tags(apps, schema_editor):
+    ClientTags = apps.get_model('db', 'ClientTags')
+    Tag = apps.get_model('db', 'Tag')
+    TagAssignment = apps.get_model('db', 'TagAssignment')
+    rows = list(ClientTags.objects.values_list('guid', 'peer_id', 'tags'))
+    guids = {guid for guid, _, _ in rows}
+    tags = {(tag.guid, tag.tag): tag.id for tag in Tag.objects.filter(guid__in=guids)}
+    ids = {(guid, str(tag_id)) for (guid, _), tag_id in tags.items()}
+    pairs = set()
+    for guid, peer_id, raw in rows:
+        by_id, values = _parse(raw)
+        for value in values:
+            if by_id:
+                if (guid, value) in ids:
+                    pairs.add((guid, peer_id, int(value)))
+                continue
+            if (guid, value) not in tags:
+                tags[(guid, value)] = Tag.objects.create(tag=value, color=DEFAULT_TAG_COLOR, guid=guid).id
+            pairs.add((guid, peer_id, tags[(guid, value)]))
+    TagAssignment.objects.bulk_create(
+        [TagAssignment(guid=guid, peer_id=peer_id, tag_id=tag_id) for guid, peer_id, tag_id in pairs],
+        batch_size=500,
+        ignore_conflicts=True,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('db', '0012_loginclient_unique'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='TagAssignment',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('peer_id', models.CharField(max_length=255, verbose_name='ID thiết bị')),
+                ('guid', models.CharField(max_length=50, verbose_name='GUID')),
+                ('tag', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='assignments',
+                                          to='db.tag', verbose_name='Thẻ')),
+            ],
+            options={
+                'verbose_name': 'Gán thẻ',
+                'verbose_name_plural': 'Gán thẻ',
+                'db_table': 'tag_assignment',
+                'unique_together': {('guid', 'peer_id', 'tag')},
+                'indexes': [models.Index(fields=['guid', 'tag'], name='tag_assignment_guid_tag')],
+            },
+        ),
+        migrations.RunPython(convert_client_tags, migrations.RunPython.noop),
+        migrations.DeleteModel(
+            name='ClientTags',
+        ),
+    ]
@@ -0,0 +1,16 @@
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('db', '0013_tag_assignment'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='personal',
+            name='revision',
+            field=models.BigIntegerField(default=0, verbose_name='Phiên bản nội dung'),
+        ),
+    ]
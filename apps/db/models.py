@@ -1,5 +1,6 @@
 from django.contrib.auth.models import User, Group, AbstractUser
 from django.db import models
+from django.utils import timezone
 
 from common.utils import get_uuid
 
@@ -38,6 +39,11 @@ class PeerInfo(models.Model):
     # uuid = models.ForeignKey(HeartBeat, to_field='uuid', on_delete=models.CASCADE, verbose_name='设备UUID')
     version = models.CharField(max_length=50, verbose_name='Phiên bản máy khách')
     created_at = models.DateTimeField(auto_now_add=True, verbose_name='Thời gian ghi')
+    # 在线状态冗余列：由心跳路径维护，在线/离线筛选与排序只需范围查询
+    last_seen_at = models.DateTimeField(null=True, blank=True, db_index=True, verbose_name='Lần cuối trực tuyến')
+    last_version = models.CharField(max_length=50, null=True, blank=True, verbose_name='Phiên bản heartbeat cuối')
+    # 归一化后的 sysinfo 摘要，内容未变化时跳过整行重写
+    sysinfo_hash = models.CharField(max_length=64, null=True, blank=True, verbose_name='Mã băm sysinfo')
 
     class Meta:
         verbose_name = 'Thông tin máy khách báo cáo'
@@ -50,6 +56,95 @@ class PeerInfo(models.Model):
         return f'{self.device_name}-({self.uuid})'
 
 
+class PeerUptime(models.Model):
+    """
+    设备每日在线位图：每分钟 1 位（当地时间 00:00 起），共 1440 位 / 180 字节
+    """
+    SLOTS = 1440
+
+    peer_id = models.CharField(max_length=255, verbose_name='ID máy khách')
+    day = models.DateField(verbose_name='Ngày', db_index=True)
+    # 第 n 分钟对应第 n // 8 字节的第 n % 8 位（高位在前）
+    bitmap = models.BinaryField(max_length=180, verbose_name='Bitmap trực tuyến theo phút')
+    updated_at = models.DateTimeField(auto_now=True, verbose_name='Thời gian cập nhật')
+
+    class Meta:
+        verbose_name = 'Lịch sử trực tuyến'
+        verbose_name_plural = verbose_name
+        ordering = ['-day']
+        db_table = 'peer_uptime'
+        unique_together = [['peer_id', 'day']]
+
+    def __str__(self):
+        return f'{self.peer_id}-{self.day}'
+
+
+class Strategy(models.Model):
+    """
+    客户端配置策略（下发到客户端的 config_options）
+    """
+    name = models.CharField(max_length=50, unique=True, verbose_name='Tên chiến lược')
+    config_options = models.JSONField(default=dict, verbose_name='Tùy chọn cấu hình')
+    # 单调递增：每次修改取 max(旧版本 + 1, 当前时间戳)
+    version = models.BigIntegerField(default=0, verbose_name='Phiên bản')
+    created_at = models.DateTimeField(auto_now_add=True, verbose_name='Thời gian tạo')
+    updated_at = models.DateTimeField(auto_now=True, verbose_name='Thời gian cập nhật')
+
+    class Meta:
+        verbose_name = 'Chiến lược'
+        verbose_name_plural = verbose_name
+        ordering = ['name']
+        db_table = 'strategy'
+
+    def __str__(self):
+        return f'{self.name}-v{self.version}'
+
+
+class StrategyAssignment(models.Model):
+    """
+    策略分配：设备 > 用户 > 用户组，每个对象最多分配一个策略
+    """
+    strategy = models.ForeignKey(Strategy, on_delete=models.CASCADE, related_name='assignments',
+                                 verbose_name='Chiến lược')
+    target_type = models.CharField(max_length=10, verbose_name='Loại đối tượng',
+                                   choices=[('device', 'Thiết bị'), ('user', 'Người dùng'), ('group', 'Nhóm')])
+    # 设备为 peer_id，用户为用户名，用户组为组名
+    target = models.CharField(max_length=255, verbose_name='Đối tượng')
+    created_at = models.DateTimeField(auto_now_add=True, verbose_name='Thời gian tạo')
+
+    class Meta:
+        verbose_name = 'Phân bổ chiến lược'
+        verbose_name_plural = verbose_name
+        db_table = 'strategy_assignment'
+        unique_together = [['target_type', 'target']]
+
+    def __str__(self):
+        return f'{self.target_type}:{self.target}->{self.strategy_id}'
+
+
+class PeerStrategy(models.Model):
+    """
+    设备生效策略（预计算）：心跳只需比较版本号
+    """
+    uuid = models.CharField(max_length=255, unique=True, verbose_name='UUID thiết bị')
+    peer_id = models.CharField(max_length=255, verbose_name='ID máy khách')
+    config_options = models.JSONField(default=dict, verbose_name='Tùy chọn cấu hình hiệu lực')
+    config_hash = models.CharField(max_length=64, verbose_name='Mã băm cấu hình')
+    # 生效配置变化时单调递增，作为心跳响应的 modified_at
+    version = models.BigIntegerField(default=0, verbose_name='Phiên bản hiệu lực')
+    # 客户端心跳上报的 modified_at，即已应用的版本
+    applied_version = models.BigIntegerField(default=0, verbose_name='Phiên bản máy khách đã áp dụng')
+    updated_at = models.DateTimeField(auto_now=True, verbose_name='Thời gian cập nhật')
+
+    class Meta:
+        verbose_name = 'Chiến lược hiệu lực của thiết bị'
+        verbose_name_plural = verbose_name
+        db_table = 'peer_strategy'
+
+    def __str__(self):
+        return f'{self.peer_id}-v{self.version}'
+
+
 class Personal(models.Model):
     """
     地址簿
@@ -60,6 +155,8 @@ class Personal(models.Model):
                                        related_name='personal_create_user')
     personal_type = models.CharField(verbose_name='Loại danh bạ', default='public',
                                      choices=[('public', 'Công khai'), ('private', 'Riêng tư')])
+    # 地址簿内容版本号：设备/别名/标签变更时递增，用于 ab 接口的 ETag
+    revision = models.BigIntegerField(default=0, verbose_name='Phiên bản nội dung')
     created_at = models.DateTimeField(auto_now_add=True, verbose_name='Thời gian tạo')
 
     class Meta:
@@ -88,48 +185,70 @@ class Tag(models.Model):
         return f'{self._meta.db_table}--{self.tag, self.color, self.guid}'
 
 
-class ClientTags(models.Model):
+class TagAssignment(models.Model):
     """
-    标签模型
+    设备标签关联模型：每行表示地址簿（guid）中一个设备拥有一个标签
     """
-    user_id = models.ForeignKey(User, to_field='id', on_delete=models.CASCADE, verbose_name='Tên người dùng',
-                                related_name='user_tags')
+    tag = models.ForeignKey(Tag, on_delete=models.CASCADE, related_name='assignments', verbose_name='Thẻ')
     peer_id = models.CharField(max_length=255, verbose_name='ID thiết bị')
-    tags = models.CharField(max_length=255, verbose_name='Tên thẻ')
     guid = models.CharField(max_length=50, verbose_name='GUID')
 
     class Meta:
-        verbose_name = 'Thẻ'
-        db_table = 'client_tags'
-        unique_together = [['peer_id', 'guid']]
+        verbose_name = 'Gán thẻ'
+        verbose_name_plural = verbose_name
+        db_table = 'tag_assignment'
+        unique_together = [['guid', 'peer_id', 'tag']]
+        # 按标签筛选设备、删除标签时使用
+        indexes = [models.Index(fields=['guid', 'tag'], name='tag_assignment_guid_tag')]
 
     def __str__(self):
-        return f'{self._meta.db_table}--{self.user_id, self.peer_id, self.tags, self.guid}'
+        return f'{self.guid}:{self.peer_id}->{self.tag_id}'
 
 
 class Token(models.Model):
     """
-    令牌模型
+    令牌模型（只保存令牌的 sha256 摘要）
     """
     user_id = models.ForeignKey(User, to_field='id', on_delete=models.CASCADE, verbose_name='Tên người dùng')
     # user_id = models.ForeignKey(User, to_field='id', on_delete=models.CASCADE, verbose_name='用户名')
     # uuid = models.ForeignKey(PeerInfo, to_field='uuid', on_delete=models.CASCADE, verbose_name='设备UUID')
-    uuid = models.CharField(max_length=255, verbose_name='UUID thiết bị')
-    token = models.CharField(max_length=255, verbose_name='Mã thông báo')
+    uuid = models.CharField(max_length=255, db_index=True, verbose_name='UUID thiết bị')
+    token_hash = models.CharField(max_length=64, unique=True, verbose_name='Mã băm token')
     client_type = models.CharField(max_length=255, verbose_name='Loại máy khách',
                                    choices=[(1, 'web'), (2, 'client'), (3, 'api')], default='client')
     created_at = models.DateTimeField(auto_now_add=True, verbose_name='Thời gian tạo')
-    last_used_at = models.DateTimeField(auto_now=True, verbose_name='Thời gian sử dụng cuối')
+    # 不使用 auto_now：由 TokenService 按最短间隔批量回写
+    last_used_at = models.DateTimeField(default=timezone.now, db_index=True, verbose_name='Thời gian sử dụng cuối')
+    # 签名令牌的过期时间（吊销时使用），普通令牌为空
+    expires_at = models.DateTimeField(null=True, blank=True, verbose_name='Thời gian hết hạn')
 
     class Meta:
         verbose_name = 'Mã thông báo (Token)'
         verbose_name_plural = 'Mã thông báo (Token)'
         ordering = ['-created_at']
         db_table = 'token'
-        unique_together = [['user_id', 'uuid']]
+        unique_together = [['user_id', 'uuid', 'client_type']]
+
+    def __str__(self):
+        return f'{self.user_id} ({self.uuid}-{self.token_hash[:12]})'
+
+
+class RevokedToken(models.Model):
+    """
+    已吊销的令牌（保存令牌摘要，过期后可清理）：签名令牌，以及重新登录时被替换的普通令牌
+    """
+    # 令牌 sha256 摘要；0010 之前的记录为 32 位签名
+    token_hash = models.CharField(max_length=64, unique=True, verbose_name='Mã băm token')
+    expires_at = models.DateTimeField(db_index=True, verbose_name='Thời gian hết hạn')
+    created_at = models.DateTimeField(auto_now_add=True, verbose_name='Thời gian tạo')
+
+    class Meta:
+        verbose_name = 'Token đã thu hồi'
+        verbose_name_plural = verbose_name
+        db_table = 'revoked_token'
 
     def __str__(self):
-        return f'{self.user_id} ({self.uuid}-{self.token})'
+        return self.token_hash
 
 
 class LoginClient(models.Model):
@@ -154,6 +273,7 @@ class LoginClient(models.Model):
         verbose_name_plural = 'Máy khách đăng nhập'
         ordering = ['-user_id']
         db_table = 'login_client'
+        unique_together = [['user_id', 'uuid']]
 
 
 class Log(models.Model):
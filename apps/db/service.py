@@ -1,38 +1,76 @@
-import ast
+import base64
+import hashlib
+import hmac
 import json
 import logging
-from datetime import timedelta
+import math
+import re
+from functools import cached_property
+from datetime import date, datetime, time, timedelta
+from time import monotonic, sleep
 from typing import TypeVar
 
+from asgiref.sync import sync_to_async
 from django.contrib.auth.models import User, Group
-from django.db import models
+from django.db import connection, models
 from django.db import transaction
-from django.db.models import Q
+from django.db.models import F, Q
 from django.http import HttpRequest
+from django.utils import timezone
 
 from apps.db.models import (
     HeartBeat,
     PeerInfo,
+    PeerUptime,
+    Strategy,
+    StrategyAssignment,
+    PeerStrategy,
     Token,
+    RevokedToken,
     LoginClient,
     Tag,
+    TagAssignment,
     Log,
     AutidConnLog,
     AuditFileLog,
     UserPrefile,
     Personal,
+    PeerPersonal,
     Alias,
-    ClientTags,
     SharePersonal,
 )
+from apps.db.buffer import heartbeat_buffer, token_touch_buffer, uptime_buffer
+from common.cache import LRUCache
+from common.env import AddressBookConfig, HeartBeatConfig, TokenConfig
 from common.error import UserNotFoundError
-from common.utils import get_local_time, get_randem_md5
+from common.password_pool import password_verifier
+from common.shared_store import shared_store
+from common.utils import get_local_time, get_randem_md5, get_sha256
 
 logger = logging.getLogger(__name__)
 
 # Định nghĩa biến kiểu generic cho các model
 ModelType = TypeVar("ModelType", bound=models.Model)
 
+# Cache định danh thiết bị trong worker: "uuid:<uuid>" / "peer:<peer_id>" -> {pk, version, seen_at}
+peer_identity_cache = LRUCache(max_size=HeartBeatConfig.IDENTITY_CACHE_SIZE)
+
+# Cache chiến lược hiệu lực trong worker: uuid -> {version, config_options, applied_version}
+peer_strategy_cache = LRUCache(max_size=HeartBeatConfig.IDENTITY_CACHE_SIZE)
+
+# Cache xác thực token thường trong worker: token -> {id, user_id, uuid, last_used_at}
+token_cache = LRUCache(max_size=TokenConfig.CACHE_SIZE, ttl=TokenConfig.CACHE_TTL)
+
+# Token ký số đã ghi nhận last_used_at gần đây trong worker: chữ ký -> True (hết hạn sau TOUCH_INTERVAL)
+token_touch_cache = LRUCache(max_size=HeartBeatConfig.IDENTITY_CACHE_SIZE, ttl=TokenConfig.TOUCH_INTERVAL)
+
+# Snapshot /api/ab/peers trong worker: guid -> {revision, json, gzip}, giới hạn theo tổng số byte
+ab_snapshot_cache = LRUCache(
+    max_size=1024,
+    max_bytes=int(AddressBookConfig.SNAPSHOT_CACHE_MB * 1024 * 1024),
+    sizeof=lambda snapshot: len(snapshot["json"]) + len(snapshot["gzip"] or b""),
+)
+
 
 class BaseService:
     """
@@ -136,6 +174,29 @@ class UserService(BaseService):
             return username
         return self.db.objects.filter(username=username).first()
 
+    async def aget_user_by_name(self, username) -> User | None:
+        if isinstance(username, User):
+            return username
+        return await self.db.objects.filter(username=username).afirst()
+
+    def verify_password(self, user: User | None, password) -> bool:
+        """
+        Kiểm tra mật khẩu trong tiến trình con (``password_verifier``) thay vì luồng xử lý request;
+        tự băm lại mật khẩu khi tham số thuật toán thay đổi (giống ``User.check_password``)
+
+        :param user: Người dùng
+        :param password: Mật khẩu dạng rõ
+        :returns: Mật khẩu có khớp không
+        :raises LoginThrottledError: Hàng đợi kiểm tra mật khẩu đã đầy
+        """
+        if not user:
+            return False
+        matched, must_update = password_verifier.verify(password, user.password)
+        if matched and must_update:
+            user.set_password(password)
+            user.save(update_fields=["password"])
+        return matched
+
     def set_password(self, password, email=None, username=None):
         if username is not None:
             user = self.get_user_by_name(username)
@@ -151,6 +212,8 @@ class UserService(BaseService):
         return user
 
     def delete_user(self, *usernames):
+        # Người dùng bị xóa: thu hồi token và đánh dấu đăng xuất mọi máy khách
+        TokenService().revoke_sessions(usernames=usernames)
         self.db.objects.filter(username__in=[*usernames]).update(is_active=False)
         logger.info(f"Xóa người dùng: {usernames}")
 
@@ -284,10 +347,15 @@ class GroupService(BaseService):
             if to_create:
                 UserPrefile.objects.bulk_create(to_create)
                 # logger.info(f"Tạo nhóm người dùng: {to_create}")
+            # Chiến lược gán theo nhóm phụ thuộc nhóm của người dùng
+            changed = {p.user_id for p in to_update + to_create}
+            StrategyService().refresh_users(*[u.username for u in user_objs if u.id in changed])
 
 
 class PeerInfoService(BaseService):
     db = PeerInfo
+    identity_cache = peer_identity_cache
+    identity_fields = ("pk", "uuid", "peer_id", "version", "sysinfo_hash")
 
     def get_peer_info_by_uuid(self, uuid):
         return self.db.objects.filter(uuid=uuid).first()
@@ -295,21 +363,218 @@ class PeerInfoService(BaseService):
     def get_peer_info_by_peer_id(self, peer_id):
         return self.db.objects.filter(peer_id=peer_id).first()
 
-    def update(self, uuid: str, **kwargs):
+    def update(self, uuid: str, **kwargs) -> bool:
         """
         Tạo hoặc cập nhật thông tin hệ thống
 
+        Nội dung sysinfo được chuẩn hóa và băm; nếu thiết bị đã có cùng mã băm thì
+        bỏ qua, không ghi lại bản ghi.
+
         :param uuid: Mã định danh thiết bị
         :param kwargs: Các trường thông tin hệ thống
-        :return: Tuple (created, object)
+        :return: True nếu đã ghi DB, False nếu nội dung không đổi
         """
-        kwargs["uuid"] = uuid
+        kwargs = self._prepare_update(uuid, kwargs)
         peer_id = kwargs.get("peer_id")
+        if self._unchanged(self.get_identity(uuid=uuid, peer_id=peer_id), kwargs):
+            return False
+
+        self.forget_identity(uuid=uuid, peer_id=peer_id)
+        if self._peers(uuid, peer_id).update(**kwargs):
+            peer = self.db.objects.filter(uuid=uuid).values(*self.identity_fields).first()
+            if peer:
+                self.remember_identity(**peer)
+            # Tên máy, hệ điều hành... hiển thị trong danh bạ: tăng phiên bản các danh bạ chứa thiết bị
+            PersonalService.bump_peer_revision(uuid)
+        else:
+            self._remember_created(self.db.objects.create(**kwargs))
+        self._log_update(kwargs)
+        return True
 
-        if not self.db.objects.filter(Q(uuid=uuid) | Q(peer_id=peer_id)).update(**kwargs):
-            self.db.objects.create(**kwargs)
+    async def aupdate(self, uuid: str, **kwargs) -> bool:
+        """
+        Phiên bản async của ``update`` (dùng ORM async, cho chế độ ASGI)
+        """
+        kwargs = self._prepare_update(uuid, kwargs)
+        peer_id = kwargs.get("peer_id")
+        if self._unchanged(await self.aget_identity(uuid=uuid, peer_id=peer_id), kwargs):
+            return False
+
+        self.forget_identity(uuid=uuid, peer_id=peer_id)
+        if await self._peers(uuid, peer_id).aupdate(**kwargs):
+            peer = await self.db.objects.filter(uuid=uuid).values(*self.identity_fields).afirst()
+            if peer:
+                self.remember_identity(**peer)
+            await PersonalService.abump_peer_revision(uuid)
+        else:
+            self._remember_created(await self.db.objects.acreate(**kwargs))
+        self._log_update(kwargs)
+        return True
+
+    # ---- Phần dùng chung của bản sync và async (không I/O) ----
+
+    def _peers(self, uuid, peer_id):
+        return self.db.objects.filter(Q(uuid=uuid) | Q(peer_id=peer_id))
+
+    def _prepare_update(self, uuid, kwargs: dict) -> dict:
+        kwargs["uuid"] = uuid
+        kwargs["sysinfo_hash"] = self.sysinfo_digest(**kwargs)
+        return kwargs
+
+    @staticmethod
+    def _unchanged(identity: dict | None, kwargs: dict) -> bool:
+        if identity and identity["sysinfo_hash"] == kwargs["sysinfo_hash"]:
+            logger.debug(f"Thông tin thiết bị không đổi, bỏ qua: uuid={kwargs['uuid']} peer_id={kwargs.get('peer_id')}")
+            return True
+        return False
+
+    def _remember_created(self, peer: PeerInfo):
+        self.remember_identity(pk=peer.pk, uuid=peer.uuid, peer_id=peer.peer_id, version=peer.version,
+                               sysinfo_hash=peer.sysinfo_hash)
+
+    @staticmethod
+    def _log_update(kwargs: dict):
+        logger.info(f"Cập nhật thông tin thiết bị: uuid={kwargs['uuid']} peer_id={kwargs.get('peer_id')} "
+                    f"version={kwargs.get('version')}")
+        logger.debug(f"Thông tin thiết bị: {kwargs}")
+
+    def _cached_identity(self, uuid=None, peer_id=None) -> dict | None:
+        return (uuid and self.identity_cache.get(f"uuid:{uuid}")) or (
+                peer_id and self.identity_cache.get(f"peer:{peer_id}")) or None
+
+    @staticmethod
+    def _presence_due(identity: dict, ver, seen_at) -> bool:
+        """
+        Có cần ghi trạng thái trực tuyến không: bỏ qua khi lần ghi trước cùng phiên bản còn mới hơn
+        ``HEARTBEAT_PRESENCE_INTERVAL`` giây; nếu cần ghi thì cập nhật mốc trong cache
+        """
+        last = identity["seen_at"]
+        if last and last[1] == ver and (seen_at - last[0]).total_seconds() < HeartBeatConfig.PRESENCE_INTERVAL:
+            return False
+        identity["seen_at"] = (seen_at, ver)
+        return True
+
+    @staticmethod
+    def sysinfo_digest(**fields) -> str:
+        """
+        Mã băm sysinfo đã chuẩn hóa (sắp xếp khóa, bỏ khoảng trắng thừa)
+
+        :param fields: Các trường thông tin hệ thống sẽ lưu
+        :return: sha256 hex
+        """
+        normalized = {k: (v.strip() if isinstance(v, str) else v) for k, v in fields.items() if k != "sysinfo_hash"}
+        return get_sha256(json.dumps(normalized, sort_keys=True, ensure_ascii=False, default=str))
 
-        logger.info(f"Cập nhật thông tin thiết bị: {kwargs}")
+    def get_identity(self, uuid=None, peer_id=None, refresh=False) -> dict | None:
+        """
+        Lấy định danh thiết bị (pk, version) theo uuid, sau đó theo peer_id
+
+        Ưu tiên đọc cache của worker; chỉ truy vấn DB khi chưa có cache hoặc ``refresh``.
+
+        :param uuid: UUID thiết bị
+        :param peer_id: ID thiết bị
+        :param refresh: Bỏ qua cache và đọc lại từ DB
+        :returns: Dict {pk, version, sysinfo_hash, seen_at} hoặc None nếu thiết bị chưa báo cáo sysinfo
+        """
+        if not refresh and (identity := self._cached_identity(uuid, peer_id)):
+            return identity
+        peer = None
+        if uuid:
+            peer = self.db.objects.filter(uuid=uuid).values(*self.identity_fields).first()
+        if not peer and peer_id:
+            peer = self.db.objects.filter(peer_id=peer_id).values(*self.identity_fields).first()
+        if not peer:
+            return None
+        return self.remember_identity(**peer)
+
+    async def aget_identity(self, uuid=None, peer_id=None, refresh=False) -> dict | None:
+        """
+        Phiên bản async của ``get_identity``
+        """
+        if not refresh and (identity := self._cached_identity(uuid, peer_id)):
+            return identity
+        peer = None
+        if uuid:
+            peer = await self.db.objects.filter(uuid=uuid).values(*self.identity_fields).afirst()
+        if not peer and peer_id:
+            peer = await self.db.objects.filter(peer_id=peer_id).values(*self.identity_fields).afirst()
+        if not peer:
+            return None
+        return self.remember_identity(**peer)
+
+    def remember_identity(self, pk, uuid, peer_id, version, sysinfo_hash=None) -> dict:
+        """
+        Ghi định danh thiết bị vào cache (khóa theo cả uuid và peer_id)
+
+        :returns: Bản ghi định danh vừa lưu
+        """
+        identity = {"pk": pk, "version": version, "sysinfo_hash": sysinfo_hash, "seen_at": None}
+        self.identity_cache.set(f"uuid:{uuid}", identity)
+        self.identity_cache.set(f"peer:{peer_id}", identity)
+        return identity
+
+    def forget_identity(self, uuid=None, peer_id=None):
+        """
+        Xóa định danh thiết bị khỏi cache (khi sysinfo thay đổi)
+        """
+        self.identity_cache.delete(f"uuid:{uuid}", f"peer:{peer_id}")
+
+    def touch_presence(self, uuid, peer_id=None, ver=None, seen_at=None):
+        """
+        Cập nhật trạng thái trực tuyến (last_seen_at/last_version) của thiết bị
+
+        Nếu thiết bị đã có trong cache định danh: cập nhật theo pk và bỏ qua khi lần ghi
+        trước còn mới hơn ``HEARTBEAT_PRESENCE_INTERVAL`` giây (cùng phiên bản).
+
+        :param uuid: UUID thiết bị
+        :param peer_id: ID thiết bị
+        :param ver: Phiên bản client gửi trong heartbeat
+        :param seen_at: Thời điểm heartbeat, mặc định là hiện tại
+        :returns: Số bản ghi được cập nhật
+        """
+        seen_at = seen_at or get_local_time()
+        identity = self._cached_identity(uuid, peer_id)
+        if not identity:
+            return self._peers(uuid, peer_id).update(last_seen_at=seen_at, last_version=ver)
+        if not self._presence_due(identity, ver, seen_at):
+            return 0
+        return self.db.objects.filter(pk=identity["pk"]).update(last_seen_at=seen_at, last_version=ver)
+
+    async def atouch_presence(self, uuid, peer_id=None, ver=None, seen_at=None):
+        """
+        Phiên bản async của ``touch_presence``
+        """
+        seen_at = seen_at or get_local_time()
+        identity = self._cached_identity(uuid, peer_id)
+        if not identity:
+            return await self._peers(uuid, peer_id).aupdate(last_seen_at=seen_at, last_version=ver)
+        if not self._presence_due(identity, ver, seen_at):
+            return 0
+        return await self.db.objects.filter(pk=identity["pk"]).aupdate(last_seen_at=seen_at, last_version=ver)
+
+    @staticmethod
+    def online_threshold(seconds=None):
+        """
+        Mốc thời gian để coi thiết bị là trực tuyến (last_seen_at >= mốc)
+
+        :param seconds: Khoảng thời gian tính là trực tuyến (giây), mặc định ``online_window()``
+        """
+        seconds = PeerInfoService.online_window() if seconds is None else seconds
+        return get_local_time() - timedelta(seconds=seconds)
+
+    @staticmethod
+    def online_window() -> float:
+        """
+        Khoảng cách tối đa giữa hai lần ghi ``last_seen_at`` của thiết bị đang trực tuyến (giây)
+
+        Gồm chu kỳ heartbeat đề xuất tối đa (kèm độ lệch), khoảng ghi trạng thái trực tuyến và
+        chu kỳ flush của bộ đệm heartbeat.
+        """
+        window = HeartBeatConfig.MAX_INTERVAL * (1 + HeartBeatConfig.INTERVAL_JITTER)
+        window += HeartBeatConfig.PRESENCE_INTERVAL
+        if HeartBeatConfig.BUFFER_ENABLED:
+            window += HeartBeatConfig.FLUSH_INTERVAL_MS / 1000
+        return window
 
     def get_list(self):
         return self.db.objects.all()
@@ -329,15 +594,75 @@ class HeartBeatService(BaseService):
         :param kwargs: Trường cần cập nhật, ví dụ peer_id, ver...
         :returns:
         """
-        kwargs["modified_at"] = get_local_time()
-        kwargs["timestamp"] = get_local_time()
-        kwargs["uuid"] = uuid
+        kwargs = self._beat_fields(uuid, kwargs)
         peer_id = kwargs.get("peer_id")
 
         if not self.db.objects.filter(Q(uuid=uuid) | Q(peer_id=peer_id)).update(**kwargs):
             self.db.objects.create(**kwargs)
+        PeerInfoService().touch_presence(uuid, peer_id=peer_id, ver=kwargs.get("ver"), seen_at=kwargs["modified_at"])
         logger.info(f"Cập nhật heartbeat: {kwargs}")
 
+    async def aupdate(self, uuid, **kwargs):
+        """
+        Phiên bản async của ``update``
+        """
+        kwargs = self._beat_fields(uuid, kwargs)
+        peer_id = kwargs.get("peer_id")
+
+        if not await self.db.objects.filter(Q(uuid=uuid) | Q(peer_id=peer_id)).aupdate(**kwargs):
+            await self.db.objects.acreate(**kwargs)
+        await PeerInfoService().atouch_presence(uuid, peer_id=peer_id, ver=kwargs.get("ver"),
+                                                seen_at=kwargs["modified_at"])
+        logger.info(f"Cập nhật heartbeat: {kwargs}")
+
+    @staticmethod
+    def _beat_fields(uuid, kwargs: dict) -> dict:
+        kwargs["modified_at"] = get_local_time()
+        kwargs["timestamp"] = get_local_time()
+        kwargs["uuid"] = uuid
+        return kwargs
+
+    @staticmethod
+    def _buffer(uuid, peer_id=None, ver=None) -> bool:
+        """
+        Phần chỉ thao tác bộ nhớ của ``record``/``arecord``
+
+        :returns: True nếu heartbeat đã vào bộ đệm (không cần ghi trực tiếp)
+        """
+        if HeartBeatConfig.UPTIME_ENABLED:
+            uptime_buffer.mark(peer_id, get_local_time())
+        if HeartBeatConfig.BUFFER_ENABLED and uuid:
+            heartbeat_buffer.put(uuid, {
+                "peer_id": peer_id,
+                "ver": ver,
+                "modified_at": get_local_time(),
+            })
+            return True
+        return False
+
+    def record(self, uuid, peer_id=None, ver=None):
+        """
+        Ghi nhận heartbeat theo chế độ cấu hình
+
+        Khi bật ``HEARTBEAT_BUFFER``, heartbeat được đưa vào bộ đệm của worker
+        (gộp theo uuid) và ghi xuống DB theo lô; ngược lại ghi trực tiếp như ``update``.
+        Bit phút trong bitmap trực tuyến luôn được đánh dấu qua bộ đệm (``HEARTBEAT_UPTIME``).
+
+        :param uuid: UUID thiết bị
+        :param peer_id: ID thiết bị
+        :param ver: Phiên bản client
+        :returns:
+        """
+        if not self._buffer(uuid, peer_id=peer_id, ver=ver):
+            self.update(uuid=uuid, peer_id=peer_id, ver=ver)
+
+    async def arecord(self, uuid, peer_id=None, ver=None):
+        """
+        Phiên bản async của ``record``; chế độ bộ đệm chỉ thao tác bộ nhớ, không chờ DB
+        """
+        if not self._buffer(uuid, peer_id=peer_id, ver=ver):
+            await self.aupdate(uuid=uuid, peer_id=peer_id, ver=ver)
+
     def is_alive(self, uuid, timeout=60):
         client = self.db.objects.filter(uuid=uuid).first()
         if client and get_local_time() - client.modified_at < timeout:
@@ -345,6 +670,410 @@ class HeartBeatService(BaseService):
         return False
 
 
+class UptimeService(BaseService):
+    """
+    Dịch vụ lịch sử trực tuyến
+
+    Đọc bitmap phút theo ngày (``PeerUptime``) để tính tỉ lệ trực tuyến và các khoảng mất kết nối.
+    Chỉ tính các phút đã trôi qua, bắt đầu từ ngày đầu tiên thiết bị có dữ liệu.
+    """
+
+    db = PeerUptime
+
+    @staticmethod
+    def default_min_outage() -> int:
+        """
+        Độ dài tối thiểu (phút) để một khoảng trống được coi là mất kết nối
+
+        Khi bật chu kỳ heartbeat thích ứng, client có thể gửi thưa hơn 1 lần/phút nên
+        khoảng trống ngắn hơn ``HEARTBEAT_MAX_INTERVAL`` vẫn được coi là trực tuyến.
+        """
+        if HeartBeatConfig.ADAPTIVE_INTERVAL:
+            return max(2, math.ceil(HeartBeatConfig.MAX_INTERVAL / 60) + 1)
+        return 2
+
+    def get_slots(self, peer_id, start: date, end: date) -> tuple[date | None, str]:
+        """
+        Chuỗi bit phút ('1' trực tuyến, '0' ngoại tuyến) từ ngày đầu có dữ liệu tới hiện tại
+
+        :param peer_id: ID thiết bị
+        :param start: Ngày bắt đầu (bao gồm)
+        :param end: Ngày kết thúc (bao gồm)
+        :returns: (ngày bắt đầu thực tế, chuỗi bit); ngày là None nếu không có dữ liệu
+        """
+        rows = dict(self.db.objects.filter(peer_id=peer_id, day__gte=start, day__lte=end).values_list("day", "bitmap"))
+        if not rows:
+            return None, ""
+        now = get_local_time()
+        first = min(rows)
+        end = min(end, now.date())
+        slots = []
+        day = first
+        while day <= end:
+            bits = format(int.from_bytes(rows.get(day, b""), "big"), f"0{PeerUptime.SLOTS}b")
+            if day == now.date():
+                bits = bits[:now.hour * 60 + now.minute + 1]
+            slots.append(bits)
+            day += timedelta(days=1)
+        return first, "".join(slots)
+
+    def get_uptime(self, peer_id, start: date, end: date, min_outage: int | None = None) -> dict:
+        """
+        Tỉ lệ trực tuyến và các khoảng mất kết nối của thiết bị trong khoảng ngày
+
+        :param peer_id: ID thiết bị
+        :param start: Ngày bắt đầu (bao gồm)
+        :param end: Ngày kết thúc (bao gồm)
+        :param min_outage: Khoảng trống ngắn hơn số phút này được coi là trực tuyến
+        :returns: Dict {peer_id, start, end, online_minutes, total_minutes, uptime, days, outages}
+        """
+        min_outage = self.default_min_outage() if min_outage is None else min_outage
+        first, slots = self.get_slots(peer_id, start, end)
+        result = {
+            "peer_id": peer_id,
+            "start": start.isoformat(),
+            "end": end.isoformat(),
+            "online_minutes": 0,
+            "total_minutes": len(slots),
+            "uptime": None,
+            "days": [],
+            "outages": [],
+        }
+        if not slots:
+            return result
+
+        origin = timezone.make_aware(datetime.combine(first, time.min))
+        filled = list(slots)
+        for gap in re.finditer("0+", slots):
+            gap_start, gap_end = gap.span()
+            ongoing = gap_end == len(slots)
+            # Khoảng trống ngắn nằm giữa hai lần trực tuyến: do chu kỳ heartbeat, không phải mất kết nối
+            if gap_start > 0 and not ongoing and gap_end - gap_start < min_outage:
+                filled[gap_start:gap_end] = "1" * (gap_end - gap_start)
+                continue
+            result["outages"].append({
+                "start": (origin + timedelta(minutes=gap_start)).isoformat(),
+                "end": None if ongoing else (origin + timedelta(minutes=gap_end)).isoformat(),
+                "minutes": gap_end - gap_start,
+            })
+        filled = "".join(filled)
+
+        for offset in range(0, len(filled), PeerUptime.SLOTS):
+            day_slots = filled[offset:offset + PeerUptime.SLOTS]
+            online = day_slots.count("1")
+            result["days"].append({
+                "day": (first + timedelta(days=offset // PeerUptime.SLOTS)).isoformat(),
+                "online_minutes": online,
+                "total_minutes": len(day_slots),
+                "uptime": round(online * 100 / len(day_slots), 2),
+            })
+        result["online_minutes"] = filled.count("1")
+        result["uptime"] = round(result["online_minutes"] * 100 / len(filled), 2)
+        return result
+
+    def get_uptime_map(self, peer_ids: list[str], start: date, end: date) -> dict[str, float]:
+        """
+        Tỉ lệ trực tuyến (%) của nhiều thiết bị, chỉ đếm bit (không gộp khoảng trống ngắn)
+
+        :param peer_ids: Danh sách ID thiết bị
+        :param start: Ngày bắt đầu (bao gồm)
+        :param end: Ngày kết thúc (bao gồm)
+        :returns: Map {peer_id: uptime}; thiết bị không có dữ liệu không xuất hiện
+        """
+        now = get_local_time()
+        today_slots = now.hour * 60 + now.minute + 1
+        totals: dict[str, list] = {}
+        rows = self.db.objects.filter(peer_id__in=peer_ids, day__gte=start, day__lte=end).values_list(
+            "peer_id", "day", "bitmap")
+        for peer_id, day, bitmap in rows:
+            total = totals.setdefault(peer_id, [0, day])
+            total[0] += int.from_bytes(bitmap, "big").bit_count()
+            total[1] = min(total[1], day)
+        last = min(end, now.date())
+        result = {}
+        for peer_id, (online, first) in totals.items():
+            minutes = (last - first).days * PeerUptime.SLOTS + (today_slots if last == now.date() else PeerUptime.SLOTS)
+            result[peer_id] = round(min(online, minutes) * 100 / max(minutes, 1), 2)
+        return result
+
+
+class StrategyService(BaseService):
+    """
+    Dịch vụ chiến lược cấu hình client
+
+    Chiến lược được gán cho thiết bị (peer_id), người dùng hoặc nhóm; cấu hình hiệu lực của
+    một thiết bị là kết quả gộp nhóm < người dùng < thiết bị (mức sau ghi đè mức trước).
+    Cấu hình hiệu lực được tính trước vào ``PeerStrategy`` mỗi khi chiến lược/phân bổ/đăng nhập
+    thay đổi; heartbeat chỉ so sánh phiên bản với ``modified_at`` client gửi lên.
+
+    Cache trong worker bị xóa khi bộ đếm ``strategy:generation`` trong kho dùng chung thay đổi
+    (kiểm tra tối đa mỗi giây một lần).
+    """
+
+    db = Strategy
+    cache = peer_strategy_cache
+    target_types = ("group", "user", "device")
+    generation_key = "strategy:generation"
+    _generation = {"value": None, "checked_at": 0.0}
+
+    @staticmethod
+    def next_version(previous: int = 0) -> int:
+        """
+        Phiên bản tăng đơn điệu: max(phiên bản cũ + 1, timestamp hiện tại)
+        """
+        return max(int(previous or 0) + 1, int(get_local_time().timestamp()))
+
+    @staticmethod
+    def config_digest(config_options: dict) -> str:
+        return get_sha256(json.dumps(config_options, sort_keys=True, ensure_ascii=False))
+
+    # ---- Quản trị ----
+
+    def get_list(self) -> list[dict]:
+        """
+        Danh sách chiến lược kèm các đối tượng được gán
+        """
+        result = []
+        for strategy in self.db.objects.prefetch_related("assignments"):
+            result.append({
+                "id": strategy.id,
+                "name": strategy.name,
+                "config_options": strategy.config_options,
+                "version": strategy.version,
+                "updated_at": strategy.updated_at,
+                "assignments": [
+                    {"target_type": a.target_type, "target": a.target} for a in strategy.assignments.all()
+                ],
+            })
+        return result
+
+    def save_strategy(self, name, config_options: dict, strategy_id=None) -> Strategy:
+        """
+        Tạo hoặc sửa chiến lược, tính lại cấu hình hiệu lực cho các thiết bị liên quan
+
+        :param name: Tên chiến lược
+        :param config_options: Map tùy chọn cấu hình (giá trị được chuyển thành chuỗi)
+        :param strategy_id: ID chiến lược cần sửa; None để tạo mới
+        """
+        config_options = {str(k): str(v) for k, v in (config_options or {}).items()}
+        with transaction.atomic():
+            if strategy_id:
+                strategy = self.db.objects.select_for_update().get(id=strategy_id)
+            else:
+                strategy = self.db(name=name)
+            strategy.name = name
+            strategy.config_options = config_options
+            strategy.version = self.next_version(strategy.version)
+            strategy.save()
+            devices = self.get_devices(*[(a.target_type, a.target) for a in strategy.assignments.all()])
+            self.refresh(devices)
+        logger.info(f"Lưu chiến lược: {name} v{strategy.version}, thiết bị ảnh hưởng: {len(devices)}")
+        return strategy
+
+    def delete_strategy(self, strategy_id) -> int:
+        with transaction.atomic():
+            strategy = self.db.objects.filter(id=strategy_id).first()
+            if not strategy:
+                return 0
+            devices = self.get_devices(*[(a.target_type, a.target) for a in strategy.assignments.all()])
+            strategy.delete()
+            self.refresh(devices)
+        logger.info(f"Xóa chiến lược: {strategy.name}, thiết bị ảnh hưởng: {len(devices)}")
+        return 1
+
+    def assign(self, strategy_id, target_type, target) -> StrategyAssignment:
+        """
+        Gán chiến lược cho thiết bị/người dùng/nhóm (thay thế phân bổ cũ của đối tượng)
+        """
+        assert target_type in self.target_types
+        with transaction.atomic():
+            assignment, _ = StrategyAssignment.objects.update_or_create(
+                target_type=target_type,
+                target=target,
+                defaults={"strategy_id": strategy_id},
+            )
+            self.refresh(self.get_devices((target_type, target)))
+        logger.info(f"Gán chiến lược {strategy_id} cho {target_type}:{target}")
+        return assignment
+
+    def unassign(self, target_type, target) -> int:
+        with transaction.atomic():
+            deleted, _ = StrategyAssignment.objects.filter(target_type=target_type, target=target).delete()
+            if deleted:
+                self.refresh(self.get_devices((target_type, target)))
+        logger.info(f"Bỏ gán chiến lược của {target_type}:{target}")
+        return deleted
+
+    # ---- Tính cấu hình hiệu lực ----
+
+    @staticmethod
+    def get_devices(*targets) -> dict[str, str]:
+        """
+        Các thiết bị chịu ảnh hưởng của đối tượng được gán
+
+        Người dùng/nhóm được ánh xạ sang thiết bị qua token đăng nhập; thành viên nhóm lấy theo
+        ``UserPrefile.group``.
+
+        :param targets: Các cặp (target_type, target)
+        :returns: Map {uuid: peer_id}
+        """
+        query = Q(pk__in=[])
+        token_query = Q(pk__in=[])
+        for target_type, target in targets:
+            if target_type == "device":
+                query |= Q(peer_id=target)
+            elif target_type == "user":
+                token_query |= Q(user_id__username=target)
+            elif target_type == "group":
+                token_query |= Q(user_id__userprofile__group__name=target)
+        uuids = Token.objects.filter(token_query).values_list("uuid", flat=True)
+        query |= Q(uuid__in=uuids)
+        return dict(PeerInfo.objects.filter(query).values_list("uuid", "peer_id"))
+
+    def refresh(self, devices: dict[str, str], batch_size=500) -> int:
+        """
+        Tính lại cấu hình hiệu lực cho các thiết bị; phiên bản chỉ tăng khi cấu hình thay đổi
+
+        :param devices: Map {uuid: peer_id}
+        :returns: Số thiết bị có cấu hình hiệu lực thay đổi
+        """
+        if not devices:
+            return 0
+        assignments = {
+            (a.target_type, a.target): a.strategy.config_options
+            for a in StrategyAssignment.objects.select_related("strategy")
+        }
+        changed = 0
+        items = list(devices.items())
+        for offset in range(0, len(items), batch_size):
+            batch = dict(items[offset:offset + batch_size])
+            users = {}
+            for uuid, user_id, username in Token.objects.filter(uuid__in=list(batch)).order_by(
+                    "-last_used_at").values_list("uuid", "user_id", "user_id__username"):
+                users.setdefault(uuid, (user_id, username))
+            groups = dict(UserPrefile.objects.filter(
+                user_id__in={user_id for user_id, _ in users.values()}).values_list("user_id", "group__name"))
+            existing = {row.uuid: row for row in PeerStrategy.objects.filter(uuid__in=list(batch))}
+
+            to_create, to_update = [], []
+            for uuid, peer_id in batch.items():
+                user_id, username = users.get(uuid, (None, None))
+                config = {}
+                config.update(assignments.get(("group", groups.get(user_id)), {}))
+                config.update(assignments.get(("user", username), {}))
+                config.update(assignments.get(("device", peer_id), {}))
+                digest = self.config_digest(config)
+                row = existing.get(uuid)
+                if row is None:
+                    if config:
+                        to_create.append(PeerStrategy(uuid=uuid, peer_id=peer_id, config_options=config,
+                                                      config_hash=digest, version=self.next_version()))
+                    continue
+                if row.config_hash == digest and row.peer_id == peer_id:
+                    continue
+                row.peer_id = peer_id
+                row.config_options = config
+                row.config_hash = digest
+                row.version = self.next_version(row.version)
+                row.updated_at = get_local_time()
+                to_update.append(row)
+            if to_create:
+                PeerStrategy.objects.bulk_create(to_create)
+            if to_update:
+                PeerStrategy.objects.bulk_update(
+                    to_update, ["peer_id", "config_options", "config_hash", "version", "updated_at"])
+            changed += len(to_create) + len(to_update)
+        if changed:
+            self.cache.delete(*devices)
+            shared_store.incr(self.generation_key)
+        return changed
+
+    def refresh_users(self, *usernames) -> int:
+        """
+        Nhóm của người dùng thay đổi (``UserPrefile``): tính lại cấu hình hiệu lực cho thiết bị của họ
+
+        :param usernames: Tên người dùng
+        :returns: Số thiết bị có cấu hình hiệu lực thay đổi
+        """
+        if not usernames or not StrategyAssignment.objects.filter(target_type="group").exists():
+            return 0
+        return self.refresh(self.get_devices(*[("user", username) for username in usernames]))
+
+    # ---- Heartbeat ----
+
+    def _generation_due(self) -> bool:
+        # Tối đa mỗi giây kiểm tra bộ đếm một lần
+        state = self._generation
+        now = monotonic()
+        if now - state["checked_at"] < 1:
+            return False
+        state["checked_at"] = now
+        return True
+
+    def _load_generation(self):
+        # Chiến lược đổi ở worker khác: xóa cache của worker này
+        state = self._generation
+        generation = shared_store.get(self.generation_key, 0)
+        if generation != state["value"]:
+            if state["value"] is not None:
+                self.cache.clear()
+            state["value"] = generation
+
+    def _check_generation(self):
+        if self._generation_due():
+            self._load_generation()
+
+    def _effective_qs(self, uuid):
+        return PeerStrategy.objects.filter(uuid=uuid).values("version", "config_options", "applied_version")
+
+    def _cache_effective(self, uuid, entry: dict | None) -> dict:
+        entry = entry or {"version": 0, "config_options": {}, "applied_version": 0}
+        self.cache.set(uuid, entry)
+        return entry
+
+    @staticmethod
+    def _needs_mark(entry: dict, version: int) -> bool:
+        if not entry["version"] or entry["applied_version"] == version:
+            return False
+        entry["applied_version"] = version
+        return True
+
+    def get_effective(self, uuid) -> dict:
+        """
+        Cấu hình hiệu lực của thiết bị (ưu tiên cache của worker)
+
+        :param uuid: UUID thiết bị
+        :returns: Dict {version, config_options, applied_version}; version 0 là chưa có chiến lược
+        """
+        self._check_generation()
+        entry = self.cache.get(uuid)
+        if entry is None:
+            entry = self._cache_effective(uuid, self._effective_qs(uuid).first())
+        return entry
+
+    async def aget_effective(self, uuid) -> dict:
+        """
+        Phiên bản async của ``get_effective``; đọc bộ đếm trong kho dùng chung (sqlite, chặn) ở thread khác
+        """
+        if self._generation_due():
+            await sync_to_async(self._load_generation, thread_sensitive=False)()
+        entry = self.cache.get(uuid)
+        if entry is None:
+            entry = self._cache_effective(uuid, await self._effective_qs(uuid).afirst())
+        return entry
+
+    def mark_applied(self, uuid, entry: dict, version: int):
+        """
+        Ghi nhận phiên bản client đã áp dụng (chỉ ghi khi thay đổi)
+        """
+        if self._needs_mark(entry, version):
+            PeerStrategy.objects.filter(uuid=uuid).update(applied_version=version)
+
+    async def amark_applied(self, uuid, entry: dict, version: int):
+        if self._needs_mark(entry, version):
+            await PeerStrategy.objects.filter(uuid=uuid).aupdate(applied_version=version)
+
+
 class LoginClientService(BaseService):
     """
     Dịch vụ client đăng nhập
@@ -371,26 +1100,35 @@ class LoginClientService(BaseService):
         _type = 1 if client_type.lower() == 'web' else 2
         return _type
 
+    def _upsert(self, user: User, uuid, **fields) -> None:
+        """
+        Ghi trạng thái máy khách theo khóa duy nhất (user_id, uuid) bằng một câu
+        ``INSERT ... ON CONFLICT DO UPDATE`` (MySQL: ``ON DUPLICATE KEY UPDATE``)
+
+        :param user: Người dùng
+        :param uuid: UUID thiết bị
+        :param fields: Các cột cần ghi, được cập nhật khi bản ghi đã tồn tại
+        """
+        # MySQL không hỗ trợ chỉ định cột xung đột, dùng khóa duy nhất của bảng
+        unique_fields = ["user_id", "uuid"] if connection.features.supports_update_conflicts_with_target else None
+        self.db.objects.bulk_create(
+            [self.db(user_id=user, uuid=uuid, **fields)],
+            update_conflicts=True,
+            unique_fields=unique_fields,
+            update_fields=list(fields),
+        )
+
     def update_login_status(self, username, uuid, platform, client_name, client_type='api', peer_id=None):
         user_qs = self.get_user_info(username)
-        if not self.db.objects.filter(user_id=user_qs.id, uuid=uuid).update(
-                user_id=user_qs,
-                uuid=uuid,
-                peer_id=peer_id,
-                login_status=True,
-                client_type=self.client_type(client_type),
-                platform=self.platform[platform],
-                client_name=client_name,
-        ):
-            self.db.objects.create(
-                user_id=user_qs,
-                uuid=uuid,
-                peer_id=peer_id,
-                login_status=True,
-                client_type=client_type,
-                platform=platform,
-                client_name=client_name,
-            )
+        self._upsert(
+            user_qs,
+            uuid,
+            peer_id=peer_id or '',
+            login_status=True,
+            client_type=self.client_type(client_type),
+            platform=self.platform[platform],
+            client_name=client_name or '',
+        )
 
         logger.info(f"Cập nhật trạng thái đăng nhập: {username} - {uuid}")
 
@@ -405,47 +1143,15 @@ class LoginClientService(BaseService):
             )
             return
 
-        update_fields = {
-            "user_id": user_qs,
-            "uuid": uuid,
-            "login_status": False,
-        }
-        if peer_id:
-            update_fields["peer_id"] = peer_id
-
-        updated = self.db.objects.filter(user_id=user_qs.id, uuid=uuid).update(**update_fields)
-        if not updated:
-            login_qs = self.db.objects.filter(
-                user_id=user_qs,
-                uuid=uuid,
-                login_status=True
-            ).first()
-            if not login_qs:
-                logger.warning(
-                    "Cập nhật trạng thái đăng xuất thất bại: không tìm thấy bản ghi đăng nhập user=%s uuid=%s",
-                    username,
-                    uuid,
-                )
-                return
-
-            resolved_peer_id = peer_id or login_qs.peer_id
-            if not resolved_peer_id:
-                logger.warning(
-                    "Cập nhật trạng thái đăng xuất thất bại: thiếu peer_id user=%s uuid=%s",
-                    username,
-                    uuid,
-                )
-                return
-
-            self.db.objects.create(
-                user_id=user_qs,
-                uuid=uuid,
-                peer_id=resolved_peer_id,
-                login_status=False,
-                client_type=login_qs.client_type,
-                platform=login_qs.platform,
-                client_name=login_qs.client_name,
+        # Đăng xuất chỉ cập nhật bản ghi đã có, không tạo bản ghi cho thiết bị chưa từng đăng nhập
+        fields = {"peer_id": peer_id} if peer_id else {}
+        if not self.db.objects.filter(user_id=user_qs.id, uuid=uuid).update(login_status=False, **fields):
+            logger.warning(
+                "Cập nhật trạng thái đăng xuất thất bại: không tìm thấy bản ghi đăng nhập user=%s uuid=%s",
+                username,
+                uuid,
             )
+            return
 
         logger.info(f"Cập nhật trạng thái đăng xuất: {username} - {uuid}")
 
@@ -453,14 +1159,109 @@ class LoginClientService(BaseService):
         return self.db.objects.filter(user_id=self.get_user_info(username).id).all()
 
 
+class AuthContext:
+    """
+    Ngữ cảnh xác thực của một request, tạo một lần và gắn vào ``request.auth_context``
+
+    Giữ token, bản ghi token (kèm user qua join), người dùng, uuid, thiết bị và body đã parse;
+    ``check_login`` và mọi ``TokenService(request=...)`` trong cùng request dùng chung,
+    nên mỗi request chỉ đọc bảng ``token`` tối đa một lần.
+    """
+
+    def __init__(self, request: HttpRequest):
+        self.request = request
+
+    @classmethod
+    def of(cls, request: HttpRequest) -> "AuthContext":
+        context = getattr(request, "auth_context", None)
+        if context is None:
+            context = request.auth_context = cls(request)
+        return context
+
+    @cached_property
+    def token(self) -> str | None:
+        authorization = self.request.headers.get("Authorization")
+        return authorization[7:] if authorization else None
+
+    @cached_property
+    def claims(self) -> dict | None:
+        return TokenService().decode_token(self.token)
+
+    @cached_property
+    def token_hash(self) -> str | None:
+        return TokenService.hash_token(self.token) if self.token else None
+
+    @cached_property
+    def token_row(self) -> Token | None:
+        """
+        Bản ghi token thường (token ký số không cần đọc bảng ``token``)
+        """
+        if not self.token or TokenService.is_signed(self.token):
+            return None
+        return Token.objects.select_related("user_id").filter(token_hash=self.token_hash).first()
+
+    @cached_property
+    def username(self) -> str | None:
+        if not self.token:
+            return None
+        if TokenService.is_signed(self.token):
+            return self.token.split("_", 1)[-1]
+        return self.token.split("_")[-1]
+
+    @cached_property
+    def user(self) -> User | None:
+        # Bản ghi token đã đọc trong request này (kèm user qua join); token lấy từ cache thì tra theo tên
+        row = self.__dict__.get("token_row")
+        if row is not None and row.user_id.username == self.username:
+            return row.user_id
+        return UserService().get_user_by_name(self.username) if self.username else None
+
+    @cached_property
+    def uuid(self) -> str | None:
+        if self.claims:
+            return self.claims["uuid"]
+        entry = TokenService(request=self.request).get_token_entry(self.token) if self.token else None
+        return entry["uuid"] if entry else None
+
+    @cached_property
+    def peer(self) -> PeerInfo | None:
+        return PeerInfoService().get_peer_info_by_uuid(self.uuid)
+
+    @cached_property
+    def body(self) -> dict | list:
+        if body := self.request.body:
+            return json.loads(body)
+        return {}
+
+
 class TokenService(BaseService):
     """
     Dịch vụ token
 
     Xử lý logic liên quan đến token
+
+    Hai định dạng token cùng tồn tại, client đều nhận dạng ``<chuỗi>_<username>``:
+
+    Bảng ``token`` chỉ lưu mã băm sha256 của token (``token_hash``, chỉ mục duy nhất).
+
+    - Token thường: ``<md5 ngẫu nhiên>_<username>``, kiểm tra bằng bảng ``token``, kết quả được
+      giữ trong ``token_cache`` của worker (LRU + TTL ``TOKEN_CACHE_TTL``);
+    - Token ký số (``TOKEN_SIGNED``, bắt buộc có ``TOKEN_SECRET``): ``s1.<payload base32>.<HMAC>_<username>``,
+      payload gồm user id, client type, thời điểm cấp/hết hạn và uuid. Chữ ký, hạn và danh sách thu hồi
+      (``RevokedToken``) kiểm tra trong bộ nhớ; thời gian rảnh kiểm tra như token thường qua ``token_cache``
+      (bản ghi ``token`` theo mã băm), bản ghi bị xóa thì token cũng mất hiệu lực.
+
+    Xóa/thu hồi token tăng bộ đếm ``token:generation`` trong kho dùng chung; mỗi worker kiểm tra
+    tối đa mỗi giây một lần, khi đổi thì xóa ``token_cache`` và nạp lại danh sách thu hồi.
+    Đăng nhập lại (thay token cũ của cùng thiết bị) không xóa cache: mã băm token cũ được ghi vào
+    danh sách thu hồi và bộ đếm ``token:revoked`` chỉ báo các worker nạp lại danh sách đó.
     """
 
     db = Token
+    signed_prefix = "s1."
+    generation_key = "token:generation"
+    revoked_key = "token:revoked"
+    _generation = {"value": None, "revoked_value": None, "checked_at": 0.0, "revoked": None}
 
     def __init__(self, request: HttpRequest | None = None):
         self.request = request
@@ -476,75 +1277,424 @@ class TokenService(BaseService):
         """
         assert client_type in [1, 2, 3]
         user_qs = self.get_user_info(username)
-        token = f"{get_randem_md5()}_{username}"
+        if TokenConfig.SIGNED:
+            token = self.sign_token(user_qs, uuid, client_type)
+            expires_at = self._expires_at(self.decode_token(token))
+        else:
+            token = f"{get_randem_md5()}_{username}"
+            expires_at = None
+        token_hash = self.hash_token(token)
 
         if qs := self.db.objects.filter(user_id=user_qs.id, uuid=uuid, client_type=client_type).first():
-            qs.token = token
+            self._replace(qs.token_hash, qs.expires_at)
+            qs.token_hash = token_hash
+            qs.expires_at = expires_at
             qs.created_at = get_local_time()
             qs.last_used_at = get_local_time()
             qs.save()
-            logger.info(f"Cập nhật token: user: {username} uuid: {uuid} token: {token}")
+            logger.info(f"Cập nhật token: user: {username} uuid: {uuid} token: {token_hash[:12]}")
         else:
             self.db.objects.create(
                 user_id=user_qs,
                 uuid=uuid,
-                token=token,
+                token_hash=token_hash,
                 client_type=client_type,
                 created_at=get_local_time(),
                 last_used_at=get_local_time(),
+                expires_at=expires_at,
             )
-            logger.info(f"Tạo token: user: {username} uuid: {uuid} token: {token}")
+            logger.info(f"Tạo token: user: {username} uuid: {uuid} token: {token_hash[:12]}")
         return token
 
+    @staticmethod
+    def hash_token(token: str) -> str:
+        """
+        Mã băm lưu trong bảng ``token`` (sha256, 64 ký tự hex)
+        """
+        return get_sha256(token)
+
+    # ---- Token ký số ----
+
+    @staticmethod
+    def _signature(message: str) -> str:
+        key = TokenConfig.SECRET.encode()
+        return hmac.new(key, message.encode(), hashlib.sha256).hexdigest()[:32]
+
+    @staticmethod
+    def _expires_at(claims: dict) -> datetime:
+        return datetime.fromtimestamp(claims["exp"], tz=timezone.get_current_timezone())
+
+    @classmethod
+    def is_signed(cls, token) -> bool:
+        return bool(token) and token.startswith(cls.signed_prefix)
+
+    def sign_token(self, user: User, uuid, client_type, ttl: int | None = None) -> str:
+        """
+        Cấp token ký số
+
+        :param user: Người dùng
+        :param uuid: UUID thiết bị
+        :param client_type: Loại client
+        :param ttl: Thời gian hiệu lực (giây), mặc định ``TOKEN_TTL``
+        :return: ``s1.<payload>.<chữ ký>_<username>``
+        """
+        issued_at = int(get_local_time().timestamp())
+        expires_at = issued_at + (ttl or TokenConfig.TTL)
+        raw = f"{user.id}|{client_type}|{issued_at}|{expires_at}|{uuid}"
+        body = self.signed_prefix + base64.b32encode(raw.encode()).decode().rstrip("=")
+        # Chữ ký bao cả username để không thể đổi hậu tố sang người dùng khác
+        return f"{body}.{self._signature(f'{body}|{user.username}')}_{user.username}"
+
+    def decode_token(self, token) -> dict | None:
+        """
+        Giải mã token ký số và kiểm tra chữ ký (không kiểm tra hạn và danh sách thu hồi)
+
+        :param token: Token
+        :returns: Dict {user_id, username, client_type, iat, exp, uuid, signature};
+            None nếu không phải token ký số hoặc chữ ký sai
+        """
+        # Không có TOKEN_SECRET thì không chấp nhận token ký số nào (kể cả token ký bằng SECRET_KEY trước đây)
+        if not self.is_signed(token) or not TokenConfig.SECRET:
+            return None
+        try:
+            signed, username = token.split("_", 1)
+            body, signature = signed.rsplit(".", 1)
+            if not hmac.compare_digest(signature, self._signature(f"{body}|{username}")):
+                return None
+            payload = body[len(self.signed_prefix):]
+            raw = base64.b32decode(payload + "=" * (-len(payload) % 8)).decode()
+            user_id, client_type, issued_at, expires_at, uuid = raw.split("|", 4)
+            return {
+                "user_id": int(user_id),
+                "username": username,
+                "client_type": int(client_type),
+                "iat": int(issued_at),
+                "exp": int(expires_at),
+                "uuid": uuid,
+                "signature": signature,
+            }
+        except ValueError:
+            return None
+
+    def _check_generation(self):
+        # Token bị xóa/thu hồi ở worker khác: bỏ cache xác thực và danh sách thu hồi của worker này
+        state = self._generation
+        now = monotonic()
+        if now - state["checked_at"] < 1:
+            return
+        state["checked_at"] = now
+        values = shared_store.get_many(self.generation_key, self.revoked_key)
+        generation = values.get(self.generation_key, 0)
+        revoked = values.get(self.revoked_key, 0)
+        if generation != state["value"]:
+            if state["value"] is not None:
+                token_cache.clear()
+            state["revoked"] = None
+            state["value"] = generation
+        if revoked != state["revoked_value"]:
+            # Chỉ có token bị thay thế: nạp lại danh sách thu hồi, giữ nguyên cache
+            state["revoked"] = None
+            state["revoked_value"] = revoked
+
+    def invalidate(self, *token_hashes):
+        """
+        Bỏ token (theo mã băm) khỏi cache xác thực: ngay lập tức ở worker này, các worker khác
+        qua bộ đếm ``token:generation`` (sau khi transaction hiện tại commit)
+        """
+        token_cache.delete(*token_hashes)
+
+        def notify():
+            shared_store.incr(self.generation_key)
+            self._generation["checked_at"] = 0.0
+
+        transaction.on_commit(notify)
+
+    def _revoked_hashes(self) -> frozenset:
+        self._check_generation()
+        state = self._generation
+        if state["revoked"] is None:
+            state["revoked"] = frozenset(
+                RevokedToken.objects.filter(expires_at__gt=timezone.now()).values_list("token_hash", flat=True)
+            )
+        return state["revoked"]
+
+    def get_token_entry(self, token, refresh=False) -> dict | None:
+        """
+        Thông tin xác thực của token (bản ghi trong bảng ``token``), ưu tiên cache của worker
+
+        :param token: Token
+        :param refresh: Bỏ qua cache, đọc lại từ DB
+        :returns: Dict {id, user_id, uuid, last_used_at}; None nếu token không tồn tại
+        """
+        self._check_generation()
+        key = self.hash_token(token)
+        entry = None if refresh else token_cache.get(key)
+        if entry is not None and key in self._revoked_hashes():
+            # Token đã bị thay thế khi đăng nhập lại ở worker khác
+            token_cache.delete(key)
+            entry = None
+        if entry is None:
+            row = self._get_token_row(token)
+            if row is None:
+                return None
+            entry = {"id": row.pk, "user_id": row.user_id_id, "uuid": row.uuid, "last_used_at": row.last_used_at}
+            token_cache.set(key, entry)
+        return entry
+
+    def revoke_tokens(self, *tokens):
+        """
+        Thu hồi token theo chuỗi token
+
+        :param tokens: Các token cần thu hồi
+        """
+        self._revoke({
+            self.hash_token(token): self._expires_at(claims) if (claims := self.decode_token(token)) else None
+            for token in tokens
+        })
+
+    def _revoke(self, expires: dict):
+        """
+        Token ký số được ghi vào danh sách thu hồi, mọi token bị bỏ khỏi cache xác thực
+        (token thường mất hiệu lực khi bản ghi bị xóa)
+
+        :param expires: Map {mã băm token: thời điểm hết hạn với token ký số, None với token thường}
+        """
+        revoked = [
+            RevokedToken(token_hash=token_hash, expires_at=expires_at)
+            for token_hash, expires_at in expires.items() if expires_at is not None
+        ]
+        if revoked:
+            RevokedToken.objects.bulk_create(revoked, ignore_conflicts=True)
+            # Token đã hết hạn tự mất hiệu lực, không cần giữ trong danh sách
+            RevokedToken.objects.filter(expires_at__lte=timezone.now()).delete()
+            logger.info(f"Thu hồi token ký số: {len(revoked)}")
+        if expires:
+            self.invalidate(*expires)
+
+    def _replace(self, token_hash, expires_at=None):
+        """
+        Thu hồi token cũ khi đăng nhập lại cấp token mới cho cùng thiết bị
+
+        Không tăng ``token:generation`` (không xóa cache của mọi worker): mã băm được ghi vào
+        danh sách thu hồi, các worker khác bỏ mục cache tương ứng sau khi nạp lại danh sách.
+
+        :param token_hash: Mã băm token cũ
+        :param expires_at: Thời điểm hết hạn với token ký số; token thường chỉ cần giữ đến khi
+            mục cache ở các worker hết hạn (``TOKEN_CACHE_TTL``)
+        """
+        expires_at = expires_at or timezone.now() + timedelta(seconds=TokenConfig.CACHE_TTL + 1)
+        RevokedToken.objects.bulk_create([RevokedToken(token_hash=token_hash, expires_at=expires_at)],
+                                         ignore_conflicts=True)
+        token_cache.delete(token_hash)
+
+        def notify():
+            shared_store.incr(self.revoked_key)
+            self._generation["checked_at"] = 0.0
+
+        transaction.on_commit(notify)
+
     def check_token(self, token, timeout=3600):
-        if _token := self.db.objects.filter(token=token).first():
-            return _token.last_used_at > get_local_time() - timedelta(seconds=timeout)
-        self.db.objects.filter(token=token).delete()
-        return False
+        if self.is_signed(token):
+            claims = self.decode_token(token)
+            if not claims or claims["exp"] <= get_local_time().timestamp():
+                return False
+            revoked = self._revoked_hashes()
+            # Bản ghi thu hồi trước 0010 lưu chữ ký thay vì mã băm
+            if self.hash_token(token) in revoked or claims["signature"] in revoked:
+                return False
+        # Token ký số cũng hết hiệu lực khi rảnh quá ``timeout`` như token thường
+        threshold = get_local_time() - timedelta(seconds=timeout)
+        entry = self.get_token_entry(token)
+        if entry and entry["last_used_at"] <= threshold:
+            # Worker khác có thể đã ghi last_used_at mới hơn: đọc lại trước khi từ chối
+            entry = self.get_token_entry(token, refresh=True)
+        return bool(entry) and entry["last_used_at"] > threshold
 
     def update_token(self, token):
-        if _token := self.db.objects.filter(token=token).first():
+        """
+        Ghi nhận token vừa được dùng
+
+        Bỏ qua nếu ``last_used_at`` mới hơn ``TOKEN_TOUCH_INTERVAL`` giây; ngược lại đưa vào
+        bộ đệm ``token_touch_buffer`` để ghi theo lô.
+        """
+        now = get_local_time()
+        if self.is_signed(token):
+            # Token ký số không đọc bảng token: dùng cache trong worker để giãn tần suất ghi
+            signature = token.split("_", 1)[0].rsplit(".", 1)[-1]
+            if token_touch_cache.get(signature):
+                return True
+            token_touch_cache.set(signature, True)
+            key = self.hash_token(token)
+            if entry := token_cache.get(key):
+                entry["last_used_at"] = now
+        elif entry := self.get_token_entry(token):
+            if now - entry["last_used_at"] < timedelta(seconds=TokenConfig.TOUCH_INTERVAL):
+                return True
+            entry["last_used_at"] = now
+            key = entry["id"]
+        else:
+            return False
+        if not token_touch_buffer.touch(key, now):
+            # Bộ đệm đầy: ghi thẳng
+            qs = self.db.objects.filter(token_hash=key) if isinstance(key, str) else self.db.objects.filter(pk=key)
+            qs.update(last_used_at=now)
+        return True
+
+    def update_token_by_uuid(self, uuid):
+        if _token := self.db.objects.filter(uuid=uuid).first():
             _token.last_used_at = get_local_time()
             _token.save()
+            logger.info(f"Cập nhật token theo uuid: {uuid} - {_token.pk}")
             return True
         return False
 
-    def update_token_by_uuid(self, uuid):
-        if _token := self.db.objects.filter(uuid=uuid).first():
+    async def aupdate_token_by_uuid(self, uuid):
+        if _token := await self.db.objects.filter(uuid=uuid).afirst():
             _token.last_used_at = get_local_time()
-            _token.save()
-            logger.info(f"Cập nhật token theo uuid: {uuid} - {_token.token}")
+            await _token.asave()
+            logger.info(f"Cập nhật token theo uuid: {uuid} - {_token.pk}")
             return True
         return False
 
+    def sweep_expired(self, batch_size=500, pause=0.1, timeout=None) -> dict:
+        """
+        Xóa token hết hạn theo lô (theo thứ tự ``last_used_at``) và chuyển ``LoginClient``
+        tương ứng sang trạng thái đăng xuất
+
+        Mỗi lô là một transaction ngắn, giữa các lô nghỉ ``pause`` giây để không giữ khóa ghi
+        của SQLite lâu.
+
+        :param batch_size: Số token mỗi lô
+        :param pause: Thời gian nghỉ giữa các lô (giây)
+        :param timeout: Thời gian rảnh tối đa của token thường (giây), mặc định ``TOKEN_IDLE_TIMEOUT``
+        :returns: Dict {tokens: số token đã xóa, logouts: số máy khách chuyển sang đăng xuất,
+            revoked: số bản ghi thu hồi đã hết hạn được xóa}
+        """
+        timeout = TokenConfig.IDLE_TIMEOUT if timeout is None else timeout
+        now = get_local_time()
+        # last_used_at trong DB có thể trễ tối đa TOUCH_INTERVAL + chu kỳ flush so với lần dùng thật
+        lag = TokenConfig.TOUCH_INTERVAL + TokenConfig.TOUCH_FLUSH_INTERVAL_MS / 1000
+        # Token ký số cũng bị xóa khi rảnh quá lâu; không còn bản ghi thì token mất hiệu lực
+        expired = Q(last_used_at__lt=now - timedelta(seconds=timeout + lag)) | Q(expires_at__lte=now)
+        result = {"tokens": 0, "logouts": 0, "revoked": 0}
+        while True:
+            with transaction.atomic():
+                rows = list(
+                    self.db.objects.filter(expired).order_by("last_used_at")
+                    .values_list("id", "user_id", "uuid")[:batch_size]
+                )
+                if not rows:
+                    break
+                self.db.objects.filter(id__in=[row[0] for row in rows]).delete()
+                result["tokens"] += len(rows)
+                result["logouts"] += self._logout_devices({(user_id, uuid) for _, user_id, uuid in rows})
+            if len(rows) < batch_size:
+                break
+            sleep(pause)
+        result["revoked"] = RevokedToken.objects.filter(expires_at__lte=now).delete()[0]
+        if result["tokens"]:
+            logger.info(f"Dọn token hết hạn: {result}")
+        return result
+
+    def _logout_devices(self, pairs: set) -> int:
+        """
+        Chuyển các cặp (user_id, uuid) sang đăng xuất trong một câu UPDATE, bỏ qua thiết bị
+        vẫn còn token khác (loại client khác)
+
+        :returns: Số bản ghi ``LoginClient`` đã cập nhật
+        """
+        remaining = set(self.db.objects.filter(
+            user_id__in={user_id for user_id, _ in pairs},
+            uuid__in={uuid for _, uuid in pairs},
+        ).values_list("user_id", "uuid"))
+        by_user = {}
+        for user_id, uuid in pairs - remaining:
+            by_user.setdefault(user_id, []).append(uuid)
+        if not by_user:
+            return 0
+        condition = Q()
+        for user_id, uuids in by_user.items():
+            condition |= Q(user_id=user_id, uuid__in=uuids)
+        return LoginClient.objects.filter(condition, login_status=True).update(login_status=False)
+
     def delete_token(self, token):
-        res = self.db.objects.filter(token=token).delete()
-        logger.info(f"Xóa token: {token}")
+        self.revoke_tokens(token)
+        token_hash = self.hash_token(token)
+        res = self.db.objects.filter(token_hash=token_hash).delete()
+        logger.info(f"Xóa token: {token_hash[:12]}")
         return res
 
     def delete_token_by_uuid(self, uuid):
-        res = self.db.objects.filter(uuid=uuid).delete()
+        qs = self.db.objects.filter(uuid=uuid)
+        self._revoke(dict(qs.values_list("token_hash", "expires_at")))
+        res = qs.delete()
         logger.info(f"Xóa token theo uuid: {uuid}")
         return res
 
     def delete_token_by_user(self, username: User | str):
         user = self.get_user_info(username)
-        res = self.db.objects.filter(user_id=user.id).delete()
+        qs = self.db.objects.filter(user_id=user.id)
+        self._revoke(dict(qs.values_list("token_hash", "expires_at")))
+        res = qs.delete()
         logger.info(f"Xóa token theo tên người dùng: {username}")
         return res
 
+    def revoke_sessions(self, usernames=(), group=None, uuids=(), batch_size=900) -> dict:
+        """
+        Thu hồi hàng loạt phiên đăng nhập theo người dùng, nhóm hoặc thiết bị trong một transaction
+
+        Token bị xóa (token ký số được ghi vào danh sách thu hồi), ``LoginClient`` tương ứng chuyển
+        sang đăng xuất và cache xác thực của mọi worker bị bỏ sau khi commit. Điều kiện ``IN`` được
+        chia theo ``batch_size`` giá trị, số câu lệnh chỉ tăng theo số lô chứ không theo số bản ghi.
+
+        :param usernames: Tên người dùng
+        :param group: Tên nhóm, thu hồi phiên của mọi thành viên
+        :param uuids: UUID thiết bị
+        :param batch_size: Số giá trị tối đa trong mỗi điều kiện ``IN``
+        :returns: Dict {users: số người dùng khớp, tokens: số token đã xóa, logouts: số máy khách chuyển
+            sang đăng xuất}
+        """
+        user_ids = []
+        if usernames or group:
+            users = Q(username__in=list(usernames))
+            if group:
+                users |= Q(userprofile__group__name=group)
+            user_ids = list(User.objects.filter(users).values_list("id", flat=True).distinct())
+        uuids = list(dict.fromkeys(uuids))
+        conditions = [Q(user_id__in=user_ids[i:i + batch_size]) for i in range(0, len(user_ids), batch_size)]
+        conditions += [Q(uuid__in=uuids[i:i + batch_size]) for i in range(0, len(uuids), batch_size)]
+
+        result = {"users": len(user_ids), "tokens": 0, "logouts": 0}
+        with transaction.atomic():
+            for condition in conditions:
+                qs = self.db.objects.filter(condition)
+                self._revoke(dict(qs.values_list("token_hash", "expires_at")))
+                result["tokens"] += qs.delete()[0]
+                result["logouts"] += LoginClient.objects.filter(condition, login_status=True).update(
+                    login_status=False)
+        logger.info(f"Thu hồi phiên đăng nhập: users={usernames} group={group} uuids={len(uuids)} -> {result}")
+        return result
+
+    @property
+    def context(self) -> AuthContext | None:
+        return AuthContext.of(self.request) if self.request else None
+
+    def _get_token_row(self, token) -> Token | None:
+        # Token của request hiện tại: dùng bản ghi đã đọc trong ngữ cảnh (ngữ cảnh không đọc bản ghi của token ký số)
+        if self.request and token == self.context.token and not self.is_signed(token):
+            return self.context.token_row
+        return self.db.objects.filter(token_hash=self.hash_token(token)).first()
+
     @property
     def authorization(self) -> str | None:
         if self.request:
-            return self.request.headers.get("Authorization")[7:]
+            return self.context.token
         return None
 
     @property
     def user_info(self) -> User | None:
         if self.request:
-            auth = self.authorization
-            username = auth.split("_")[-1]
-            return UserService().get_user_by_name(username)
+            return self.context.user
         return None
 
     @property
@@ -558,8 +1708,7 @@ class TokenService(BaseService):
     @property
     def request_body(self) -> dict | list:
         if self.request:
-            if body := self.request.body:
-                return json.loads(body)
+            return self.context.body
         return {}
 
     @property
@@ -570,9 +1719,13 @@ class TokenService(BaseService):
         return {}
 
     def get_cur_uuid_by_token(self, token) -> str | None:
-        if peer := self.db.objects.filter(token=token).first():
-            return peer.uuid
-        return None
+        if self.request and token == self.context.token:
+            return self.context.uuid
+        if self.is_signed(token):
+            claims = self.decode_token(token)
+            return claims["uuid"] if claims else None
+        entry = self.get_token_entry(token)
+        return entry["uuid"] if entry else None
 
 
 class TagService:
@@ -584,7 +1737,9 @@ class TagService:
 
     db_tag = Tag
     db_client = PeerInfo
-    db_client_tags = ClientTags
+    db_assignment = TagAssignment
+    # Màu nhãn tạo từ trang web theo tên (ARGB 0xFF9E9E9E, client RustDesk dùng số nguyên)
+    default_color = '4288585374'
 
     def __init__(self, guid, user: User | str):
         self.guid = guid
@@ -600,12 +1755,14 @@ class TagService:
 
     def create_tag(self, tag, color):
         res = self.db_tag.objects.create(tag=tag, color=color, guid=self.guid)
+        PersonalService.bump_revision(self.guid)
         logger.info(f"Tạo nhãn: {self.guid} - {tag} - {color}")
         return res
 
     def delete_tag(self, *tag):
         """
-        Xóa nhãn chỉ định và gỡ khỏi bảng quan hệ (bulk update một lần).
+        Xóa nhãn chỉ định; liên kết thiết bị bị xóa theo ``tag_id`` (CASCADE) trong cùng một câu DELETE,
+        không phụ thuộc kích thước danh bạ.
 
         :param str tag: Một hoặc nhiều tên nhãn cần xóa
         """
@@ -613,32 +1770,20 @@ class TagService:
         if not tags_to_delete:
             return
 
-        # Duyệt một lần để tạo danh sách update, sau đó bulk_update một lần
-        changed_instances = []
-        for inst in self.db_client_tags.objects.filter(guid=self.guid).all():
-            current_tags = self._parse_tags(inst.tags)
-            if not current_tags:
-                continue
-            new_tags = [t for t in current_tags if t not in tags_to_delete]
-            if new_tags != current_tags:
-                # Ghi lại theo định dạng JSON
-                inst.tags = json.dumps(new_tags)
-                changed_instances.append(inst)
-
-        if changed_instances:
-            self.db_client_tags.objects.bulk_update(changed_instances, ["tags"])
-
-        # Xóa nhãn
         self.db_tag.objects.filter(tag__in=tags_to_delete, guid=self.guid).delete()
+        PersonalService.bump_revision(self.guid)
         logger.info(f"Xóa nhãn: {self.guid} - {tags_to_delete}")
 
     def update_tag(self, tag, color=None, new_tag=None):
+        # Liên kết thiết bị tham chiếu theo id nhãn, đổi tên không cần ghi lại bảng liên kết
         data = {}
         if color:
             data["color"] = color
         if new_tag:
             data["tag"] = new_tag
         res = self.db_tag.objects.filter(tag=tag, guid=self.guid).update(**data)
+        if res:
+            PersonalService.bump_revision(self.guid)
         logger.info(f"Cập nhật nhãn: {self.guid} - {data}")
         return res
 
@@ -650,40 +1795,66 @@ class TagService:
         """
         return self.db_tag.objects.filter(guid=self.guid).all()
 
-    def set_user_tag_by_peer_id(self, peer_id, tags):
+    @staticmethod
+    def split_tags(text) -> list[str]:
+        """
+        Tách chuỗi nhãn phân cách bằng dấu phẩy: bỏ khoảng trắng, bỏ trùng, giữ thứ tự.
+
+        :param text: Chuỗi nhãn, ví dụ ``"a, b"``
+        :returns: Danh sách tên nhãn
         """
-        Gán nhãn cho thiết bị (ghi đè).
+        parts = [p.strip() for p in str(text or '').split(',')]
+        return list(dict.fromkeys(p for p in parts if p))
+
+    def set_tags(self, peer_id, tags, create_missing=False):
+        """
+        Gán nhãn cho thiết bị (ghi đè) bằng các câu lệnh theo tập hợp.
 
         :param peer_id: peer_id thiết bị
-        :param tags: Danh sách nhãn
-        :returns: Bản ghi được cập nhật hoặc tạo mới
+        :param tags: Danh sách tên nhãn; rỗng là xóa hết nhãn của thiết bị
+        :param create_missing: Tạo nhãn chưa tồn tại trong danh bạ (màu mặc định); nếu không thì bỏ qua
+        :returns: Danh sách id nhãn đã gán
         """
-        tag_list = []
-        for tag in self.get_tags_by_name(*list(tags)):
-            tag_list.append(tag.id)
+        names = list(dict.fromkeys(str(t) for t in tags or [] if t is not None and str(t)))
+        with transaction.atomic():
+            tag_ids = dict(self.get_tags_by_name(*names).values_list("tag", "id")) if names else {}
+            missing = [name for name in names if name not in tag_ids]
+            if create_missing and missing:
+                self.db_tag.objects.bulk_create(
+                    [self.db_tag(tag=name, color=self.default_color, guid=self.guid) for name in missing],
+                    ignore_conflicts=True,
+                )
+                tag_ids = dict(self.get_tags_by_name(*names).values_list("tag", "id"))
+            ids = list(tag_ids.values())
+            self.db_assignment.objects.filter(guid=self.guid, peer_id=peer_id).exclude(tag_id__in=ids).delete()
+            self.db_assignment.objects.bulk_create(
+                [self.db_assignment(guid=self.guid, peer_id=peer_id, tag_id=tag_id) for tag_id in ids],
+                ignore_conflicts=True,
+            )
+            PersonalService.bump_revision(self.guid)
+        logger.info(f"Gán nhãn: {self.guid} - {peer_id} - {names}")
+        return ids
 
-        # if qs := self.db_client_tags.objects.filter(peer_id=peer_id, guid=self.guid).first():
-        if qs := self.user.user_tags.filter(peer_id=peer_id, guid=self.guid).first():
-            qs.tags = str(tag_list if tag_list else [])
-            return qs.save()
+    def set_user_tag_by_peer_id(self, peer_id, tags):
+        """
+        Gán nhãn cho thiết bị (ghi đè), bỏ qua nhãn chưa tồn tại trong danh bạ.
 
-        kwargs = {
-            "peer_id": peer_id,
-            "tags": str(tag_list),
-            "guid": self.guid,
-        }
-        res = self.user.user_tags.create(**kwargs)
-        logger.info(f"Gán nhãn: {self.guid} - {peer_id} - {tag_list if tag_list else []}")
-        return res
+        :param peer_id: peer_id thiết bị
+        :param tags: Danh sách nhãn
+        :returns: Danh sách id nhãn đã gán
+        """
+        return self.set_tags(peer_id, list(tags))
 
     def del_tag_by_peer_id(self, *peer_id):
         """
-        Xóa bản ghi nhãn của thiết bị chỉ định.
+        Xóa liên kết nhãn của thiết bị chỉ định.
 
         :param peer_id: Một hoặc nhiều peer_id thiết bị
         :returns: Kết quả xóa (rows_deleted, details)
         """
-        res = self.user.user_tags.filter(peer_id__in=peer_id, guid=self.guid).delete()
+        res = self.db_assignment.objects.filter(peer_id__in=peer_id, guid=self.guid).delete()
+        if res[0]:
+            PersonalService.bump_revision(self.guid)
         logger.info(f"Xóa nhãn: {self.guid} - {peer_id}")
         return res
 
@@ -694,66 +1865,50 @@ class TagService:
         :param peer_id: peer_id thiết bị
         :returns: Danh sách nhãn; không có thì trả về []
         """
-        row = self.user.user_tags.filter(peer_id=peer_id, guid=self.guid).values("tags").first()
-        if not row:
-            return []
-        return self._parse_tags(row.get("tags"))
+        return list(
+            self.db_assignment.objects.filter(guid=self.guid, peer_id=peer_id)
+            .order_by("tag_id").values_list("tag__tag", flat=True)
+        )
+
+    def get_peer_ids_by_tag(self, *tag) -> list[str]:
+        """
+        Lấy các thiết bị trong danh bạ có ít nhất một nhãn chỉ định.
 
-    def get_tags_map(self, peer_ids: list[str]) -> dict[str, list[str]]:
+        :param tag: Một hoặc nhiều tên nhãn
+        :returns: Danh sách peer_id
         """
-        Lấy map nhãn cho nhiều thiết bị, tránh truy vấn N+1.
+        return list(
+            self.db_assignment.objects.filter(guid=self.guid, tag__tag__in=tag)
+            .values_list("peer_id", flat=True).distinct()
+        )
+
+    def get_tags_map(self, peer_ids: list[str], batch_size=500) -> dict[str, list[str]]:
+        """
+        Lấy map nhãn cho nhiều thiết bị bằng một truy vấn JOIN, tránh truy vấn N+1.
+
+        Danh sách dài hơn ``batch_size`` không đưa vào điều kiện ``IN`` (giới hạn tham số của SQLite)
+        mà đọc toàn bộ liên kết của danh bạ qua chỉ mục ``guid`` rồi lọc trong bộ nhớ, nên luôn chỉ
+        có một truy vấn với mọi kích thước danh bạ.
 
         :param peer_ids: Danh sách `peer_id` thiết bị
+        :param batch_size: Số `peer_id` tối đa trong điều kiện ``IN``
         :returns: Map {peer_id: [tag, ...]}
         """
         if not peer_ids:
             return {}
-        rows = self.db_client_tags.objects.filter(guid=self.guid, peer_id__in=peer_ids).values("peer_id", "tags")
-        logger.debug(f"Lấy nhãn theo batch: {self.guid} peers: {peer_ids} result: {rows}")
+        wanted = set(peer_ids)
+        rows = self.db_assignment.objects.filter(guid=self.guid)
+        if len(wanted) <= batch_size:
+            rows = rows.filter(peer_id__in=wanted)
+        # Sắp theo (peer_id, tag_id) để dùng chỉ mục duy nhất (guid, peer_id, tag), không quét cả danh bạ với IN
+        rows = rows.order_by("peer_id", "tag_id").values_list("peer_id", "tag__tag")
         result: dict[str, list[str]] = {}
-        for row in rows:
-            tags = eval(row.get("tags") or '[]')
-            tags_qs = self.get_tags_by_id(*tags)
-            logger.debug(f"Nhãn: {self.guid} peers: {row['peer_id']} tags: {tags} result: {tags_qs}")
-            if not tags_qs:
-                continue
-            result[row["peer_id"]] = [str(tag.tag) for tag in tags_qs]
-        logger.debug(f"Kết quả lấy nhãn batch: guid: {self.guid} peers: {peer_ids} result: {result}")
+        for peer_id, tag in rows:
+            if peer_id in wanted:
+                result.setdefault(peer_id, []).append(tag)
+        logger.debug(f"Kết quả lấy nhãn batch: guid: {self.guid} peers: {len(peer_ids)} result: {len(result)}")
         return result
 
-    @staticmethod
-    def _parse_tags(raw) -> list[str]:
-        """
-        Phân tích trường nhãn lưu trong DB.
-
-        Hỗ trợ chuỗi list đã serialize và chuỗi JSON.
-
-        :param raw: Giá trị lưu gốc (chuỗi hoặc list)
-        :returns: Danh sách nhãn
-        """
-        if raw is None:
-            return []
-        if isinstance(raw, list):
-            return [str(x) for x in raw]
-        s = str(raw).strip()
-        if not s:
-            return []
-        # Ưu tiên thử JSON
-        try:
-            val = json.loads(s)
-            if isinstance(val, list):
-                return [str(x) for x in val]
-        except Exception:
-            pass
-        # Fallback sang literal_eval an toàn
-        try:
-            val = ast.literal_eval(s)
-            if isinstance(val, list):
-                return [str(x) for x in val]
-        except Exception:
-            pass
-        return []
-
 
 class LogService(BaseService):
     """
@@ -832,29 +1987,9 @@ class AuditConnService(BaseService):
         else:
             user_id = ''
         if action:
-            if action == "new":
-                self.db.objects.create(
-                    conn_id=conn_id,
-                    action=action,
-                    controlled_uuid=controlled_uuid,
-                    initiating_ip=source_ip,
-                    session_id=session_id,
-                )
-            else:
-                connect_log = self.db.objects.filter(
-                    conn_id=conn_id,
-                    action="new",
-                ).first()
-                self.db.objects.create(
-                    conn_id=conn_id,
-                    action=action,
-                    controlled_uuid=controlled_uuid,
-                    controller_uuid=connect_log.controller_uuid,
-                    initiating_ip=connect_log.initiating_ip,
-                    session_id=session_id,
-                    user_id=connect_log.user_id,
-                    type=connect_log.type,
-                )
+            connect_log = None if action == "new" else self.db.objects.filter(conn_id=conn_id, action="new").first()
+            self.db.objects.create(
+                **self._event_fields(conn_id, action, controlled_uuid, source_ip, session_id, connect_log))
         else:
             self.db.objects.filter(conn_id=conn_id).update(
                 session_id=session_id,
@@ -862,6 +1997,67 @@ class AuditConnService(BaseService):
                 user_id=user_id,
                 type=type_,
             )
+        self._log_event(conn_id, action, controlled_uuid, source_ip, session_id)
+
+    async def alog(
+            self,
+            conn_id,
+            action,
+            controlled_uuid,
+            source_ip,
+            session_id,
+            controller_peer_id=None,
+            type_=0,
+            username=None
+    ):
+        """
+        Phiên bản async của ``log``
+        """
+        if username:
+            user_info = await UserService().aget_user_by_name(username)
+            user_id = user_info.id if user_info else ''
+        else:
+            user_id = ''
+        if action:
+            connect_log = None if action == "new" else await self.db.objects.filter(
+                conn_id=conn_id, action="new").afirst()
+            await self.db.objects.acreate(
+                **self._event_fields(conn_id, action, controlled_uuid, source_ip, session_id, connect_log))
+        else:
+            controller = await PeerInfo.objects.filter(peer_id=controller_peer_id).afirst()
+            await self.db.objects.filter(conn_id=conn_id).aupdate(
+                session_id=session_id,
+                controller_uuid=controller.uuid,
+                user_id=user_id,
+                type=type_,
+            )
+        self._log_event(conn_id, action, controlled_uuid, source_ip, session_id)
+
+    @staticmethod
+    def _event_fields(conn_id, action, controlled_uuid, source_ip, session_id, connect_log=None) -> dict:
+        """
+        Trường của bản ghi sự kiện kết nối: ``new`` lấy IP từ request, các sự kiện sau kế thừa
+        người khởi tạo, IP và loại kết nối từ bản ghi ``new``
+        """
+        fields = {
+            "conn_id": conn_id,
+            "action": action,
+            "controlled_uuid": controlled_uuid,
+            "session_id": session_id,
+        }
+        if action == "new":
+            fields["initiating_ip"] = source_ip
+        else:
+            fields.update(
+                controller_uuid=connect_log.controller_uuid,
+                initiating_ip=connect_log.initiating_ip,
+                user_id=connect_log.user_id,
+                type=connect_log.type,
+            )
+        return fields
+
+    @staticmethod
+    def _log_event(conn_id, action, controlled_uuid, source_ip, session_id):
         logger.info(
             f'Audit kết nối: conn_id="{conn_id}", action="{action}", controlled_uuid="{controlled_uuid}", source_ip="{source_ip}", session_id="{session_id}"'
         )
@@ -886,6 +2082,12 @@ class AuditFileLogService(BaseService):
             return qs.conn_id
         return None
 
+    async def aget_conn_id(self):
+        qs = await self.conn_service.db.objects.afirst()
+        if qs.type == 1:
+            return qs.conn_id
+        return None
+
     def log(
             self,
             source_id,
@@ -917,6 +2119,40 @@ class AuditFileLogService(BaseService):
         )
         return res
 
+    async def alog(
+            self,
+            source_id,
+            target_id,
+            target_uuid,
+            target_ip,
+            operation_type,
+            is_file,
+            remote_path,
+            file_info,
+            user_id,
+            file_num,
+    ):
+        """
+        Phiên bản async của ``log``
+        """
+        res = await self.db.objects.acreate(
+            conn_id=await self.aget_conn_id(),
+            source_id=source_id,
+            target_id=target_id,
+            target_uuid=target_uuid,
+            target_ip=target_ip,
+            operation_type=operation_type,
+            is_file=is_file,
+            remote_path=remote_path,
+            file_info=file_info,
+            user_id=user_id,
+            file_num=file_num,
+        )
+        logger.info(
+            f'Audit file: source_id="{source_id}", target_id="{target_id}", target_uuid="{target_uuid}", operation_type="{operation_type}", is_file="{is_file}", remote_path="{remote_path}", user_id="{user_id}", file_num="{file_num}"'
+        )
+        return res
+
 
 class PersonalService(BaseService):
     db = Personal
@@ -952,7 +2188,7 @@ class PersonalService(BaseService):
     def get_peers_by_personal(self, guid):
         personal = self.get_personal(guid=guid)
         if personal:
-            return personal.personal_peer.all()
+            return personal.personal_peer.select_related('peer').all()
         return []
 
     def delete_personal(self, guid):
@@ -979,9 +2215,46 @@ class PersonalService(BaseService):
         logger.info(f'Hủy chia sẻ sổ địa chỉ: guid={guid}, username={username}')
         return res
 
+    @staticmethod
+    def bump_revision(*guids) -> int:
+        """
+        Tăng phiên bản nội dung của sổ địa chỉ (dùng cho ETag của ``/api/ab/peers`` và ``/api/ab/tags``)
+
+        :param guids: GUID hoặc đối tượng ``Personal``
+        :returns: Số sổ địa chỉ đã cập nhật
+        """
+        guids = [guid.guid if isinstance(guid, Personal) else guid for guid in guids if guid]
+        if not guids:
+            return 0
+        return Personal.objects.filter(guid__in=guids).update(revision=F("revision") + 1)
+
+    @staticmethod
+    def bump_peer_revision(uuid) -> int:
+        """
+        Tăng phiên bản mọi sổ địa chỉ chứa thiết bị (tên người dùng, tên máy, hệ điều hành của thiết bị
+        nằm trong nội dung ``/api/ab/peers``)
+
+        :param uuid: UUID thiết bị
+        :returns: Số sổ địa chỉ đã cập nhật
+        """
+        return PersonalService._peer_personals(uuid).update(revision=F("revision") + 1)
+
+    @staticmethod
+    async def abump_peer_revision(uuid) -> int:
+        """
+        Phiên bản async của ``bump_peer_revision``
+        """
+        return await PersonalService._peer_personals(uuid).aupdate(revision=F("revision") + 1)
+
+    @staticmethod
+    def _peer_personals(uuid):
+        return Personal.objects.filter(guid__in=PeerPersonal.objects.filter(peer__uuid=uuid).values("personal_id"))
+
     def add_peer_to_personal(self, guid, peer_id):
         peer = PeerInfoService().get_peer_info_by_peer_id(peer_id)
-        return self.get_personal(guid=guid).personal_peer.create(peer=peer)
+        res = self.get_personal(guid=guid).personal_peer.create(peer=peer)
+        self.bump_revision(guid)
+        return res
 
     def del_peer_to_personal(self, guid, peer_id: list | str, user):
         if isinstance(peer_id, str):
@@ -996,6 +2269,7 @@ class PersonalService(BaseService):
         tag_service = TagService(guid=guid, user=user)
         tag_service.del_tag_by_peer_id(*peer_id)
         res = self.get_personal(guid=guid).personal_peer.filter(peer__in=peers).delete()
+        self.bump_revision(guid)
         logger.info(f'Gỡ thiết bị khỏi sổ địa chỉ: guid={guid}, peer_ids={peer_id}')
         return res
 
@@ -1023,6 +2297,7 @@ class AliasService(BaseService):
         updated = self.db.objects.filter(peer_id_id=peer_id, guid_id=guid).update(**kwargs)
         if not updated:
             self.db.objects.create(**kwargs)
+        PersonalService.bump_revision(guid)
         logger.info(f'Đặt alias: peer_id="{peer_id}", alias="{alias}", guid="{guid}"')
 
     def get_alias(self, guid):
@@ -1042,7 +2317,10 @@ class AliasService(BaseService):
         return {row["peer_id"]: row["alias"] for row in rows}
 
     def delete_alias(self, *peer_ids, guid):
-        return self.db.objects.filter(guid=guid, peer_id__in=peer_ids).delete()
+        res = self.db.objects.filter(guid=guid, peer_id__in=peer_ids).delete()
+        if res[0]:
+            PersonalService.bump_revision(guid)
+        return res
 
 
 class SharePersonalService(BaseService):
@@ -1075,13 +2353,16 @@ class SharePersonalService(BaseService):
         profile = getattr(self.user, "userprofile", None)
         if not profile:
             group = GroupService().default_group()
-            profile, _ = UserPrefile.objects.get_or_create(
+            profile, created = UserPrefile.objects.get_or_create(
                 user=self.user,
                 defaults={"group": group},
             )
             if profile.group_id is None:
                 profile.group = group
                 profile.save(update_fields=["group"])
+                created = True
+            if created:
+                StrategyService().refresh_users(self.user.username)
         group_id = profile.group_id
         personal_ids = self.db.objects.filter(
             to_share_id__in=(self.user.id, group_id),
@@ -0,0 +1,82 @@
+import logging
+import os
+import threading
+import time
+
+from django.db import close_old_connections
+
+from apps.db.service import TokenService
+from common.env import TokenConfig
+from common.shared_store import shared_store
+
+logger = logging.getLogger(__name__)
+
+
+class TokenSweeper:
+    """
+    Dọn token hết hạn định kỳ bằng luồng nền trong worker.
+
+    Mọi worker cùng chạy luồng này nhưng dùng chung mốc ``token:sweep:at`` trong ``SharedStore``:
+    mỗi chu kỳ chỉ worker giành được mốc mới thực hiện ``TokenService.sweep_expired``.
+
+    :param interval: Chu kỳ dọn (giây), ``0`` là tắt
+    :param batch_size: Số token mỗi lô
+    :param pause_ms: Thời gian nghỉ giữa các lô (mili giây)
+    """
+
+    name = 'token-sweeper'
+    key = 'token:sweep:at'
+
+    def __init__(self, interval=0, batch_size=500, pause_ms=100):
+        self.interval = interval
+        self.batch_size = max(batch_size, 1)
+        self.pause = max(pause_ms, 0) / 1000
+        self._stopped = threading.Event()
+        self._thread: threading.Thread | None = None
+        self._pid = None
+
+    def start(self):
+        """
+        Khởi động luồng nền cho tiến trình hiện tại (bỏ qua nếu đã chạy hoặc đã tắt).
+        """
+        if self.interval <= 0 or self._pid == os.getpid():
+            return
+        self._pid = os.getpid()
+        self._stopped.clear()
+        self._thread = threading.Thread(target=self._run, name=self.name, daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stopped.set()
+
+    def claim(self) -> bool:
+        """
+        Giành lượt dọn của chu kỳ hiện tại.
+
+        :returns: ``True`` nếu chưa worker nào dọn trong ``interval`` giây gần nhất
+        """
+        now = time.time()
+        _, claimed_at = shared_store.update(
+            self.key,
+            lambda at: now if now - (at or 0) >= self.interval else at,
+            default=0,
+        )
+        return claimed_at == now
+
+    def _run(self):
+        while not self._stopped.wait(self.interval):
+            try:
+                close_old_connections()
+                if self.claim():
+                    TokenService().sweep_expired(batch_size=self.batch_size, pause=self.pause)
+            except Exception:
+                logger.exception(f'[{self.name}] dọn token thất bại')
+            finally:
+                close_old_connections()
+
+
+token_sweeper = TokenSweeper(
+    interval=TokenConfig.SWEEP_INTERVAL,
+    batch_size=TokenConfig.SWEEP_BATCH_SIZE,
+    pause_ms=TokenConfig.SWEEP_PAUSE_MS,
+)
@@ -1,6 +1,6 @@
 from django.urls import path
 
-from apps.web import view_auth, view_home, view_user, view_personal
+from apps.web import view_auth, view_home, view_user, view_personal, view_metrics, view_strategy
 
 urlpatterns = [
     path('', view_auth.index),
@@ -12,10 +12,12 @@ urlpatterns = [
     path('device/detail', view_home.device_detail, name='web_device_detail'),
     path('device/update', view_home.update_device, name='web_device_update'),
     path('device/statuses', view_home.device_statuses, name='web_device_statuses'),
+    path('device/disconnect', view_home.disconnect_device, name='web_device_disconnect'),
     path('user/update', view_user.update_user, name='web_user_update'),
     path('user/reset-password', view_user.reset_user_password, name='web_user_reset_password'),
     path('user/delete', view_user.delete_user, name='web_user_delete'),
     path('user/create', view_user.create_user, name='web_user_create'),
+    path('user/revoke-sessions', view_user.revoke_sessions, name='web_user_revoke_sessions'),
     # 地址簿相关路由
     path('personal/list', view_personal.get_personal_list, name='web_personal_list'),
     path('personal/create', view_personal.create_personal, name='web_personal_create'),
@@ -26,4 +28,12 @@ urlpatterns = [
     path('personal/remove-device', view_personal.remove_device_from_personal, name='web_personal_remove_device'),
     path('personal/update-alias', view_personal.update_device_alias_in_personal, name='web_personal_update_alias'),
     path('personal/update-tags', view_personal.update_device_tags_in_personal, name='web_personal_update_tags'),
+    # 客户端策略
+    path('strategy/list', view_strategy.strategy_list, name='web_strategy_list'),
+    path('strategy/save', view_strategy.save_strategy, name='web_strategy_save'),
+    path('strategy/delete', view_strategy.delete_strategy, name='web_strategy_delete'),
+    path('strategy/assign', view_strategy.assign_strategy, name='web_strategy_assign'),
+    # 运行指标
+    path('metrics/heartbeat', view_metrics.heartbeat_metrics, name='web_metrics_heartbeat'),
+    path('metrics/uptime', view_metrics.peer_uptime, name='web_metrics_uptime'),
 ]
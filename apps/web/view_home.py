@@ -1,16 +1,15 @@
-from datetime import timedelta
-
 from django.contrib.auth.decorators import login_required
 from django.contrib.auth.models import User
 from django.core.paginator import Paginator
-from django.db.models import Q, Exists, OuterRef, F, Subquery
+from django.db.models import Q, OuterRef, F, Subquery, ExpressionWrapper, BooleanField
 from django.http import HttpRequest, HttpResponse, JsonResponse
 from django.shortcuts import render
-from django.utils import timezone
 from django.views.decorators.http import require_http_methods
 
 from apps.client_apis.common import request_debug_log
-from apps.db.models import PeerInfo, HeartBeat, Alias, ClientTags, Personal
+from apps.client_apis.conn_registry import conn_registry
+from apps.db.models import PeerInfo, Alias, Personal, TagAssignment
+from apps.db.service import AliasService, PeerInfoService, TagService
 from apps.web.view_personal import is_default_personal
 
 
@@ -92,6 +91,7 @@ def nav_content(request: HttpRequest) -> HttpResponse:
         :query q: 关键词，匹配设备ID/设备名（可空）
         :query os: 操作系统筛选（可空；模糊匹配）
         :query status: 在线状态（online/offline，可空）
+        :query sort: 排序方式（last_seen 按最近在线时间，默认按创建时间）
         :returns: 注入模板的设备分页、筛选上下文
         :rtype: HttpResponse
         """
@@ -110,15 +110,13 @@ def nav_content(request: HttpRequest) -> HttpResponse:
         os_param = (request.GET.get('os') or '').strip()
         status = (request.GET.get('status') or '').strip().lower()
 
-        # 在线判定：心跳表 5 分钟内有记录视为在线
-        online_threshold = timezone.now() - timedelta(minutes=5)
-        recent_hb = HeartBeat.objects.filter(
-            Q(peer_id=OuterRef('peer_id')) | Q(uuid=OuterRef('uuid')),
-            modified_at__gte=online_threshold
-        ).values('pk')[:1]
+        sort = (request.GET.get('sort') or '').strip()
+
+        # 在线判定：5 分钟内有心跳（last_seen_at 由心跳路径维护）视为在线
+        online_threshold = PeerInfoService.online_threshold()
 
         base_qs = PeerInfo.objects.all().annotate(
-            is_online=Exists(recent_hb),
+            is_online=ExpressionWrapper(Q(last_seen_at__gte=online_threshold), output_field=BooleanField()),
             owner_username=F('username'),
             # 别名：取任意一个别名（如存在）
             alias=Subquery(
@@ -126,22 +124,20 @@ def nav_content(request: HttpRequest) -> HttpResponse:
                     peer_id=OuterRef('peer_id')
                 ).values('alias')[:1]
             ),
-            # 标签：取当前登录用户下的一个标签（如存在）
-            tags=Subquery(
-                ClientTags.objects.filter(
-                    peer_id=OuterRef('peer_id'),
-                    user_id=request.user.id
-                ).values('tags')[:1]
-            )
-        ).order_by('-created_at')
+        )
+        if sort == 'last_seen':
+            base_qs = base_qs.order_by(F('last_seen_at').desc(nulls_last=True), '-created_at')
+        else:
+            base_qs = base_qs.order_by('-created_at')
 
         if q:
             base_qs = base_qs.filter(Q(peer_id__icontains=q) | Q(device_name__icontains=q))
         if os_param:
             base_qs = base_qs.filter(os__icontains=os_param)
-        if status in ('online', 'offline'):
-            want_online = (status == 'online')
-            base_qs = base_qs.filter(is_online=want_online)
+        if status == 'online':
+            base_qs = base_qs.filter(last_seen_at__gte=online_threshold)
+        elif status == 'offline':
+            base_qs = base_qs.filter(Q(last_seen_at__lt=online_threshold) | Q(last_seen_at__isnull=True))
 
         paginator = Paginator(base_qs, page_size)
         page_obj = paginator.get_page(page)
@@ -156,6 +152,7 @@ def nav_content(request: HttpRequest) -> HttpResponse:
             'q': q,
             'os': os_param,
             'status': status,
+            'sort': sort,
         })
     elif key == 'nav-3':  # 用户管理
         # 分页参数
@@ -266,11 +263,7 @@ def rename_alias(request: HttpRequest) -> JsonResponse:
         personal_name='默认地址簿',
         defaults={}
     )
-    Alias.objects.update_or_create(
-        peer_id=peer,
-        guid=personal,
-        defaults={'alias': alias_text}
-    )
+    AliasService().set_alias(peer_id=peer.peer_id, alias=alias_text, guid=personal.guid)
     return JsonResponse({'ok': True})
 
 
@@ -283,7 +276,7 @@ def device_detail(request: HttpRequest) -> JsonResponse:
 
     :param request: Http 请求对象，GET 参数包含 peer_id
     :type request: HttpRequest
-    :return: JSON 响应，包含 peer_id/username/hostname/alias/platform/tags
+    :return: JSON 响应，包含 peer_id/username/hostname/alias/platform/tags/conns（活动连接 ID）
     :rtype: JsonResponse
     """
     peer_id = (request.GET.get('peer_id') or '').strip()
@@ -305,8 +298,13 @@ def device_detail(request: HttpRequest) -> JsonResponse:
     else:
         alias_text = alias_qs.values_list('alias', flat=True).first()
     alias_text = alias_text or ''
-    # 当前用户下的标签（可能多条）
-    tag_list = list(ClientTags.objects.filter(user_id=request.user.id, peer_id=peer_id).values_list('tags', flat=True))
+    # 当前用户各地址簿下的标签（去重）
+    tag_list = list(dict.fromkeys(
+        TagAssignment.objects.filter(
+            peer_id=peer_id,
+            guid__in=Personal.objects.filter(create_user_id=request.user.id).values('guid'),
+        ).order_by('tag_id').values_list('tag__tag', flat=True)
+    ))
     # 构造响应
     data = {
         'peer_id': peer.peer_id,
@@ -315,6 +313,8 @@ def device_detail(request: HttpRequest) -> JsonResponse:
         'alias': alias_text,
         'platform': peer.os,
         'tags': tag_list,
+        'conns': conn_registry.get(peer.uuid),
+        'can_disconnect': request.user.is_staff,
     }
     return JsonResponse({'ok': True, 'data': data})
 
@@ -335,7 +335,7 @@ def update_device(request: HttpRequest) -> JsonResponse:
     :rtype: JsonResponse
     :notes:
     - 别名写入当前用户的“默认地址簿”（不存在则创建）
-    - 标签写入 ClientTags（当前用户 + 默认地址簿 guid 作用域）
+    - 标签写入默认地址簿（guid 作用域）的标签关联，不存在的标签按名称创建
     """
     peer_id = (request.POST.get('peer_id') or '').strip()
     if not peer_id:
@@ -359,41 +359,51 @@ def update_device(request: HttpRequest) -> JsonResponse:
     if alias_text is not None:
         alias_text = alias_text.strip()
         if alias_text:
-            Alias.objects.update_or_create(
-                peer_id=peer,
-                guid=personal,
-                defaults={'alias': alias_text}
-            )
+            AliasService().set_alias(peer_id=peer.peer_id, alias=alias_text, guid=personal.guid)
         else:
             # 空字符串表示清除当前作用域下别名
-            Alias.objects.filter(peer_id=peer, guid=personal).delete()
+            AliasService().delete_alias(peer.peer_id, guid=personal.guid)
 
     # 更新标签（当 tags 参数存在时）
     if tags_str is not None:
-        # 归一化标签：逗号分隔，去空白、去重，保持顺序
-        parts = [p.strip() for p in tags_str.split(',')] if tags_str is not None else []
-        parts = [p for p in parts if p]
-        seen = set()
-        uniq = []
-        for p in parts:
-            if p not in seen:
-                seen.add(p)
-                uniq.append(p)
-        joined = ', '.join(uniq)
-        if joined:
-            ClientTags.objects.update_or_create(
-                user_id=request.user.id,
-                peer_id=peer_id,
-                guid=personal.guid,
-                defaults={'tags': joined}
-            )
-        else:
-            # 空表示清空标签
-            ClientTags.objects.filter(user_id=request.user.id, peer_id=peer_id, guid=personal.guid).delete()
+        # 归一化标签：逗号分隔，去空白、去重，保持顺序；空表示清空标签
+        TagService(guid=personal.guid, user=request.user).set_tags(
+            peer_id, TagService.split_tags(tags_str), create_missing=True)
 
     return JsonResponse({'ok': True})
 
 
+@request_debug_log
+@require_http_methods(['POST'])
+@login_required(login_url='web_login')
+def disconnect_device(request: HttpRequest) -> JsonResponse:
+    """
+    断开设备的远程连接（仅限管理员）
+
+    :param request: Http 请求对象，POST 参数：
+        - peer_id: 设备ID（必填）
+        - conn_ids: 连接ID，逗号分隔（可选，空则断开全部活动连接）
+    :type request: HttpRequest
+    :return: JSON 响应，形如 {"ok": true, "data": {"pending": [...]}}
+    :rtype: JsonResponse
+    :notes:
+    - 指令写入跨 worker 共享的连接表，在设备下一次心跳的 ``disconnect`` 中下发
+    """
+    if not request.user.is_staff:
+        return JsonResponse({'ok': False, 'err_msg': 'Không có quyền'}, status=403)
+    peer_id = (request.POST.get('peer_id') or '').strip()
+    if not peer_id:
+        return JsonResponse({'ok': False, 'err_msg': 'Tham số không hợp lệ'}, status=400)
+    peer = PeerInfo.objects.filter(peer_id=peer_id).only('uuid').first()
+    if not peer:
+        return JsonResponse({'ok': False, 'err_msg': 'Thiết bị không tồn tại'}, status=404)
+    conn_ids = [c for c in (request.POST.get('conn_ids') or '').split(',') if c.strip()] or None
+    pending = conn_registry.request_disconnect(peer.uuid, conn_ids)
+    if not pending:
+        return JsonResponse({'ok': False, 'err_msg': 'Không có kết nối đang hoạt động'}, status=400)
+    return JsonResponse({'ok': True, 'data': {'pending': pending}})
+
+
 @request_debug_log
 @require_http_methods(['GET'])
 @login_required(login_url='web_login')
@@ -418,12 +428,12 @@ def device_statuses(request: HttpRequest) -> JsonResponse:
     if not peer_ids:
         return JsonResponse({'ok': True, 'data': {}})
     peer_ids = peer_ids[:500]
-    # 60s 内有心跳视为在线
-    online_threshold = timezone.now() - timedelta(seconds=60)
-    online_qs = HeartBeat.objects.filter(
+    # 在最长心跳间隔（含落库延迟）内有心跳视为在线
+    online_threshold = PeerInfoService.online_threshold()
+    online_qs = PeerInfo.objects.filter(
         peer_id__in=peer_ids,
-        modified_at__gte=online_threshold
-    ).values_list('peer_id', flat=True).distinct()
+        last_seen_at__gte=online_threshold
+    ).values_list('peer_id', flat=True)
     online_set = set(online_qs)
     data = {pid: {'is_online': (pid in online_set)} for pid in peer_ids}
     return JsonResponse({'ok': True, 'data': data})
@@ -0,0 +1,83 @@
+import os
+from datetime import date, timedelta
+
+from django.contrib.auth.decorators import login_required
+from django.http import HttpRequest, JsonResponse
+from django.views.decorators.http import require_http_methods
+
+from apps.client_apis.common import request_debug_log
+from apps.client_apis.heartbeat_load import heartbeat_load
+from apps.db.buffer import heartbeat_buffer
+from apps.db.models import PeerInfo
+from apps.db.service import PeerInfoService, UptimeService
+from common.utils import get_local_time
+
+
+@request_debug_log
+@require_http_methods(['GET'])
+@login_required(login_url='web_login')
+def heartbeat_metrics(request: HttpRequest) -> JsonResponse:
+    """
+    心跳负载指标（仅限管理员）
+
+    :param request: GET 请求
+    :return: {"ok": true, "data": {...}}
+    :notes:
+    - ``worker`` 下的数据仅代表处理本次请求的 gunicorn worker
+    - ``fleet.beat_rate`` 为在线设备按建议间隔心跳时的全网有效心跳速率（次/秒）
+    """
+    if not request.user.is_staff:
+        return JsonResponse({'ok': False, 'err_msg': 'Không có quyền'}, status=403)
+    load = heartbeat_load.stats()
+    online = PeerInfo.objects.filter(last_seen_at__gte=PeerInfoService.online_threshold()).count()
+    data = {
+        'worker': {
+            'pid': os.getpid(),
+            'load': load,
+            'buffer': heartbeat_buffer.stats(),
+        },
+        'fleet': {
+            'online': online,
+            'beat_rate': round(online / max(load['suggested_interval'], 1), 3),
+        },
+    }
+    return JsonResponse({'ok': True, 'data': data})
+
+
+@request_debug_log
+@require_http_methods(['GET'])
+@login_required(login_url='web_login')
+def peer_uptime(request: HttpRequest) -> JsonResponse:
+    """
+    设备在线历史（仅限管理员）
+
+    :param request: GET 请求，参数：
+        - ``peer_id``：设备 ID，多个以逗号分隔（多个时只返回在线率）
+        - ``start``/``end``：日期 ``YYYY-MM-DD``，默认最近 ``days`` 天
+        - ``days``：默认 30
+        - ``min_outage``：短于该分钟数的空档视为在线
+    :return: {"ok": true, "data": {...}}
+    """
+    if not request.user.is_staff:
+        return JsonResponse({'ok': False, 'err_msg': 'Không có quyền'}, status=403)
+    peer_ids = [p for p in (request.GET.get('peer_id') or '').split(',') if p.strip()]
+    if not peer_ids:
+        return JsonResponse({'ok': False, 'err_msg': 'Thiếu peer_id'}, status=400)
+    try:
+        today = get_local_time().date()
+        end = date.fromisoformat(request.GET['end']) if request.GET.get('end') else today
+        start = (date.fromisoformat(request.GET['start']) if request.GET.get('start')
+                 else end - timedelta(days=int(request.GET.get('days') or 30) - 1))
+        min_outage = int(request.GET['min_outage']) if request.GET.get('min_outage') else None
+    except ValueError:
+        return JsonResponse({'ok': False, 'err_msg': 'Tham số không hợp lệ'}, status=400)
+    if start > end:
+        return JsonResponse({'ok': False, 'err_msg': 'Tham số không hợp lệ'}, status=400)
+
+    service = UptimeService()
+    if len(peer_ids) > 1:
+        data = {'start': start.isoformat(), 'end': end.isoformat(),
+                'uptime': service.get_uptime_map(peer_ids, start, end)}
+    else:
+        data = service.get_uptime(peer_ids[0], start, end, min_outage=min_outage)
+    return JsonResponse({'ok': True, 'data': data})
@@ -1,14 +1,10 @@
-from datetime import timedelta
-
 from django.contrib.auth.decorators import login_required
-from django.db.models import Q
 from django.http import HttpRequest, JsonResponse
-from django.utils import timezone
 from django.views.decorators.http import require_http_methods
 
 from apps.client_apis.common import request_debug_log
-from apps.db.models import Personal, Alias, HeartBeat, ClientTags, PeerInfo
-from apps.db.service import PersonalService, AliasService
+from apps.db.models import Personal, Alias, PeerInfo
+from apps.db.service import PersonalService, AliasService, PeerInfoService, TagService
 
 
 def is_default_personal(personal, user):
@@ -153,8 +149,8 @@ def personal_detail(request: HttpRequest) -> JsonResponse:
     personal_service = PersonalService()
     peers = personal_service.get_peers_by_personal(guid=guid)
 
-    # 在线判定：心跳表 5 分钟内有记录视为在线
-    online_threshold = timezone.now() - timedelta(minutes=5)
+    # 在线判定：5 分钟内有心跳（last_seen_at）视为在线
+    online_threshold = PeerInfoService.online_threshold()
 
     devices = []
     # 获取所有peer的ID列表
@@ -162,23 +158,17 @@ def personal_detail(request: HttpRequest) -> JsonResponse:
 
     # 使用AliasService批量获取别名映射
     alias_map = AliasService().get_alias_map(guid=guid, peer_ids=peer_ids)
-    
+    tags_map = TagService(guid=guid, user=request.user).get_tags_map(peer_ids)
+
     for peer_info in peers:
         peer = peer_info.peer
         # 检查在线状态
-        is_online = HeartBeat.objects.filter(
-            Q(peer_id=peer.peer_id) | Q(uuid=peer.uuid),
-            modified_at__gte=online_threshold
-        ).exists()
-
-        # 获取该设备在该地址簿中的标签
-        client_tags = ClientTags.objects.filter(peer_id=peer.peer_id, guid=guid).first()
-        tags = client_tags.tags if client_tags else ''
+        is_online = bool(peer.last_seen_at and peer.last_seen_at >= online_threshold)
 
         devices.append({
             'peer_id': peer.peer_id,
             'alias': alias_map.get(peer.peer_id, ''),  # 使用别名映射获取别名
-            'tags': tags,
+            'tags': tags_map.get(peer.peer_id, []),
             'device_name': peer.device_name,
             'os': peer.os,
             'version': peer.version,
@@ -330,12 +320,10 @@ def update_device_alias_in_personal(request: HttpRequest) -> JsonResponse:
         alias_text = peer_id
 
     # 更新别名
-    alias_obj = Alias.objects.filter(peer_id=peer, guid=personal).first()
-    if not alias_obj:
+    if not Alias.objects.filter(peer_id=peer, guid=personal).exists():
         return JsonResponse({'ok': False, 'err_msg': 'Thiết bị không có trong danh bạ này'}, status=404)
 
-    alias_obj.alias = alias_text
-    alias_obj.save(update_fields=['alias'])
+    AliasService().set_alias(peer_id=peer.peer_id, alias=alias_text, guid=personal.guid)
 
     return JsonResponse({'ok': True})
 
@@ -367,17 +355,8 @@ def update_device_tags_in_personal(request: HttpRequest) -> JsonResponse:
     if not peer:
         return JsonResponse({'ok': False, 'err_msg': 'Thiết bị không tồn tại'}, status=404)
 
-    # 更新标签（在ClientTags表中）
-    # 先删除该设备在该地址簿的所有标签
-    ClientTags.objects.filter(peer_id=peer_id, guid=guid).delete()
-
-    # 如果有新标签，则添加
-    if tags_text:
-        ClientTags.objects.create(
-            user=request.user,
-            peer_id=peer_id,
-            tags=tags_text,
-            guid=guid
-        )
+    # 覆盖该设备在该地址簿的标签，不存在的标签按名称创建
+    TagService(guid=guid, user=request.user).set_tags(
+        peer_id, TagService.split_tags(tags_text), create_missing=True)
 
     return JsonResponse({'ok': True})
\ No newline at end of file
@@ -0,0 +1,104 @@
+import json
+
+from django.contrib.auth.decorators import login_required
+from django.db import IntegrityError
+from django.http import HttpRequest, JsonResponse
+from django.views.decorators.http import require_http_methods
+
+from apps.client_apis.common import request_debug_log
+from apps.db.models import Strategy
+from apps.db.service import StrategyService
+
+
+@request_debug_log
+@require_http_methods(['GET'])
+@login_required(login_url='web_login')
+def strategy_list(request: HttpRequest) -> JsonResponse:
+    """
+    策略列表（仅限管理员）
+
+    :param request: GET 请求
+    :return: {"ok": true, "data": [{id, name, config_options, version, updated_at, assignments}]}
+    """
+    if not request.user.is_staff:
+        return JsonResponse({'ok': False, 'err_msg': 'Không có quyền'}, status=403)
+    return JsonResponse({'ok': True, 'data': StrategyService().get_list()})
+
+
+@request_debug_log
+@require_http_methods(['POST'])
+@login_required(login_url='web_login')
+def save_strategy(request: HttpRequest) -> JsonResponse:
+    """
+    创建或修改策略（仅限管理员）
+
+    :param request: POST，包含 name, config_options（JSON 对象字符串）, id（可选，修改时传）
+    :return: {"ok": true, "data": {"id": ..., "version": ...}}
+    """
+    if not request.user.is_staff:
+        return JsonResponse({'ok': False, 'err_msg': 'Không có quyền'}, status=403)
+    name = (request.POST.get('name') or '').strip()
+    strategy_id = (request.POST.get('id') or '').strip() or None
+    try:
+        config_options = json.loads(request.POST.get('config_options') or '{}')
+    except ValueError:
+        config_options = None
+    if not name or not isinstance(config_options, dict):
+        return JsonResponse({'ok': False, 'err_msg': 'Tham số không hợp lệ'}, status=400)
+    if strategy_id and not Strategy.objects.filter(id=strategy_id).exists():
+        return JsonResponse({'ok': False, 'err_msg': 'Chiến lược không tồn tại'}, status=404)
+    try:
+        strategy = StrategyService().save_strategy(name, config_options, strategy_id=strategy_id)
+    except IntegrityError:
+        return JsonResponse({'ok': False, 'err_msg': 'Tên chiến lược đã tồn tại'}, status=400)
+    return JsonResponse({'ok': True, 'data': {'id': strategy.id, 'version': strategy.version}})
+
+
+@request_debug_log
+@require_http_methods(['POST'])
+@login_required(login_url='web_login')
+def delete_strategy(request: HttpRequest) -> JsonResponse:
+    """
+    删除策略（仅限管理员），已分配的对象同时解除分配
+
+    :param request: POST，包含 id
+    :return: {"ok": true}
+    """
+    if not request.user.is_staff:
+        return JsonResponse({'ok': False, 'err_msg': 'Không có quyền'}, status=403)
+    strategy_id = (request.POST.get('id') or '').strip()
+    if not strategy_id:
+        return JsonResponse({'ok': False, 'err_msg': 'Tham số không hợp lệ'}, status=400)
+    if not StrategyService().delete_strategy(strategy_id):
+        return JsonResponse({'ok': False, 'err_msg': 'Chiến lược không tồn tại'}, status=404)
+    return JsonResponse({'ok': True})
+
+
+@request_debug_log
+@require_http_methods(['POST'])
+@login_required(login_url='web_login')
+def assign_strategy(request: HttpRequest) -> JsonResponse:
+    """
+    分配或解除策略（仅限管理员）
+
+    :param request: POST，包含：
+        - target_type: device / user / group
+        - target: 设备 peer_id / 用户名 / 组名
+        - id: 策略 ID（为空表示解除该对象的策略）
+    :return: {"ok": true}
+    """
+    if not request.user.is_staff:
+        return JsonResponse({'ok': False, 'err_msg': 'Không có quyền'}, status=403)
+    service = StrategyService()
+    target_type = (request.POST.get('target_type') or '').strip()
+    target = (request.POST.get('target') or '').strip()
+    strategy_id = (request.POST.get('id') or '').strip()
+    if target_type not in service.target_types or not target:
+        return JsonResponse({'ok': False, 'err_msg': 'Tham số không hợp lệ'}, status=400)
+    if not strategy_id:
+        service.unassign(target_type, target)
+        return JsonResponse({'ok': True})
+    if not Strategy.objects.filter(id=strategy_id).exists():
+        return JsonResponse({'ok': False, 'err_msg': 'Chiến lược không tồn tại'}, status=404)
+    service.assign(strategy_id, target_type, target)
+    return JsonResponse({'ok': True})
@@ -6,7 +6,7 @@ from django.http import HttpRequest, JsonResponse
 from django.views.decorators.http import require_http_methods
 
 from apps.client_apis.common import request_debug_log
-from apps.db.service import UserService
+from apps.db.service import TokenService, UserService
 
 
 @request_debug_log
@@ -81,6 +81,8 @@ def reset_user_password(request: HttpRequest) -> JsonResponse:
         return JsonResponse({'ok': False, 'err_msg': 'Người dùng không tồn tại'}, status=404)
     user.set_password(password1)
     user.save(update_fields=['password'])
+    # 重置密码后客户端令牌全部失效，需要重新登录
+    TokenService().delete_token_by_user(user)
     return JsonResponse({'ok': True})
 
 
@@ -105,6 +107,8 @@ def delete_user(request: HttpRequest) -> JsonResponse:
     user = User.objects.filter(username=username, is_active=True).first()
     if not user:
         return JsonResponse({'ok': False, 'err_msg': 'Người dùng không tồn tại hoặc đã bị xóa'}, status=404)
+    # 已删除用户的客户端令牌全部失效，客户端标记为登出
+    TokenService().revoke_sessions(usernames=[user.username])
     # 软删除：将is_active置为False
     user.is_active = False
     new_name = user.username
@@ -179,4 +183,28 @@ def create_user(request: HttpRequest) -> JsonResponse:
 
         return JsonResponse({'ok': True})
     except Exception as e:
-        return JsonResponse({'ok': False, 'err_msg': f'Tạo người dùng thất bại: {str(e)}'}, status=500)
\ No newline at end of file
+        return JsonResponse({'ok': False, 'err_msg': f'Tạo người dùng thất bại: {str(e)}'}, status=500)
+
+
+@request_debug_log
+@require_http_methods(['POST'])
+@login_required(login_url='web_login')
+def revoke_sessions(request: HttpRequest) -> JsonResponse:
+    """
+    批量吊销登录会话（仅限管理员）：删除令牌并将对应客户端置为登出，一个事务内完成
+
+    :param request: POST，包含（至少一项）：
+        - usernames: 用户名，逗号分隔
+        - group: 组名，吊销组内所有用户的会话
+        - uuids: 设备 UUID，逗号分隔
+    :return: {"ok": true, "data": {"users": ..., "tokens": ..., "logouts": ...}}
+    """
+    if not request.user.is_staff:
+        return JsonResponse({'ok': False, 'err_msg': 'Không có quyền'}, status=403)
+    usernames = [u.strip() for u in (request.POST.get('usernames') or '').split(',') if u.strip()]
+    group = (request.POST.get('group') or '').strip() or None
+    uuids = [u.strip() for u in (request.POST.get('uuids') or '').split(',') if u.strip()]
+    if not usernames and not group and not uuids:
+        return JsonResponse({'ok': False, 'err_msg': 'Tham số không hợp lệ'}, status=400)
+    result = TokenService().revoke_sessions(usernames=usernames, group=group, uuids=uuids)
+    return JsonResponse({'ok': True, 'data': result})
@@ -0,0 +1,88 @@
+import threading
+import time
+from collections import OrderedDict
+
+_MISSING = object()
+
+
+class LRUCache:
+    """
+    线程安全的进程内 LRU 缓存，支持可选的过期时间（TTL）。
+
+    仅在当前 worker 进程内有效，不同 worker 之间不共享。
+
+    :param int max_size: 最大条目数，超出后淘汰最久未使用的条目
+    :param float ttl: 默认过期秒数，``None`` 表示不过期
+    :param int max_bytes: 可选的总字节数上限（由 ``sizeof`` 计算），超出后淘汰最久未使用的条目
+    :param sizeof: 计算单个缓存值字节数的函数，设置 ``max_bytes`` 时必须提供
+    """
+
+    def __init__(self, max_size: int = 1024, ttl: float | None = None, max_bytes: int | None = None, sizeof=None):
+        self.max_size = max(max_size, 1)
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        self.sizeof = sizeof
+        self.bytes = 0
+        self._data: OrderedDict = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key, default=None):
+        """
+        读取缓存，命中时刷新其 LRU 位置。
+
+        :param key: 缓存键
+        :param default: 未命中或已过期时的返回值
+        :return: 缓存值或 ``default``
+        """
+        with self._lock:
+            item = self._data.get(key, _MISSING)
+            if item is _MISSING:
+                return default
+            value, expires_at, size = item
+            if expires_at is not None and expires_at <= time.monotonic():
+                del self._data[key]
+                self.bytes -= size
+                return default
+            self._data.move_to_end(key)
+            return value
+
+    def set(self, key, value, ttl: float | None = None):
+        """
+        写入缓存。
+
+        :param key: 缓存键
+        :param value: 缓存值
+        :param float ttl: 本条目的过期秒数，不传则使用默认值
+        """
+        ttl = self.ttl if ttl is None else ttl
+        expires_at = time.monotonic() + ttl if ttl is not None else None
+        size = self.sizeof(value) if self.max_bytes is not None else 0
+        with self._lock:
+            old = self._data.pop(key, None)
+            if old is not None:
+                self.bytes -= old[2]
+            # 单个值超过字节上限时不缓存
+            if self.max_bytes is not None and size > self.max_bytes:
+                return
+            self._data[key] = (value, expires_at, size)
+            self.bytes += size
+            while len(self._data) > self.max_size or (self.max_bytes is not None and self.bytes > self.max_bytes):
+                self.bytes -= self._data.popitem(last=False)[1][2]
+
+    def delete(self, *keys):
+        """
+        删除一个或多个缓存键（不存在时忽略）。
+        """
+        with self._lock:
+            for key in keys:
+                item = self._data.pop(key, None)
+                if item is not None:
+                    self.bytes -= item[2]
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+            self.bytes = 0
+
+    def __len__(self):
+        return len(self._data)
@@ -14,6 +14,86 @@ class PublicConfig:
     DEBUG = str2bool(get_env('DEBUG', False))
     APP_VERSION = get_env('APP_VERSION', '')
     SESSION_TIMEOUT = int(get_env('SESSION_TIMEOUT', 3600))
+    # 会话存储：db / cached_db / file / signed_cookies
+    SESSION_ENGINE = get_env('SESSION_ENGINE', 'db')
+    # 滑动过期：剩余有效期低于 SESSION_TIMEOUT 的该比例时才续期（写入会话），0 表示从不续期
+    SESSION_RENEW_RATIO = float(get_env('SESSION_RENEW_RATIO', 0.5))
+    # 高频客户端接口（heartbeat/sysinfo/audit/conn）跳过中间件链，直接分发到视图
+    CLIENT_FAST_PATH = str2bool(get_env('CLIENT_FAST_PATH', True))
+    # 客户端上报接口（heartbeat/sysinfo/audit/oidc auth-query）使用异步视图；使用 uvicorn worker 时默认开启
+    ASYNC_INGEST = str2bool(get_env('ASYNC_INGEST', 'uvicorn' in get_env('WORKER_CLASS', '').lower()))
+
+
+class HeartBeatConfig:
+    # 心跳写入模式：开启后心跳先写入进程内缓冲区，由后台线程批量落库
+    BUFFER_ENABLED = str2bool(get_env('HEARTBEAT_BUFFER', False))
+    # 批量落库间隔（毫秒）与触发立即落库的条目数
+    FLUSH_INTERVAL_MS = int(get_env('HEARTBEAT_FLUSH_INTERVAL_MS', 1000))
+    FLUSH_MAX_ENTRIES = int(get_env('HEARTBEAT_FLUSH_MAX_ENTRIES', 500))
+    # 缓冲区上限（按设备去重后的条目数），超出后丢弃新设备的心跳
+    BUFFER_MAX_SIZE = int(get_env('HEARTBEAT_BUFFER_MAX_SIZE', 20000))
+    # 设备身份缓存（uuid/peer_id -> 主键、版本）的条目上限（每个 worker）
+    IDENTITY_CACHE_SIZE = int(get_env('HEARTBEAT_IDENTITY_CACHE_SIZE', 50000))
+    # 同一设备在线时间（last_seen_at）的最短写入间隔（秒）
+    PRESENCE_INTERVAL = int(get_env('HEARTBEAT_PRESENCE_INTERVAL', 30))
+    # 负载感知心跳间隔：开启后按入库延迟与缓冲队列深度在 strategy 中下发建议间隔
+    ADAPTIVE_INTERVAL = str2bool(get_env('HEARTBEAT_ADAPTIVE_INTERVAL', False))
+    # 空闲时的建议间隔与上限（秒）
+    BASE_INTERVAL = int(get_env('HEARTBEAT_BASE_INTERVAL', 15))
+    MAX_INTERVAL = int(get_env('HEARTBEAT_MAX_INTERVAL', 120))
+    # 入库延迟目标（毫秒），超过即视为过载并按比例放大间隔
+    TARGET_LATENCY_MS = float(get_env('HEARTBEAT_TARGET_LATENCY_MS', 50))
+    # 按 peer_id 哈希的抖动比例（0.2 表示 ±20%），用于打散重连风暴
+    INTERVAL_JITTER = float(get_env('HEARTBEAT_INTERVAL_JITTER', 0.2))
+    # 在线历史位图（每设备每天 1440 位）：心跳按分钟置位，后台批量落库的间隔（毫秒）；
+    # 默认关闭，开启后才写入 peer_uptime 表
+    UPTIME_ENABLED = str2bool(get_env('HEARTBEAT_UPTIME', False))
+    UPTIME_FLUSH_INTERVAL_MS = int(get_env('HEARTBEAT_UPTIME_FLUSH_INTERVAL_MS', 60000))
+
+
+class TokenConfig:
+    # 签名密钥（必须单独设置，不使用公开的 Django SECRET_KEY）
+    SECRET = get_env('TOKEN_SECRET', '')
+    # 签名令牌：开启后新签发的令牌带 HMAC 签名，签名与吊销校验无需查询数据库（旧格式令牌仍然有效）；
+    # 未设置 TOKEN_SECRET 时不生效，仍签发普通令牌
+    SIGNED = str2bool(get_env('TOKEN_SIGNED', False)) and bool(SECRET)
+    # 签名令牌最长有效期（秒），期间同样受空闲超时约束
+    TTL = int(get_env('TOKEN_TTL', 30 * 24 * 3600))
+    # 令牌空闲超时（秒）：超过该时间未使用即失效（普通令牌与签名令牌相同）
+    IDLE_TIMEOUT = int(get_env('TOKEN_IDLE_TIMEOUT', 3600))
+    # 普通令牌校验结果的进程内缓存（LRU + TTL 秒）；注销/吊销通过共享计数器在约 1 秒内失效
+    CACHE_SIZE = int(get_env('TOKEN_CACHE_SIZE', 10000))
+    CACHE_TTL = int(get_env('TOKEN_CACHE_TTL', 60))
+    # last_used_at 的最短回写间隔（秒）：距上次记录不足该值时不写库
+    TOUCH_INTERVAL = int(get_env('TOKEN_TOUCH_INTERVAL', 300))
+    # last_used_at 在进程内攒批，按该间隔（毫秒）用一条 UPDATE 批量落库
+    TOUCH_FLUSH_INTERVAL_MS = int(get_env('TOKEN_TOUCH_FLUSH_INTERVAL_MS', 60000))
+    # 过期令牌清理：进程内定时清理的间隔（秒，0 表示关闭，可改用 sweep_tokens 命令）
+    SWEEP_INTERVAL = int(get_env('TOKEN_SWEEP_INTERVAL', 0))
+    # 每批删除条数与批间暂停（毫秒），避免长时间占用 SQLite 写锁
+    SWEEP_BATCH_SIZE = int(get_env('TOKEN_SWEEP_BATCH_SIZE', 500))
+    SWEEP_PAUSE_MS = int(get_env('TOKEN_SWEEP_PAUSE_MS', 100))
+
+
+if str2bool(get_env('TOKEN_SIGNED', False)) and not TokenConfig.SECRET:
+    logger.warning('TOKEN_SIGNED 已开启但未设置 TOKEN_SECRET，签名令牌不生效，改为签发普通令牌')
+
+
+class AddressBookConfig:
+    # 地址簿快照缓存（每个 worker）：按 guid 缓存 /api/ab/peers 的 JSON 与 gzip 压缩结果，
+    # 地址簿版本号变化即失效，按总字节数淘汰（MB，0 表示关闭）
+    SNAPSHOT_CACHE_MB = float(get_env('AB_SNAPSHOT_CACHE_MB', 64))
+
+
+class LoginConfig:
+    # 密码校验进程池：进程数（0 表示在请求线程内校验）与排队上限，排队已满时直接拒绝登录
+    VERIFY_WORKERS = int(get_env('LOGIN_VERIFY_WORKERS', 2))
+    VERIFY_QUEUE = int(get_env('LOGIN_VERIFY_QUEUE', 16))
+    # 登录限流（令牌桶，同一主机的 worker 共享）：按用户名、按 IP 的容量与每分钟补充数，0 表示不限流
+    USER_BURST = int(get_env('LOGIN_USER_BURST', 10))
+    USER_PER_MINUTE = float(get_env('LOGIN_USER_PER_MINUTE', 10))
+    IP_BURST = int(get_env('LOGIN_IP_BURST', 60))
+    IP_PER_MINUTE = float(get_env('LOGIN_IP_PER_MINUTE', 120))
 
 
 class GunicornConfig:
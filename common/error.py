@@ -17,3 +17,12 @@ class UserNotFoundError(BaseError):
 
     def __init__(self, username):
         super().__init__(f"用户不存在: {username}")
+
+
+class LoginThrottledError(BaseError):
+    """
+    登录请求过多（限流或密码校验队列已满）
+    """
+
+    def __init__(self, reason):
+        super().__init__(f"登录请求过多: {reason}")
@@ -0,0 +1,108 @@
+import logging
+import multiprocessing
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor, TimeoutError
+from concurrent.futures.process import BrokenProcessPool
+
+from common.env import LoginConfig
+from common.error import LoginThrottledError
+
+logger = logging.getLogger(__name__)
+
+
+def _init_worker():
+    # spawn 方式启动的子进程需要自行初始化 Django（fork 方式下为空操作）
+    os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'rustdesk_api.settings')
+    import django
+
+    django.setup()
+
+
+def _check_password(password, encoded) -> tuple[bool, bool]:
+    from django.contrib.auth.hashers import check_password, identify_hasher
+
+    if not check_password(password, encoded):
+        return False, False
+    try:
+        must_update = identify_hasher(encoded).must_update(encoded)
+    except ValueError:
+        must_update = False
+    return True, must_update
+
+
+class PasswordVerifier:
+    """
+    在独立进程池中校验密码哈希（PBKDF2 等），避免占用请求线程的 CPU 与 GIL。
+
+    排队中的校验数达到 ``max_pending`` 时直接抛出 ``LoginThrottledError``，不再排队消耗 CPU。
+    进程池按 pid 懒加载（gunicorn preload 后 fork 出的 worker 各自创建）。
+
+    :param int workers: 进程数，0 表示在当前线程内校验
+    :param int max_pending: 排队上限（含正在校验的请求）
+    :param float timeout: 单次等待结果的超时秒数
+    """
+
+    def __init__(self, workers=2, max_pending=16, timeout=10):
+        self.workers = workers
+        self.max_pending = max(max_pending, 1)
+        self.timeout = timeout
+        self._pending = 0
+        self._lock = threading.Lock()
+        self._executor: ProcessPoolExecutor | None = None
+        self._pid = None
+
+    @property
+    def executor(self) -> ProcessPoolExecutor:
+        if self._pid != os.getpid():
+            with self._lock:
+                if self._pid != os.getpid():
+                    # 请求线程所在进程是多线程的，fork 可能复制到被占用的锁，因此使用 spawn
+                    self._executor = ProcessPoolExecutor(
+                        max_workers=self.workers,
+                        mp_context=multiprocessing.get_context('spawn'),
+                        initializer=_init_worker,
+                    )
+                    self._pid = os.getpid()
+        return self._executor
+
+    def verify(self, password, encoded) -> tuple[bool, bool]:
+        """
+        校验明文密码与哈希是否匹配。
+
+        :param str password: 明文密码
+        :param str encoded: 数据库中的密码哈希
+        :return: ``(是否匹配, 是否需要按当前算法参数重新哈希)``
+        :rtype: tuple
+        :raises LoginThrottledError: 校验队列已满
+        """
+        if not password or not encoded:
+            return False, False
+        if self.workers <= 0:
+            return _check_password(password, encoded)
+        with self._lock:
+            if self._pending >= self.max_pending:
+                raise LoginThrottledError('password queue full')
+            self._pending += 1
+        try:
+            return self.executor.submit(_check_password, password, encoded).result(timeout=self.timeout)
+        except TimeoutError:
+            raise LoginThrottledError('password check timeout')
+        except BrokenProcessPool:
+            # 子进程异常退出：下次调用重建进程池，本次在当前线程内校验
+            logger.exception('password pool broken, falling back to inline check')
+            with self._lock:
+                self._pid = None
+            return _check_password(password, encoded)
+        finally:
+            with self._lock:
+                self._pending -= 1
+
+    def shutdown(self):
+        if self._executor is not None and self._pid == os.getpid():
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+            self._pid = None
+
+
+password_verifier = PasswordVerifier(workers=LoginConfig.VERIFY_WORKERS, max_pending=LoginConfig.VERIFY_QUEUE)
@@ -0,0 +1,66 @@
+import logging
+import sqlite3
+import time
+
+from common.env import LoginConfig
+from common.shared_store import SharedStore, shared_store
+
+logger = logging.getLogger(__name__)
+
+
+class TokenBucket:
+    """
+    基于 ``SharedStore`` 的令牌桶限流，同一主机的所有 worker 共享计数。
+
+    每个键最多积攒 ``burst`` 个令牌，每分钟补充 ``per_minute`` 个；每次请求消耗一个令牌，
+    令牌不足时拒绝。``burst`` 或 ``per_minute`` 为 0 表示不限流。
+
+    :param SharedStore store: 共享存储
+    :param str prefix: 键前缀
+    :param int burst: 桶容量
+    :param float per_minute: 每分钟补充的令牌数
+    """
+
+    def __init__(self, store: SharedStore, prefix: str, burst: int, per_minute: float):
+        self.store = store
+        self.prefix = prefix
+        self.burst = burst
+        self.rate = per_minute / 60
+
+    @property
+    def enabled(self) -> bool:
+        return self.burst > 0 and self.rate > 0
+
+    def allow(self, key) -> bool:
+        """
+        尝试消耗一个令牌。
+
+        :param key: 限流对象（用户名、IP 等）
+        :return: ``True`` 表示放行
+        :rtype: bool
+        """
+        if not self.enabled or not key:
+            return True
+        now = time.time()
+        allowed = False
+
+        def consume(state):
+            nonlocal allowed
+            tokens = self.burst
+            if state:
+                tokens = min(self.burst, state['tokens'] + (now - state['at']) * self.rate)
+            allowed = tokens >= 1
+            return {'tokens': tokens - 1 if allowed else tokens, 'at': now}
+
+        try:
+            # 桶装满所需时间之后记录即可丢弃
+            self.store.update(f'{self.prefix}:{key}', consume, ttl=self.burst / self.rate + 1)
+        except sqlite3.Error:
+            # 共享存储异常时不阻断登录
+            logger.exception(f'令牌桶读写失败: {self.prefix}:{key}')
+            return True
+        return allowed
+
+
+login_user_bucket = TokenBucket(shared_store, 'login:user', LoginConfig.USER_BURST, LoginConfig.USER_PER_MINUTE)
+login_ip_bucket = TokenBucket(shared_store, 'login:ip', LoginConfig.IP_BURST, LoginConfig.IP_PER_MINUTE)
@@ -0,0 +1,163 @@
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+
+from base import DATA_PATH
+
+logger = logging.getLogger(__name__)
+
+
+class SharedStore:
+    """
+    同一主机上多个 gunicorn worker 共享的键值存储。
+
+    基于标准库 sqlite3（WAL 模式）的本地文件，值以 JSON 保存，支持过期时间与原子读改写。
+    与业务数据库相互独立，只用于可丢失的运行时状态（连接表、待下发指令、计数器等）。
+
+    每个线程、每个进程各自持有一个连接（fork 之后自动重建）。
+
+    :param str path: 数据库文件路径
+    """
+
+    def __init__(self, path):
+        self.path = str(path)
+        self._local = threading.local()
+        self._last_purge = 0.0
+
+    @property
+    def conn(self) -> sqlite3.Connection:
+        conn = getattr(self._local, 'conn', None)
+        if conn is not None and self._local.pid == os.getpid():
+            return conn
+        conn = sqlite3.connect(self.path, timeout=5, isolation_level=None, check_same_thread=False)
+        conn.execute('PRAGMA journal_mode=WAL')
+        conn.execute('PRAGMA synchronous=NORMAL')
+        conn.execute(
+            'CREATE TABLE IF NOT EXISTS kv ('
+            'key TEXT PRIMARY KEY, value TEXT NOT NULL, expires_at REAL)'
+        )
+        self._local.conn = conn
+        self._local.pid = os.getpid()
+        return conn
+
+    @staticmethod
+    def _expires_at(ttl: float | None) -> float | None:
+        return time.time() + ttl if ttl is not None else None
+
+    def get(self, key, default=None):
+        """
+        读取键值。
+
+        :param str key: 键
+        :param default: 不存在或已过期时的返回值
+        :return: 值或 ``default``
+        """
+        return self.get_many(key).get(key, default)
+
+    def get_many(self, *keys) -> dict:
+        """
+        一次读取多个键（单条 SQL）。
+
+        :return: ``{键: 值}``，不存在或已过期的键不出现
+        :rtype: dict
+        """
+        if not keys:
+            return {}
+        rows = self.conn.execute(
+            f'SELECT key, value FROM kv WHERE key IN ({",".join("?" * len(keys))}) '
+            'AND (expires_at IS NULL OR expires_at > ?)',
+            (*keys, time.time()),
+        ).fetchall()
+        return {key: json.loads(value) for key, value in rows}
+
+    def set(self, key, value, ttl: float | None = None):
+        """
+        写入键值。
+
+        :param str key: 键
+        :param value: 可 JSON 序列化的值
+        :param float ttl: 过期秒数，``None`` 表示不过期
+        """
+        self.conn.execute(
+            'INSERT INTO kv (key, value, expires_at) VALUES (?, ?, ?) '
+            'ON CONFLICT(key) DO UPDATE SET value = excluded.value, expires_at = excluded.expires_at',
+            (key, json.dumps(value), self._expires_at(ttl)),
+        )
+        self._maybe_purge()
+
+    def delete(self, *keys):
+        """
+        删除一个或多个键（不存在时忽略）。
+        """
+        if keys:
+            self.conn.execute(f'DELETE FROM kv WHERE key IN ({",".join("?" * len(keys))})', keys)
+
+    def pop(self, key, default=None):
+        """
+        原子地读取并删除键。
+
+        :return: 删除前的值或 ``default``
+        """
+        return self.update(key, lambda value: None, default=default)[0]
+
+    def update(self, key, func, ttl: float | None = None, default=None) -> tuple:
+        """
+        原子读改写：在写事务内读取旧值，写入 ``func(旧值)``。
+
+        ``func`` 返回 ``None`` 时删除该键。
+
+        :param str key: 键
+        :param func: 计算新值的函数，参数为旧值（不存在时为 ``default``）
+        :param float ttl: 新值的过期秒数
+        :param default: 键不存在时传给 ``func`` 的值
+        :return: ``(旧值, 新值)``
+        :rtype: tuple
+        """
+        conn = self.conn
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            row = conn.execute(
+                'SELECT value FROM kv WHERE key = ? AND (expires_at IS NULL OR expires_at > ?)',
+                (key, time.time()),
+            ).fetchone()
+            old = json.loads(row[0]) if row else default
+            new = func(old)
+            if new is None:
+                conn.execute('DELETE FROM kv WHERE key = ?', (key,))
+            else:
+                conn.execute(
+                    'INSERT INTO kv (key, value, expires_at) VALUES (?, ?, ?) '
+                    'ON CONFLICT(key) DO UPDATE SET value = excluded.value, expires_at = excluded.expires_at',
+                    (key, json.dumps(new), self._expires_at(ttl)),
+                )
+            conn.execute('COMMIT')
+        except BaseException:
+            conn.execute('ROLLBACK')
+            raise
+        return old, new
+
+    def incr(self, key, delta=1, ttl: float | None = None) -> int:
+        """
+        原子自增（键不存在时从 0 开始）。
+
+        :return: 自增后的值
+        :rtype: int
+        """
+        return self.update(key, lambda value: value + delta, ttl=ttl, default=0)[1]
+
+    def _maybe_purge(self, interval=60):
+        # 顺带清理过期键，最多每 interval 秒一次
+        now = time.time()
+        if now - self._last_purge < interval:
+            return
+        self._last_purge = now
+        try:
+            self.conn.execute('DELETE FROM kv WHERE expires_at IS NOT NULL AND expires_at <= ?', (now,))
+        except sqlite3.OperationalError:
+            logger.debug('shared store purge skipped', exc_info=True)
+
+
+shared_store = SharedStore(DATA_PATH / 'shared_store.sqlite3')
@@ -1,6 +1,6 @@
 import random
 import time
-from hashlib import md5
+from hashlib import md5, sha256
 from uuid import uuid1, uuid4
 
 from django.utils import timezone
@@ -39,6 +39,16 @@ def get_md5(data: str):
     return md5(data.encode('utf-8')).hexdigest()
 
 
+def get_sha256(data: str):
+    """
+    获取字符串的 sha256 摘要（十六进制）
+
+    :param data: 原始字符串
+    :return: 64 位十六进制摘要
+    """
+    return sha256(data.encode('utf-8')).hexdigest()
+
+
 def get_randem_md5():
     """
     获取一个随机的MD5
@@ -14,6 +14,13 @@ workers = GunicornConfig.workers
 threads = GunicornConfig.threads
 
 # 使用 gthread 以启用线程；如需纯同步可改为 "sync"
+#
+# ASGI 模式（大量空闲长连接客户端时推荐）：
+#   pip install uvicorn-worker
+#   WORKER_CLASS=uvicorn_worker.UvicornWorker gunicorn rustdesk_api.asgi:application -c gunicorn.conf.py
+# （旧版 uvicorn 可使用 uvicorn.workers.UvicornWorker）。此时 THREADS 不再生效，每个连接只占用一个协程，
+# 并发上限不再是 WORKERS x THREADS；ASYNC_INGEST 自动开启，heartbeat/sysinfo/audit/oidc auth-query
+# 使用异步视图。start.sh 会根据 WORKER_CLASS 自动选择 wsgi/asgi 入口。
 worker_class = GunicornConfig.worker_class
 
 # 性能与稳定性相关
@@ -136,3 +143,30 @@ def post_fork(server, worker):
     :return: None
     """
     worker.log.info(f"[gunicorn] worker spawned (pid={worker.pid})")
+    try:
+        # 过期令牌定时清理（TOKEN_SWEEP_INTERVAL > 0 时启用，多个 worker 之间每个周期只执行一次）
+        from apps.db.sweeper import token_sweeper
+
+        token_sweeper.start()
+    except Exception as e:
+        worker.log.error(f"[gunicorn] start token sweeper failed (pid={worker.pid}): {e}")
+
+
+def worker_exit(server, worker):
+    """
+    子进程退出时回调，将进程内写缓冲（如心跳缓冲）中尚未落库的数据写入数据库。
+
+    :param server: Gunicorn Server 实例
+    :param worker: 当前 worker 实例
+    :return: None
+    """
+    try:
+        from apps.db.buffer import flush_all
+        from apps.db.sweeper import token_sweeper
+        from common.password_pool import password_verifier
+
+        token_sweeper.stop()
+        flush_all()
+        password_verifier.shutdown()
+    except Exception as e:
+        worker.log.error(f"[gunicorn] flush buffers on exit failed (pid={worker.pid}): {e}")
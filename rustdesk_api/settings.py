@@ -156,8 +156,17 @@ SECURE_PROXY_SSL_HEADER = ('HTTP_X_FORWARDED_PROTO', 'https')
 # session设置
 # 会话有效期（秒
 SESSION_COOKIE_AGE = PublicConfig.SESSION_TIMEOUT  # session失效时间
-# 每次请求都保存 session（滑动过期）
-SESSION_SAVE_EVERY_REQUEST = True
+# 会话存储后端，cached_db 使用 CACHES 配置的缓存（默认进程内）并回写数据库
+SESSION_ENGINE = {
+    'db': 'django.contrib.sessions.backends.db',
+    'cached_db': 'django.contrib.sessions.backends.cached_db',
+    'file': 'django.contrib.sessions.backends.file',
+    'signed_cookies': 'django.contrib.sessions.backends.signed_cookies',
+}.get(PublicConfig.SESSION_ENGINE, PublicConfig.SESSION_ENGINE)
+# 不再每次请求都保存 session；滑动过期由 OptOutSessionMiddleware 按剩余有效期续期
+SESSION_SAVE_EVERY_REQUEST = False
+# 剩余有效期低于 SESSION_COOKIE_AGE 的该比例时续期
+SESSION_RENEW_RATIO = PublicConfig.SESSION_RENEW_RATIO
 # 浏览器关闭即失效，True 表示不设置持久化过期时间，让浏览器会话结束即删除
 SESSION_EXPIRE_AT_BROWSER_CLOSE = False
 
@@ -11,6 +11,14 @@ import os
 
 from django.core.wsgi import get_wsgi_application
 
+from common.env import PublicConfig
+
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'rustdesk_api.settings')
 
-application = get_wsgi_application()
+if PublicConfig.CLIENT_FAST_PATH:
+    # heartbeat/sysinfo/audit/conn 走精简分发路径，其余请求走完整中间件链
+    from apps.common.wsgi import get_fast_path_wsgi_application
+
+    application = get_fast_path_wsgi_application()
+else:
+    application = get_wsgi_application()
@@ -9,4 +9,10 @@ mkdir -p ./logs ./data
 python manage.py migrate
 python manage.py collectstatic --noinput
 
-exec gunicorn rustdesk_api.wsgi:application -c gunicorn.conf.py 
+# WORKER_CLASS 为 uvicorn worker 时使用 ASGI 入口
+APP="rustdesk_api.wsgi:application"
+if [[ "${WORKER_CLASS:-}" == *uvicorn* ]]; then
+  APP="rustdesk_api.asgi:application"
+fi
+
+exec gunicorn "$APP" -c gunicorn.conf.py
@@ -186,6 +186,14 @@
             }
         }, false);
 
+        // nav-2 详情：断开设备连接
+        contentEl.addEventListener('click', function (e) {
+            const btn = e.target.closest('.nav2-disconnect-btn');
+            if (!btn) return;
+            e.preventDefault();
+            getNav2().disconnectDevice(btn.getAttribute('data-peer'));
+        }, false);
+
         // nav-2 详情/行内编辑（进入编辑态）
         contentEl.addEventListener('click', function (e) {
             const {startInlineEdit} = getNav2();
@@ -179,7 +179,7 @@
         const params = {};
         if (!formEl) return params;
         const formData = new FormData(formEl);
-        ['q', 'os', 'status', 'page_size'].forEach((k) => {
+        ['q', 'os', 'status', 'sort', 'page_size'].forEach((k) => {
             const v = formData.get(k);
             if (v !== null && String(v).trim() !== '') {
                 params[k] = String(v).trim();
@@ -217,6 +217,7 @@
     function renderDetailHTML(detail) {
         const {ICONS} = getConstants();
         const tags = Array.isArray(detail.tags) ? detail.tags.join(', ') : (detail.tags || '');
+        const conns = Array.isArray(detail.conns) ? detail.conns : [];
         return (
             '<dl style="margin:0;">' +
             '<div style="display:flex;gap:8px;margin:6px 0;align-items:center;"><dt style="min-width:88px;color:#6a737d;">ID thiết bị</dt><dd style="margin:0;flex:1;">' + (detail.peer_id || '-') + '</dd></div>' +
@@ -239,6 +240,12 @@
             '</dd>' +
             '</div>' +
             '<div style="display:flex;gap:8px;margin:6px 0;align-items:center;"><dt style="min-width:88px;color:#6a737d;">Nền tảng</dt><dd style="margin:0;flex:1;">' + (detail.platform || '-') + '</dd></div>' +
+            '<div style="display:flex;gap:8px;margin:6px 0;align-items:center;"><dt style="min-width:88px;color:#6a737d;">Kết nối</dt>' +
+            '<dd style="margin:0;flex:1;">' + (conns.length ? conns.join(', ') : '-') +
+            (detail.can_disconnect && conns.length
+                ? ' <button type="button" class="nav2-link nav2-disconnect-btn" data-peer="' + (detail.peer_id || '') + '">Ngắt kết nối</button>'
+                : '') +
+            '</dd></div>' +
             '</dl>'
         );
     }
@@ -400,6 +407,38 @@
             '</button>';
     }
 
+    /**
+     * 断开设备全部活动连接（下一次心跳时下发）
+     *
+     * :param {string} peerId: 设备ID
+     * :returns: 无
+     * :rtype: void
+     */
+    function disconnectDevice(peerId) {
+        const {showToast, parseFetchError, getCookie} = getUtils();
+        const {URLS} = getConstants();
+        const body = new URLSearchParams();
+        body.set('peer_id', peerId);
+        fetch(URLS.DEVICE_DISCONNECT, {
+            method: 'POST',
+            credentials: 'same-origin',
+            headers: {
+                'X-Requested-With': 'XMLHttpRequest',
+                'Content-Type': 'application/x-www-form-urlencoded;charset=UTF-8',
+                'X-CSRFToken': getCookie('csrftoken')
+            },
+            body: body.toString()
+        }).then(resp => {
+            if (!resp.ok) return parseFetchError(resp);
+            return resp.json();
+        }).then(data => {
+            if (!data || data.ok !== true) throw new Error((data && (data.err_msg || data.error)) || 'Ngắt kết nối thất bại');
+            showToast('Đã gửi lệnh ngắt kết nối, thiết bị sẽ thực hiện ở lần heartbeat kế tiếp', 'success');
+        }).catch(err => {
+            showToast(err.message || 'Ngắt kết nối thất bại, vui lòng thử lại sau', 'error');
+        });
+    }
+
     // 导出到全局
     APP.nav2 = {
         toggleAutoRefresh,
@@ -408,7 +447,8 @@
         fetchAndShowDetail,
         startInlineEdit,
         submitInlineEdit,
-        cancelInlineEdit
+        cancelInlineEdit,
+        disconnectDevice
     };
 
     window.APP = APP;